@@ -1,14 +1,188 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
+from urllib.parse import urlencode
+import contextvars
 import ee
+import change_detection
+import gee_scheduler
 import gee_service
+import grid_service
+import json
+import layer_export
+import local_engine
+import metrics
 import os
+import prefetch
+import threading
+import time
+from gee_scheduler import GeeUnavailable
+from jobs import JobManager, JobQueueFull
+from tile_store import TileStore
 
 app = Flask(__name__, static_folder='../frontend', static_url_path='/')
 CORS(app)
 
-# Initialize Earth Engine
-gee_service.initialize_gee()
+# Tile proxy: upstream tiles are fetched on the shared GEE pool and kept in a local MBTiles-style store.
+# TILE_UPSTREAM can be swapped (e.g. in tests) for any callable
+# (coords, date_start, date_end, indicator, z, x, y) -> bytes.
+app.config.setdefault('TILE_UPSTREAM', gee_service.fetch_indicator_tile)
+app.config.setdefault('TILE_STORE_PATH', os.environ.get(
+    'GAIAEYE_TILE_STORE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tiles.mbtiles')
+))
+app.config.setdefault('TILE_FETCH_TIMEOUT_SECONDS', 60)
+app.config.setdefault('TILE_MAX_AGE_SECONDS', 3600)
+# A stored tile is served for as long as the map ID it was fetched with stays in LAYER_CACHE,
+# and never for less time than browsers are told to cache it
+app.config.setdefault('TILE_STORE_TTL_SECONDS', max(
+    app.config['TILE_MAX_AGE_SECONDS'],
+    gee_service.MAP_ID_LIFETIME_SECONDS - gee_service.MAP_ID_SAFETY_MARGIN_SECONDS
+))
+
+tile_store = TileStore(app.config['TILE_STORE_PATH'], ttl_seconds=app.config['TILE_STORE_TTL_SECONDS'])
+
+# Asynchronous job API: worker pool size and how many jobs may wait before submits get a 429
+app.config.setdefault('JOB_WORKERS', int(os.environ.get('GAIAEYE_JOB_WORKERS', 4)))
+app.config.setdefault('JOB_MAX_QUEUE', int(os.environ.get('GAIAEYE_JOB_MAX_QUEUE', 64)))
+app.config.setdefault('JOB_RESULT_TTL_SECONDS', 3600)
+
+job_manager = JobManager(
+    workers=app.config['JOB_WORKERS'],
+    max_queue=app.config['JOB_MAX_QUEUE'],
+    result_ttl_seconds=app.config['JOB_RESULT_TTL_SECONDS']
+)
+
+# Earth Engine initialization: 'background' (default; starts now without blocking the
+# import), 'lazy' (on the first request or readiness probe) or 'eager' (blocks the
+# import, and may prompt for ee.Authenticate(), as before). Requests that need EE
+# wait up to GEE_READY_WAIT_SECONDS for it, then get a 503.
+app.config.setdefault('GEE_INIT_MODE', os.environ.get('GAIAEYE_GEE_INIT', 'background'))
+app.config.setdefault('GEE_READY_WAIT_SECONDS', 30)
+
+# Optional cache warmup once EE is ready, from a JSON file:
+# {"rois": [{"north": .., "south": .., "east": .., "west": .., "date_start": .., "date_end": ..}],
+#  "indicators": ["NDVI", "LST"], "dashboard": true, "crop_type": "wheat"}
+app.config.setdefault('WARMUP_FILE', os.environ.get('GAIAEYE_WARMUP_FILE'))
+
+# Speculative prefetch: /api/analyze requests with "prefetch": true also queue the
+# sibling indicators and the previous window in the background (see
+# prefetch.prefetch_layers). PREFETCH_ENABLED turns it off server-wide.
+app.config.setdefault('PREFETCH_ENABLED', os.environ.get('GAIAEYE_PREFETCH', '1') != '0')
+
+# Endpoints served without Earth Engine
+EE_FREE_ENDPOINTS = {'home', 'static', 'readiness', 'prometheus_metrics', 'cache_stats',
+                     'job_stats', 'job_status', 'job_result'}
+
+def run_cache_warmup():
+    path = app.config['WARMUP_FILE']
+    if not path:
+        return
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read warmup file {path}: {e}")
+        return
+    gee_service.warm_caches(
+        config.get('rois', []),
+        config.get('indicators', ['NDVI']),
+        config.get('dashboard', True),
+        config.get('crop_type', 'wheat')
+    )
+
+gee_service.on_gee_ready(run_cache_warmup)
+if app.config['GEE_INIT_MODE'] == 'eager':
+    gee_service.start_gee_initialization(allow_authenticate=True)
+    if not gee_service.wait_for_gee():
+        raise RuntimeError(gee_service.gee_status()['error'])
+elif app.config['GEE_INIT_MODE'] == 'background':
+    gee_service.start_gee_initialization()
+
+# --- METRICS AND PER-REQUEST TIMING ---
+# Every response carries a Server-Timing header; ?timing=1 (or "timing": true in
+# the JSON body) also adds the breakdown to JSON responses as "timing".
+
+def cache_hit_ratios():
+    dashboard = gee_service.DASHBOARD_STORE.stats()
+    dashboard_lookups = dashboard['hits'] + dashboard['stale_hits'] + dashboard['misses']
+    return {
+        ('layer',): gee_service.LAYER_CACHE.stats()['hit_ratio'],
+        ('dashboard',): (dashboard['hits'] + dashboard['stale_hits']) / dashboard_lookups if dashboard_lookups else 0.0,
+        ('tile',): tile_store.stats()['hit_ratio']
+    }
+
+metrics.register(metrics.Gauge(
+    'gaiaeye_cache_hit_ratio', 'Hit ratio of the layer, dashboard and tile caches', ('cache',), cache_hit_ratios
+))
+metrics.register(metrics.Gauge(
+    'gaiaeye_jobs_queued', 'Jobs waiting for a worker', (), lambda: {(): job_manager.stats()['queued']}
+))
+
+def timing_requested(response):
+    if request.args.get('timing', '').lower() in ('1', 'true'):
+        return True
+    if response.is_streamed or not request.is_json:
+        return False
+    body = request.get_json(silent=True)
+    return isinstance(body, dict) and body.get('timing') is True
+
+# Priority lane of each endpoint's GEE calls (gee_scheduler); other endpoints use
+# 'dashboard', and jobs run in the scheduler's default 'batch' lane
+REQUEST_LANES = {
+    'tile': 'interactive',
+    'analyze': 'interactive',
+    'export_layer': 'batch',
+    'fields_batch': 'batch',
+    'fields_stream': 'batch'
+}
+
+@app.before_request
+def start_request_trace():
+    g.request_started = time.perf_counter()
+    g.trace = metrics.start_trace()
+    gee_scheduler.set_lane(REQUEST_LANES.get(request.endpoint, 'dashboard'))
+
+@app.before_request
+def require_earth_engine():
+    if request.endpoint is None or request.endpoint in EE_FREE_ENDPOINTS:
+        return None
+    if gee_service.wait_for_gee(app.config['GEE_READY_WAIT_SECONDS']):
+        return None
+    status = gee_service.gee_status()
+    message = f"Earth Engine is not ready ({status['state']})"
+    if status['error']:
+        message += f": {status['error']}"
+    return jsonify({"error": message, "success": False}), 503, {'Retry-After': '5'}
+
+def gee_unavailable_response(e):
+    """503 + Retry-After when Earth Engine quota/availability errors outlasted the scheduler's retries"""
+    print(f"Earth Engine unavailable: {e}")
+    return (jsonify({"error": str(e), "success": False}), 503,
+            {'Retry-After': str(GeeUnavailable.retry_after_seconds)})
+
+@app.after_request
+def record_request_metrics(response):
+    trace = g.get('trace')
+    if trace is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - g.request_started, route=route, method=request.method, status=response.status_code
+    )
+    metrics.GEE_CALLS_PER_REQUEST.observe(trace.gee_calls, route=route)
+    if response.status_code >= 500:
+        metrics.HTTP_ERRORS.inc(route=route)
+
+    response.headers['Server-Timing'] = trace.server_timing()
+    if response.is_json and timing_requested(response):
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body['timing'] = trace.summary()
+            response.set_data(app.json.dumps(body))
+    return response
+
+@app.teardown_request
+def end_request_trace(error=None):
+    metrics.end_trace()
 
 @app.route('/')
 def home():
@@ -22,42 +196,318 @@ def analyze():
     {
         "north": float, "south": float, "east": float, "west": float,
         "date_start": "YYYY-MM-DD", "date_end": "YYYY-MM-DD",
-        "indicator": "NDVI" | "EVI" | "SAVI" | "NDWI" | "MNDWI" | "NDBI" | "LST" | "RAIN" | "SAR" | "ELEVATION" | "SLOPE"
+        "indicator": "NDVI" | "EVI" | "SAVI" | "NDWI" | "MNDWI" | "NDBI" | "LST" | "RAIN" | "SAR" | "ELEVATION" | "SLOPE",
+        "indicators": ["NDVI", "LST", ...] (optional, returns one tile URL per indicator),
+        "backend": "gee" | "local" (optional, "local" computes from the local S2 archive, see below),
+        "prefetch": bool (optional, warm the other indicators and the previous window in the background),
+        "compare_to": "previous" | "last_year" | {"date_start", "date_end"} (optional, single indicator:
+                      "tile_url" is then the delta layer, next to "vis", "before", "after" and "delta"
+                      statistics; see change_detection.compute_indicator_change)
+    }
+    With "backend": "local" there is no tile server, so the response carries no
+    "tile_url" / "layers" but statistics per indicator instead (422 when the archive
+    has no site or scene for the request):
+    {
+        "success": true, "backend": "local", "coords": {...}, "dates": {"start", "end"},
+        "stats": {"NDVI": {"mean": float | null, "min": float | null, "max": float | null, "pixels": int}, ...}
     }
     """
     try:
-        data = request.json
+        body, status = analyze_result(request.json, request.host_url, client=request.remote_addr)
+        return jsonify(body), status
+
+    except GeeUnavailable as e:
+        return gee_unavailable_response(e)
+
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
+def analyze_result(data, host_url, client=None):
+    """
+    Build the /api/analyze response body and status (shared with the job API).
+    client: address the speculative prefetch is accounted to (None: never prefetch)
+    """
+    # Validation
+    required_fields = ['north', 'south', 'east', 'west']
+    if not all(field in data for field in required_fields):
+        return {"error": "Missing coordinates. Requires north, south, east, west."}, 400
         
-        # Validation
+    coords = {
+        'north': data['north'],
+        'south': data['south'],
+        'east': data['east'],
+        'west': data['west']
+    }
+    
+    date_start = data.get('date_start')
+    date_end = data.get('date_end')
+    indicator = data.get('indicator', 'NDVI') # Default to NDVI
+    indicators = data.get('indicators')
+    backend = data.get('backend', 'gee')
+
+    if backend not in gee_service.COMPUTE_BACKENDS:
+        return {"error": f"backend must be one of {list(gee_service.COMPUTE_BACKENDS)}"}, 400
+    if indicators is not None and not isinstance(indicators, list):
+        return {"error": "indicators must be a list"}, 400
+    try:
+        for ind in indicators or [indicator]:
+            gee_service.indicator_key(ind)
+    except ValueError as e:
+        return {"error": str(e), "success": False}, 400
+
+    if backend == 'local':
+        # The local engine has no tile server: answer with indicator statistics instead
+        try:
+            stats = {
+                ind.upper(): gee_service.get_local_indicator_stats(coords, date_start, date_end, ind)
+                for ind in (indicators or [indicator])
+            }
+        except local_engine.LocalArchiveError as e:
+            return {"error": str(e), "success": False}, 422
+        return {
+            "success": True,
+            "backend": "local",
+            "stats": stats,
+            "coords": coords,
+            "dates": {"start": date_start, "end": date_end}
+        }, 200
+
+    compare_to = data.get('compare_to')
+    if compare_to is not None:
+        if indicators:
+            return {"error": "compare_to works with a single indicator"}, 400
+        try:
+            change = change_detection.get_indicator_change(coords, date_start, date_end, compare_to, indicator)
+        except ValueError as e:
+            return {"error": str(e), "success": False}, 400
+        return {
+            "success": True,
+            **change,
+            "coords": coords,
+            "indicator": indicator,
+            "dates": {"start": date_start, "end": date_end}
+        }, 200
+
+    if indicators:
+        tile_urls, errors = gee_service.get_indicator_layers(coords, date_start, date_end, indicators)
+        if not tile_urls:
+            return {"error": "; ".join(f"{k}: {v}" for k, v in errors.items()), "errors": errors, "success": False}, 500
+        schedule_prefetch(data, client, coords, date_start, date_end, list(tile_urls))
+
+        return {
+            "success": True,
+            "tile_urls": tile_urls,
+            "proxy_tile_urls": {ind: proxy_tile_url(host_url, ind, coords, date_start, date_end) for ind in tile_urls},
+            "errors": errors,
+            "coords": coords,
+            "indicators": indicators,
+            "dates": {"start": date_start, "end": date_end}
+        }, 200
+
+    with gee_service.composite_scope():
+        tile_url = gee_service.get_indicator_layer(coords, date_start, date_end, indicator)
+    schedule_prefetch(data, client, coords, date_start, date_end, [indicator])
+    
+    return {
+        "success": True,
+        "tile_url": tile_url,
+        "proxy_tile_url": proxy_tile_url(host_url, indicator, coords, date_start, date_end),
+        "coords": coords,
+        "indicator": indicator,
+        "dates": {"start": date_start, "end": date_end}
+    }, 200
+
+def schedule_prefetch(data, client, coords, date_start, date_end, indicators):
+    """Queue the speculative layers after a successful GEE analyze, when asked for"""
+    if client is None or not data.get('prefetch') or not app.config['PREFETCH_ENABLED']:
+        return
+    try:
+        prefetch.prefetch_layers(client, coords, date_start, date_end, indicators)
+    except Exception as e:
+        # Speculative work never fails the request it follows
+        print(f"Prefetch scheduling failed: {e}")
+
+@app.route('/api/export', methods=['POST'])
+def export_layer():
+    """
+    Indicator raster as a GeoTIFF download (raw values, float32, EPSG:4326, nodata -9999).
+    Expected JSON: same as /api/analyze (single "indicator"), plus
+        "scale": float (optional, pixel size in meters; default: native resolution of the source)
+    The file is streamed as its pixel blocks arrive, so it has no Content-Length.
+    """
+    try:
+        data = request.json
         required_fields = ['north', 'south', 'east', 'west']
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing coordinates. Requires north, south, east, west."}), 400
-            
-        coords = {
-            'north': data['north'],
-            'south': data['south'],
-            'east': data['east'],
-            'west': data['west']
-        }
-        
+
+        coords = {field: float(data[field]) for field in required_fields}
         date_start = data.get('date_start')
         date_end = data.get('date_end')
-        indicator = data.get('indicator', 'NDVI') # Default to NDVI
+        indicator = data.get('indicator', 'NDVI').upper()
+        try:
+            grid = layer_export.export_grid(coords, indicator, data.get('scale'))
+        except ValueError as e:
+            return jsonify({"error": str(e), "success": False}), 400
+        pixels = grid['width'] * grid['height']
+        if pixels > layer_export.EXPORT_MAX_PIXELS:
+            return jsonify({
+                "error": f"Export of {pixels} pixels exceeds the limit of {layer_export.EXPORT_MAX_PIXELS}; "
+                         f"request a larger scale (currently {grid['scale']:g} m)",
+                "success": False
+            }), 400
 
-        tile_url = gee_service.get_indicator_layer(coords, date_start, date_end, indicator)
-        
-        return jsonify({
-            "success": True,
-            "tile_url": tile_url,
-            "coords": coords,
-            "indicator": indicator,
-            "dates": {"start": date_start, "end": date_end}
-        })
+        chunks = layer_export.stream_indicator_geotiff(coords, date_start, date_end, indicator, grid)
+        # Waits for the first block, so EE errors still get a JSON answer
+        header = next(chunks)
+
+        def generate():
+            yield header
+            try:
+                yield from chunks
+            except Exception as e:
+                # Headers are gone: abort the transfer so the client sees a broken download
+                print(f"Export of {indicator} failed mid-stream: {e}")
+                raise
+
+        filename = f"{indicator.lower()}_{date_start}_{date_end}.tif" if date_start and date_end else f"{indicator.lower()}.tif"
+        return Response(stream_with_context(generate()), mimetype='image/tiff',
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    except GeeUnavailable as e:
+        return gee_unavailable_response(e)
 
     except Exception as e:
-        print(f"Error processing request: {e}")
+        print(f"Error exporting layer: {e}")
         return jsonify({"error": str(e), "success": False}), 500
 
+@app.route('/tiles/<indicator>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def tile(indicator, z, x, y):
+    """
+    Proxied indicator tile.
+    Query string: north, south, east, west, date_start, date_end (same as /api/analyze).
+    """
+    try:
+        args = request.args
+        required_fields = ['north', 'south', 'east', 'west']
+        if not all(field in args for field in required_fields):
+            return jsonify({"error": "Missing coordinates. Requires north, south, east, west."}), 400
+
+        coords = {field: float(args[field]) for field in required_fields}
+        date_start = args.get('date_start')
+        date_end = args.get('date_end')
+        try:
+            indicator = gee_service.indicator_key(indicator)
+        except ValueError as e:
+            return jsonify({"error": str(e), "success": False}), 400
+        layer = gee_service.layer_id(coords, date_start, date_end, indicator)
+
+        cached = tile_store.get(layer, z, x, y)
+        if cached is None:
+            tile_data, etag = fetch_tile_once(layer, coords, date_start, date_end, indicator, z, x, y)
+        else:
+            tile_data, etag = cached
+
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f"public, max-age={app.config['TILE_MAX_AGE_SECONDS']}"
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        return Response(tile_data, mimetype='image/png', headers=headers)
+
+    except GeeUnavailable as e:
+        return gee_unavailable_response(e)
+
+    except Exception as e:
+        print(f"Error fetching tile {indicator}/{z}/{x}/{y}: {e}")
+        return jsonify({"error": str(e), "success": False}), 502
+
+# --- TILE FETCHES IN FLIGHT ---
+# Concurrent requests for one tile (layer, z, x, y) share a single upstream fetch.
+# The fetch stores the tile itself, so it is kept even if every waiting request
+# has timed out; it runs under a deadline of TILE_FETCH_TIMEOUT_SECONDS (no GEE
+# round trip or retry starts after it) and is cancelled when nobody waits for it
+# before it got a worker.
+
+_tile_fetches = {}          # (layer, z, x, y) -> [future, waiting requests]
+# Reentrant: a future that is done (or cancelled) runs _forget_tile_fetch at once, in the thread holding it
+_tile_fetches_lock = threading.RLock()
+
+def fetch_tile_once(layer, coords, date_start, date_end, indicator, z, x, y):
+    """(tile_data, etag) fetched from TILE_UPSTREAM and stored, joining a fetch of the same tile in flight"""
+    key = (layer, z, x, y)
+    timeout = app.config['TILE_FETCH_TIMEOUT_SECONDS']
+    with _tile_fetches_lock:
+        fetch = _tile_fetches.get(key)
+        if fetch is None:
+            context = contextvars.copy_context()
+            remaining = gee_service.remaining_time()
+            context.run(gee_service.set_deadline, gee_service.Deadline(
+                timeout if remaining is None else min(timeout, remaining)
+            ))
+            future = gee_scheduler.GEE_POOL.submit(
+                context.run, fetch_and_store_tile, layer, coords, date_start, date_end, indicator, z, x, y
+            )
+            fetch = _tile_fetches[key] = [future, 0]
+            future.add_done_callback(lambda done: _forget_tile_fetch(key, done))
+        fetch[1] += 1
+
+    try:
+        return fetch[0].result(timeout=timeout)
+    finally:
+        with _tile_fetches_lock:
+            fetch[1] -= 1
+            if not fetch[1]:
+                fetch[0].cancel()
+
+def _forget_tile_fetch(key, future):
+    with _tile_fetches_lock:
+        if _tile_fetches.get(key, [None])[0] is future:
+            del _tile_fetches[key]
+
+def fetch_and_store_tile(layer, coords, date_start, date_end, indicator, z, x, y):
+    tile_data = app.config['TILE_UPSTREAM'](coords, date_start, date_end, indicator, z, x, y)
+    return tile_data, tile_store.put(layer, z, x, y, tile_data)
+
+def proxy_tile_url(host_url, indicator, coords, date_start, date_end):
+    """Leaflet URL template pointing at the /tiles proxy for a layer"""
+    params = dict(coords)
+    if date_start: params['date_start'] = date_start
+    if date_end: params['date_end'] = date_end
+    return f"{host_url.rstrip('/')}/tiles/{indicator.upper()}/{{z}}/{{x}}/{{y}}?{urlencode(params)}"
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once Earth Engine is usable, 503 until then (also starts a lazy initialization)"""
+    gee_service.start_gee_initialization()
+    status = gee_service.gee_status()
+    ready = status['state'] == 'ready'
+    return jsonify({
+        "ready": ready,
+        "gee": status,
+        "warmup": gee_service.warmup_status()
+    }), 200 if ready else 503
+
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the layer, dashboard and tile caches, and of the speculative prefetch"""
+    return jsonify({
+        "success": True,
+        "layer_cache": gee_service.LAYER_CACHE.stats(),
+        "dashboard_cache": gee_service.DASHBOARD_STORE.stats(),
+        "tile_store": tile_store.stats(),
+        "graph_templates": gee_service.TEMPLATES.stats(),
+        "grid_index": grid_service.GRID_INDEX.stats(),
+        "prefetch": prefetch.prefetch_stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/dashboard_stats', methods=['POST'])
 def dashboard_stats():
     """
@@ -67,45 +517,426 @@ def dashboard_stats():
         "north": float, "south": float, "east": float, "west": float,
         "date_start": "YYYY-MM-DD", "date_end": "YYYY-MM-DD",
         "crop_type": "wheat" | "corn" | "rice" | "soybean" (optional),
-        "input_costs": float (optional, in $/hectare)
+        "input_costs": float (optional, in $/hectare),
+        "backend": "gee" | "local" (optional, "local" computes the Sentinel-2 stages from the local archive),
+        "progressive": bool (optional, streams a coarse estimate then the final result as NDJSON),
+        "compare_to": "previous" | "last_year" | {"date_start", "date_end"} (optional, adds the earlier
+                      window's stats and the differences as "comparison"; not with progressive)
     }
     """
     try:
-        data = request.json
+        if (request.json or {}).get('progressive') and 'compare_to' not in request.json:
+            return progressive_dashboard(request.json)
+
+        body, status = dashboard_result(request.json)
+        return jsonify(body), status
         
+    except GeeUnavailable as e:
+        return gee_unavailable_response(e)
+
+    except Exception as e:
+        print(f"Error in dashboard: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
+def dashboard_result(data):
+    """Build the /api/dashboard_stats response body and status (shared with the job API)"""
+    # Validation
+    required_fields = ['north', 'south', 'east', 'west']
+    if not all(field in data for field in required_fields):
+        return {"error": "Missing coordinates"}, 400
+        
+    coords = {
+        'north': data['north'],
+        'south': data['south'],
+        'east': data['east'],
+        'west': data['west']
+    }
+    
+    date_start = data.get('date_start')
+    date_end = data.get('date_end')
+    crop_type = data.get('crop_type', 'wheat')
+    input_costs = data.get('input_costs', 500)  # Default $500/ha
+    backend = data.get('backend', 'gee')
+    if backend not in gee_service.COMPUTE_BACKENDS:
+        return {"error": f"backend must be one of {list(gee_service.COMPUTE_BACKENDS)}"}, 400
+    
+    # Calculate dashboard metrics (served from the persistent store when possible)
+    comparison = None
+    try:
+        if data.get('compare_to') is not None:
+            try:
+                stats, comparison, cache_status = change_detection.get_dashboard_change(
+                    coords, date_start, date_end, data['compare_to'], crop_type, input_costs, backend
+                )
+            except ValueError as e:
+                return {"error": str(e), "success": False}, 400
+        else:
+            stats, cache_status = gee_service.get_dashboard_metrics(
+                coords, date_start, date_end, crop_type, input_costs, backend
+            )
+    except local_engine.LocalArchiveError as e:
+        return {"error": str(e), "success": False}, 422
+    
+    body = {
+        "success": True,
+        "stats": stats,
+        "coords": coords,
+        "dates": {"start": date_start, "end": date_end},
+        "cache": cache_status
+    }
+    if comparison is not None:
+        body["comparison"] = comparison
+    return body, 200
+
+@app.route('/api/scenarios', methods=['POST'])
+def scenarios():
+    """
+    Financial scenarios for every crop x input cost x price assumption, from one set of
+    satellite stages (shared with /api/dashboard_stats through the dashboard store).
+    Expected JSON:
+    {
+        "north": float, "south": float, "east": float, "west": float,
+        "date_start": "YYYY-MM-DD", "date_end": "YYYY-MM-DD",
+        "crops": ["wheat", "corn", ...] (optional, default every crop),
+        "input_costs": [float, ...] | {"min": float, "max": float, "steps": int} (optional, $/hectare),
+        "price_factors": [float, ...] | {"min": float, "max": float, "steps": int} (optional, x price_per_ton),
+        "backend": "gee" | "local" (optional)
+    }
+    """
+    try:
+        body, status = scenario_result(request.json)
+        return jsonify(body), status
+
+    except GeeUnavailable as e:
+        return gee_unavailable_response(e)
+
+    except Exception as e:
+        print(f"Error in scenarios: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
+def scenario_result(data):
+    """Build the /api/scenarios response body and status"""
+    required_fields = ['north', 'south', 'east', 'west']
+    if not all(field in data for field in required_fields):
+        return {"error": "Missing coordinates"}, 400
+
+    coords = {field: data[field] for field in required_fields}
+    date_start = data.get('date_start')
+    date_end = data.get('date_end')
+    backend = data.get('backend', 'gee')
+    if backend not in gee_service.COMPUTE_BACKENDS:
+        return {"error": f"backend must be one of {list(gee_service.COMPUTE_BACKENDS)}"}, 400
+
+    crops = data.get('crops') or list(gee_service.CROP_YIELDS)
+    unknown = [crop for crop in crops if crop not in gee_service.CROP_YIELDS]
+    if unknown:
+        return {"error": f"Unknown crops {unknown}; known: {list(gee_service.CROP_YIELDS)}"}, 400
+    try:
+        input_costs = scenario_axis(data.get('input_costs'), gee_service.SCENARIO_INPUT_COSTS)
+        price_factors = scenario_axis(data.get('price_factors'), gee_service.SCENARIO_PRICE_FACTORS)
+    except (KeyError, TypeError, ValueError) as e:
+        return {"error": f"input_costs and price_factors must be lists of numbers or min/max/steps: {e}"}, 400
+    cells = len(crops) * len(input_costs) * len(price_factors)
+    if cells > gee_service.SCENARIO_MAX_CELLS:
+        return {"error": f"{cells} scenarios exceed the limit of {gee_service.SCENARIO_MAX_CELLS}"}, 400
+
+    try:
+        result, cache_status = gee_service.get_scenario_grid(
+            coords, date_start, date_end, crops, input_costs, price_factors, backend
+        )
+    except local_engine.LocalArchiveError as e:
+        return {"error": str(e), "success": False}, 422
+
+    return {
+        "success": True,
+        "scenarios": result,
+        "coords": coords,
+        "dates": {"start": date_start, "end": date_end},
+        "cache": cache_status
+    }, 200
+
+def scenario_axis(value, default):
+    """A scenario axis from a list of numbers or {"min", "max", "steps"} (evenly spaced)"""
+    if value is None:
+        return [float(v) for v in default]
+    if isinstance(value, dict):
+        steps = int(value.get('steps', 5))
+        if not 1 <= steps <= gee_service.SCENARIO_MAX_CELLS:
+            raise ValueError(f"steps must be between 1 and {gee_service.SCENARIO_MAX_CELLS}")
+        low, high = float(value['min']), float(value['max'])
+        return [low + (high - low) * i / (steps - 1) for i in range(steps)] if steps > 1 else [low]
+    if not isinstance(value, list) or not value:
+        raise ValueError("expected a non-empty list")
+    return [float(v) for v in value]
+
+@app.route('/api/ndvi_timeseries', methods=['POST'])
+def ndvi_timeseries():
+    """
+    Incremental NDVI time series
+    Expected JSON:
+    {
+        "north": float, "south": float, "east": float, "west": float,
+        "date_start": "YYYY-MM-DD", "date_end": "YYYY-MM-DD",
+        "period": "scene" | "week" | "month" (optional, default "scene")
+    }
+    """
+    try:
+        data = request.json
+
         # Validation
         required_fields = ['north', 'south', 'east', 'west']
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing coordinates"}), 400
-            
+
         coords = {
             'north': data['north'],
             'south': data['south'],
             'east': data['east'],
             'west': data['west']
         }
-        
+
+        date_start = data.get('date_start')
+        date_end = data.get('date_end')
+        period = data.get('period', 'scene')
+        if period not in gee_service.NDVI_SERIES_PERIODS:
+            return jsonify({"error": f"period must be one of {list(gee_service.NDVI_SERIES_PERIODS)}"}), 400
+
+        series, fetched = gee_service.get_ndvi_timeseries(coords, date_start, date_end, period)
+
+        return jsonify({
+            "success": True,
+            "series": series,
+            "period": period,
+            "fetched_intervals": [{"start": start, "end": end} for start, end in fetched],
+            "coords": coords,
+            "dates": {"start": date_start, "end": date_end}
+        })
+
+    except GeeUnavailable as e:
+        return gee_unavailable_response(e)
+
+    except Exception as e:
+        print(f"Error in NDVI time series: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
+def progressive_dashboard(data):
+    """NDJSON stream: a quick coarse-scale result first, then the native-resolution one"""
+    required_fields = ['north', 'south', 'east', 'west']
+    if not all(field in data for field in required_fields):
+        return jsonify({"error": "Missing coordinates"}), 400
+
+    coords = {field: data[field] for field in required_fields}
+    date_start = data.get('date_start')
+    date_end = data.get('date_end')
+    crop_type = data.get('crop_type', 'wheat')
+    input_costs = data.get('input_costs', 500)  # Default $500/ha
+    backend = data.get('backend', 'gee')
+    if backend not in gee_service.COMPUTE_BACKENDS:
+        return jsonify({"error": f"backend must be one of {list(gee_service.COMPUTE_BACKENDS)}"}), 400
+
+    def generate():
+        try:
+            results = gee_service.iter_progressive_dashboard(
+                coords, date_start, date_end, crop_type, input_costs, backend
+            )
+            for result in results:
+                result.update({
+                    "success": True,
+                    "coords": coords,
+                    "dates": {"start": date_start, "end": date_end}
+                })
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            print(f"Error in progressive dashboard: {e}")
+            yield json.dumps({"error": str(e), "success": False}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# ==========================================
+# ASYNCHRONOUS JOB API
+# ==========================================
+
+def grid_index_result(data):
+    """Build or extend the grid index region around a bbox (job only; see grid_service.build_grid_index)"""
+    required_fields = ['north', 'south', 'east', 'west']
+    if not all(field in data for field in required_fields):
+        return {"error": "Missing coordinates"}, 400
+    coords = {field: data[field] for field in required_fields}
+
+    summary = grid_service.build_grid_index(
+        coords, data.get('date_start'), data.get('date_end'), bool(data.get('rebuild', False))
+    )
+    return {"success": True, **summary}, 200
+
+JOB_TYPES = {
+    'analyze': lambda params, host_url: analyze_result(params, host_url),
+    'dashboard': lambda params, host_url: dashboard_result(params),
+    'grid_index': lambda params, host_url: grid_index_result(params)
+}
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Run /api/analyze or /api/dashboard_stats work, or a grid index build, on the job worker pool.
+    Expected JSON:
+    {
+        "type": "analyze" | "dashboard" | "grid_index",
+        "params": { same body as the synchronous endpoint }
+    }
+    grid_index params: north, south, east, west, date_start, date_end (optional,
+    default the last 12 months), rebuild (optional bool).
+    Identical pending jobs are merged; a full queue answers 429.
+    """
+    try:
+        data = request.json or {}
+        kind = data.get('type')
+        params = data.get('params')
+        if kind not in JOB_TYPES:
+            return jsonify({"error": f"type must be one of {sorted(JOB_TYPES)}"}), 400
+        if not isinstance(params, dict):
+            return jsonify({"error": "params must be an object"}), 400
+
+        host_url = request.host_url
+        try:
+            job, merged = job_manager.submit(kind, params, lambda: JOB_TYPES[kind](params, host_url))
+        except JobQueueFull as e:
+            return jsonify({"error": str(e), "success": False}), 429, {'Retry-After': '5'}
+
+        body = job.to_dict()
+        body.update({
+            "success": True,
+            "merged": merged,
+            "status_url": f"/api/jobs/{job.id}",
+            "result_url": f"/api/jobs/{job.id}/result"
+        })
+        return jsonify(body), 202
+
+    except Exception as e:
+        print(f"Error submitting job: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def job_stats():
+    """Worker pool and queue counters"""
+    return jsonify({"success": True, "jobs": job_manager.stats()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job", "success": False}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """The endpoint's own response once the job is done; 202 while it is still pending"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job", "success": False}), 404
+    if job.status in ('queued', 'running'):
+        return jsonify(job.to_dict()), 202
+    if job.status == 'failed':
+        return jsonify({"error": job.error, "success": False}), 500
+
+    body, status = job.result
+    return jsonify(body), status
+
+@app.route('/api/fields/batch', methods=['POST'])
+def fields_batch():
+    """
+    Batch field analytics for many parcels at once
+    Expected JSON:
+    {
+        "fields": GeoJSON FeatureCollection of Polygon / MultiPolygon features,
+        "date_start": "YYYY-MM-DD", "date_end": "YYYY-MM-DD",
+        "crop_type": "wheat" | "corn" | "rice" | "soybean" (optional),
+        "input_costs": float (optional, in $/hectare)
+    }
+    """
+    try:
+        data = request.json
+
+        fields = data.get('fields') or {}
+        features = fields.get('features')
+        if fields.get('type') != 'FeatureCollection' or not isinstance(features, list):
+            return jsonify({"error": "fields must be a GeoJSON FeatureCollection"}), 400
+        try:
+            gee_service.validate_field_features(features)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         date_start = data.get('date_start')
         date_end = data.get('date_end')
         crop_type = data.get('crop_type', 'wheat')
         input_costs = data.get('input_costs', 500)  # Default $500/ha
-        
-        # Calculate dashboard metrics
-        stats = gee_service.calculate_dashboard_metrics(
-            coords, date_start, date_end, crop_type, input_costs
+
+        results = gee_service.calculate_field_batch(
+            features, date_start, date_end, crop_type, input_costs
         )
-        
+
         return jsonify({
             "success": True,
-            "stats": stats,
-            "coords": coords,
+            "count": len(results),
+            "results": results,
             "dates": {"start": date_start, "end": date_end}
         })
-        
+
+    except GeeUnavailable as e:
+        return gee_unavailable_response(e)
+
     except Exception as e:
-        print(f"Error in dashboard: {e}")
+        print(f"Error in field batch: {e}")
         return jsonify({"error": str(e), "success": False}), 500
 
+@app.route('/api/fields/stream', methods=['POST'])
+def fields_stream():
+    """
+    Streaming batch field analytics with bounded memory
+    Body: NDJSON, one GeoJSON Feature (Polygon / MultiPolygon) per line
+    Query: date_start, date_end, crop_type, input_costs, chunk_size (all optional;
+           chunk_size at most FIELD_BATCH_CHUNK_SIZE)
+    Response: NDJSON, one result object per field, emitted as each chunk completes
+    """
+    args = request.args
+    date_start = args.get('date_start')
+    date_end = args.get('date_end')
+    crop_type = args.get('crop_type', 'wheat')
+    try:
+        input_costs = float(args.get('input_costs', 500))  # Default $500/ha
+        chunk_size = int(args.get('chunk_size', gee_service.FIELD_STREAM_CHUNK_SIZE))
+    except ValueError:
+        return jsonify({"error": "input_costs and chunk_size must be numbers"}), 400
+    if chunk_size < 1:
+        return jsonify({"error": "chunk_size must be positive"}), 400
+    # One chunk is one getInfo() and is held in memory; keep it within what /api/fields/batch uses
+    if chunk_size > gee_service.FIELD_BATCH_CHUNK_SIZE:
+        return jsonify({"error": f"chunk_size must be at most {gee_service.FIELD_BATCH_CHUNK_SIZE}"}), 400
+
+    def read_features():
+        # Read the body line by line instead of loading it whole
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None  # reported as an invalid feature
+
+    def generate():
+        try:
+            results = gee_service.iter_field_batch(
+                read_features(), date_start, date_end, crop_type, input_costs, chunk_size=chunk_size
+            )
+            for result in results:
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            print(f"Error in field stream: {e}")
+            yield json.dumps({"error": str(e), "success": False}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 
 if __name__ == '__main__':
+    # Development server; asgi.py serves the same app in the asyncio mode (bounded executor, deadlines, admission control)
     app.run(debug=True)
@@ -0,0 +1,280 @@
+"""
+Asyncio serving mode for the API.
+
+    uvicorn asgi:app --port 5000        (or: python asgi.py)
+
+The Flask app in app.py is served unchanged, but its blocking work (the view
+and the Earth Engine round trips it makes) runs on a bounded executor, so a
+slow dashboard holds one executor thread instead of a server worker, and the
+event loop keeps accepting and answering other requests.
+
+- Admission control: at most MAX_IN_FLIGHT requests are admitted at once
+  (running or waiting for an executor thread), and at most
+  MAX_IN_FLIGHT_PER_CLIENT per client address. Beyond that the request is
+  answered right away with 503 (server busy) or 429 (client over its share),
+  both with Retry-After, instead of queueing without limit.
+- Deadlines: every request gets REQUEST_DEADLINE_SECONDS (a client may ask
+  for less or more, up to MAX_REQUEST_DEADLINE_SECONDS, with the
+  X-Request-Deadline header). When it passes the client gets a 504, work still
+  waiting for a thread is cancelled, and the GEE calls the request had not
+  started yet fail fast (gee_service.check_deadline).
+
+Request bodies are read whole before the view runs. Streamed (NDJSON)
+responses are forwarded chunk by chunk; if their deadline passes mid-stream
+the stream is cut off.
+"""
+import asyncio
+import contextvars
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import gee_service
+import metrics
+from app import app as flask_app
+
+# Threads for blocking request work (Flask views and their GEE round trips)
+EXECUTOR_WORKERS = int(os.environ.get('GAIAEYE_EXECUTOR_WORKERS', 32))
+EXECUTOR = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix='gee-request')
+
+# Admission control
+MAX_IN_FLIGHT = int(os.environ.get('GAIAEYE_MAX_IN_FLIGHT', 128))
+MAX_IN_FLIGHT_PER_CLIENT = int(os.environ.get('GAIAEYE_MAX_IN_FLIGHT_PER_CLIENT', 16))
+RETRY_AFTER_SECONDS = 2
+
+# Per-request deadlines
+REQUEST_DEADLINE_SECONDS = float(os.environ.get('GAIAEYE_REQUEST_DEADLINE_SECONDS', 60))
+MAX_REQUEST_DEADLINE_SECONDS = 600
+DEADLINE_HEADER = 'x-request-deadline'
+
+# Only touched from the event loop thread
+_in_flight = 0
+_in_flight_by_client = {}
+
+metrics.register(metrics.Gauge(
+    'gaiaeye_requests_in_flight', 'Requests admitted and not yet answered', (), lambda: {(): _in_flight}
+))
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    client = (scope.get('client') or ('unknown', 0))[0]
+    rejection = admit(client)
+    if rejection is not None:
+        status, reason, message = rejection
+        metrics.REJECTED_REQUESTS.inc(reason=reason)
+        await send_json(send, status, {"error": message, "success": False},
+                        [('retry-after', str(RETRY_AFTER_SECONDS))])
+        return
+    try:
+        await serve(scope, receive, send)
+    finally:
+        release(client)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+# --- ADMISSION CONTROL ---
+
+def admit(client):
+    """Count the request in, or return (status, reason, message) when it must be turned away"""
+    global _in_flight
+    if _in_flight >= MAX_IN_FLIGHT:
+        return 503, 'overloaded', "Server is at capacity, retry shortly"
+    if _in_flight_by_client.get(client, 0) >= MAX_IN_FLIGHT_PER_CLIENT:
+        return 429, 'client_limit', f"Too many concurrent requests (limit {MAX_IN_FLIGHT_PER_CLIENT})"
+    _in_flight += 1
+    _in_flight_by_client[client] = _in_flight_by_client.get(client, 0) + 1
+    return None
+
+def release(client):
+    global _in_flight
+    _in_flight -= 1
+    remaining = _in_flight_by_client[client] - 1
+    if remaining:
+        _in_flight_by_client[client] = remaining
+    else:
+        del _in_flight_by_client[client]
+
+def request_deadline_seconds(scope):
+    """REQUEST_DEADLINE_SECONDS, or the client's X-Request-Deadline clamped to (0, MAX_REQUEST_DEADLINE_SECONDS]"""
+    for name, value in scope['headers']:
+        if name.decode('latin1').lower() == DEADLINE_HEADER:
+            try:
+                seconds = float(value)
+            except ValueError:
+                break
+            if seconds > 0:
+                return min(seconds, MAX_REQUEST_DEADLINE_SECONDS)
+    return REQUEST_DEADLINE_SECONDS
+
+# --- SERVING ---
+
+async def serve(scope, receive, send):
+    body = await read_body(receive)
+    deadline = gee_service.Deadline(request_deadline_seconds(scope))
+
+    # One context per request: the Flask request context, the metrics trace and the
+    # deadline live in it, and pool threads started by the view inherit it
+    context = contextvars.copy_context()
+    context.run(gee_service.set_deadline, deadline)
+
+    future = EXECUTOR.submit(context.run, call_wsgi, build_environ(scope, body))
+    try:
+        status, headers, chunks = await within_deadline(future, deadline)
+    except asyncio.TimeoutError:
+        pass
+    if deadline.exceeded:
+        # Also when the view turned DeadlineExceeded into a 500 before the timeout fired
+        future.add_done_callback(lambda done: discard_response(done, context))
+        metrics.DEADLINES_EXCEEDED.inc()
+        await send_json(send, 504, {"error": "Request deadline exceeded", "success": False})
+        return
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': encode_headers(headers)})
+    if isinstance(chunks, bytes):
+        await send({'type': 'http.response.body', 'body': chunks})
+        return
+
+    # Streamed response: pull each chunk on the executor, within the deadline
+    future = None
+    try:
+        while True:
+            future = EXECUTOR.submit(context.run, next, chunks, None)
+            chunk = await within_deadline(future, deadline)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    except asyncio.TimeoutError:
+        print("Streamed response cut off at its deadline")
+        metrics.DEADLINES_EXCEEDED.inc()
+    finally:
+        # Close the iterator once the chunk being produced (if any) is done; right away
+        # if no chunk was ever submitted (e.g. the executor is shutting down)
+        if future is None:
+            context.run(close_iterator, chunks)
+        else:
+            future.add_done_callback(lambda done: context.run(close_iterator, chunks))
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def within_deadline(future, deadline):
+    """
+    Await an executor future until the deadline. On timeout the future is cancelled
+    if it has not started yet (raises asyncio.TimeoutError with deadline.exceeded set).
+    """
+    waiter = asyncio.wrap_future(future)
+    try:
+        return await asyncio.wait_for(asyncio.shield(waiter), timeout=max(deadline.remaining(), 0))
+    except asyncio.TimeoutError:
+        deadline.exceeded = True
+        future.cancel()
+        # Nobody awaits the result any more
+        waiter.add_done_callback(lambda done: done.cancelled() or done.exception())
+        raise
+
+def discard_response(future, context):
+    """Close the body of a response that will not be sent"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    chunks = future.result()[2]
+    if not isinstance(chunks, bytes):
+        context.run(close_iterator, chunks)
+
+def call_wsgi(environ):
+    """
+    Run the Flask app on one request: (status, headers, body).
+    body is bytes for ordinary responses and an iterator for streamed ones
+    (no Content-Length), which serve() drains on the executor.
+    """
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    result = flask_app(environ, start_response)
+    headers = started['headers']
+    if any(name.lower() == 'content-length' for name, _ in headers):
+        try:
+            return started['status'], headers, b''.join(result)
+        finally:
+            close_iterator(result)
+    return started['status'], headers, iter(result)
+
+def close_iterator(result):
+    if hasattr(result, 'close'):
+        result.close()
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope with an already-read body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+async def send_json(send, status, body, headers=()):
+    data = flask_app.json.dumps(body).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': encode_headers([('Content-Type', 'application/json'),
+                                   ('Content-Length', str(len(data))), *headers])
+    })
+    await send({'type': 'http.response.body', 'body': data})
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=5000)
@@ -0,0 +1,181 @@
+"""
+Load test for /api/analyze and /api/dashboard_stats.
+
+By default the app runs in-process on top of fake_ee (simulated Earth Engine
+latency and failures, no credentials needed). With --url the same load is sent
+to a running server instead.
+
+    python bench_api.py --concurrency 1,4,16 --requests 200 --output run.json
+    python bench_api.py --baseline run.json          # compare against an earlier run
+
+Every request uses a slightly shifted ROI so caches do not hide the GEE work;
+--warm repeats a single ROI instead. fake_ee cannot serialize graph templates,
+so in-process runs build every graph client-side (GRAPH_TEMPLATES off).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = {
+    'analyze': ('/api/analyze', {'indicator': 'NDVI', 'date_start': '2024-03-01', 'date_end': '2024-05-30'}),
+    'dashboard': ('/api/dashboard_stats', {'crop_type': 'wheat', 'input_costs': 500,
+                                           'date_start': '2024-03-01', 'date_end': '2024-05-30'}),
+}
+BASE_ROI = {'west': -7.65, 'south': 33.50, 'east': -7.55, 'north': 33.60}
+
+def request_body(endpoint, warm):
+    path, params = ENDPOINTS[endpoint]
+    shift = 0 if warm else random.uniform(-0.5, 0.5)
+    roi = {side: value + shift for side, value in BASE_ROI.items()}
+    return path, {**params, **roi}
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def in_process_sender():
+    import app
+    local = threading.local()
+
+    def send(path, body):
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        response = local.client.post(path, json=body)
+        return response.status_code
+    return send
+
+def http_sender(base_url):
+    def send(path, body):
+        req = urllib.request.Request(
+            base_url.rstrip('/') + path, data=json.dumps(body).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=300) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return send
+
+def run_level(send, endpoint, concurrency, total, warm):
+    """Send `total` requests with `concurrency` in flight; returns the summary row"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one():
+        nonlocal errors
+        path, body = request_body(endpoint, warm)
+        start = time.perf_counter()
+        try:
+            status = send(path, body)
+        except Exception:
+            status = None
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(total):
+            pool.submit(one)
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'rps': round(total / duration, 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+def compare(results, baseline_path):
+    """Print RPS and p95 changes against an earlier run"""
+    with open(baseline_path) as f:
+        baseline = {(row['endpoint'], row['concurrency']): row for row in json.load(f)['results']}
+    print(f"\nvs {baseline_path}")
+    for row in results:
+        old = baseline.get((row['endpoint'], row['concurrency']))
+        if old is None:
+            continue
+        rps_change = (row['rps'] - old['rps']) / old['rps'] * 100 if old['rps'] else 0.0
+        p95_change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        print(f"{row['endpoint']:<10}{row['concurrency']:>5}  rps {rps_change:+7.1f}%  p95 {p95_change:+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--endpoints', default='analyze,dashboard')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32')
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint and concurrency level')
+    parser.add_argument('--warm', action='store_true', help='reuse one ROI (measures the cached path)')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--latency-ms', type=float, default=400, help='fake getInfo latency (mean)')
+    parser.add_argument('--map-id-latency-ms', type=float, default=250, help='fake getMapId latency (mean)')
+    parser.add_argument('--jitter-ms', type=float, default=50, help='standard deviation of fake latencies')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of fake GEE calls that fail')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='earlier JSON output to compare against')
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    if args.url:
+        send = http_sender(args.url)
+    else:
+        import fake_ee
+        fake_ee.install(
+            latency_ms={'getInfo': (args.latency_ms, args.jitter_ms),
+                        'getMapId': (args.map_id_latency_ms, args.jitter_ms)},
+            failure_rate=args.failure_rate
+        )
+        # Keep the benchmark's caches away from the real ones
+        data_dir = tempfile.mkdtemp(prefix='gaiaeye-bench-')
+        os.environ.setdefault('GAIAEYE_DATA_DIR', data_dir)
+        os.environ.setdefault('GAIAEYE_TILE_STORE', os.path.join(data_dir, 'tiles.mbtiles'))
+        import gee_service
+        gee_service.GRAPH_TEMPLATES = False
+        config['graph_templates'] = False
+        print("Note: graph templates are disabled under fake_ee; every request builds its graph client-side,\n"
+              "      so results are not comparable with a server running GRAPH_TEMPLATES on.\n")
+        send = in_process_sender()
+
+    results = []
+    print(f"{'endpoint':<10}{'conc':>5}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for endpoint in args.endpoints.split(','):
+        for concurrency in (int(level) for level in args.concurrency.split(',')):
+            row = run_level(send, endpoint, concurrency, args.requests, args.warm)
+            results.append(row)
+            print(f"{endpoint:<10}{concurrency:>5}{row['rps']:>9.2f}{row['p50_ms']:>10.1f}"
+                  f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['errors']:>8}")
+
+    report = {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'config': config, 'results': results}
+    if not args.url:
+        report['fake_ee'] = fake_ee.stats()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Client-side cost of building and serializing the GEE request graphs, with and
+without graph templates. Nothing is sent to Earth Engine; only the Python work
+done before each getMapId / getInfo call is timed.
+
+    python bench_graph_templates.py [--iterations 200] [--offline]
+
+--offline loads the algorithm list bundled with earthengine-api's test helpers,
+so it runs without credentials.
+"""
+import argparse
+import time
+
+import ee
+from ee import serializer
+
+import gee_service
+
+COORDS = {'west': -7.65, 'south': 33.50, 'east': -7.55, 'north': 33.60}
+DATE_START = '2024-03-01'
+DATE_END = '2024-05-30'
+
+def initialize_offline():
+    from ee import apitestcase
+    ee.Reset()
+    ee.data._install_cloud_api_resource = lambda: None
+    ee.data.getAlgorithms = apitestcase.GetAlgorithms
+    ee.Initialize(None, '', project='offline-benchmark')
+
+def time_per_call(func, iterations):
+    func()  # warm-up (also compiles the template on the first call)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+def layer_cases():
+    roi = ee.Geometry.Rectangle([COORDS['west'], COORDS['south'], COORDS['east'], COORDS['north']])
+    for indicator, config in gee_service.INDICATORS_CONFIG.items():
+        values = {'roi': roi} if config['type'] == 'DEM' else {'roi': roi, 'start': DATE_START, 'end': DATE_END}
+
+        def rebuild(indicator=indicator, vis=config['vis']):
+            image = gee_service.build_indicator_image(roi, DATE_START, DATE_END, indicator)
+            return serializer.encode(image.visualize(**vis))
+
+        def template(indicator=indicator, vis=config['vis'], values=values):
+            image = gee_service.indicator_template(indicator).image(**values)
+            return serializer.encode(image.visualize(**vis))
+
+        yield indicator, rebuild, template
+
+def dashboard_case():
+    roi = ee.Geometry.Rectangle([COORDS['west'], COORDS['south'], COORDS['east'], COORDS['north']])
+    plan = gee_service.reduction_plan(COORDS)
+
+    def rebuild():
+        return serializer.encode(gee_service.build_dashboard_reductions(roi, DATE_START, DATE_END, plan))
+
+    def template():
+        values = gee_service.dashboard_template_values(roi, DATE_START, DATE_END, plan)
+        return serializer.encode(gee_service.dashboard_template(plan).dictionary(**values))
+
+    return 'dashboard', rebuild, template
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--offline', action='store_true')
+    args = parser.parse_args()
+
+    if args.offline:
+        initialize_offline()
+    else:
+        gee_service.initialize_gee()
+
+    print(f"{'graph':<12}{'rebuild (ms)':>14}{'template (ms)':>15}{'speedup':>9}")
+    for name, rebuild, template in list(layer_cases()) + [dashboard_case()]:
+        before = time_per_call(rebuild, args.iterations)
+        after = time_per_call(template, args.iterations)
+        print(f"{name:<12}{before:>14.3f}{after:>15.3f}{before / after:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Pending:
+    """A computation in flight that other callers can wait on"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """
+    In-process LRU cache with per-entry expiry.
+    Concurrent callers asking for the same missing key share one computation.
+    """
+    def __init__(self, max_entries=256, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._pending = {}              # key -> _Pending
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value or None, counting a hit or a miss"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def contains(self, key):
+        """True when key is cached or being computed (not counted as a lookup)"""
+        with self._lock:
+            return key in self._pending or self._lookup(key) is not None
+
+    def put(self, key, value, ttl_seconds=None):
+        with self._lock:
+            self._store(key, value, ttl_seconds)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_compute(self, key, compute, ttl_seconds=None):
+        """Return the cached value for key, computing it at most once across threads"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses += 1
+                pending = _Pending()
+                self._pending[key] = pending
+                owner = True
+            else:
+                self.shared += 1
+                owner = False
+
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = compute()
+        except Exception as e:
+            pending.error = e
+            raise
+        else:
+            with self._lock:
+                self._store(key, pending.value, ttl_seconds)
+            return pending.value
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.event.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared_in_flight': self.shared,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    # --- internal helpers (caller holds the lock) ---
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value, ttl_seconds):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class DashboardStore:
+    """
+    Disk-backed (SQLite) cache for dashboard results that survives restarts.
+    Entries older than ttl_seconds are served stale while a background refresh runs;
+    entries older than max_stale_seconds are treated as missing.
+    """
+    def __init__(self, path, ttl_seconds=6 * 3600, max_stale_seconds=7 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dashboard_stats ("
+                " key TEXT PRIMARY KEY, payload TEXT NOT NULL, computed_at REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and is closed on exit"""
+        with contextlib.closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            yield conn
+
+    def get(self, key):
+        """Return (payload, is_stale) or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload, computed_at FROM dashboard_stats WHERE key = ?", (key,)
+            ).fetchone()
+
+        age = time.time() - row[1] if row else None
+        with self._lock:
+            if row is None or age > self.max_stale_seconds:
+                self.misses += 1
+                return None
+            if age > self.ttl_seconds:
+                self.stale_hits += 1
+                return json.loads(row[0]), True
+            self.hits += 1
+            return json.loads(row[0]), False
+
+    def contains(self, key):
+        """True when get() would return an entry (fresh or stale); does not touch the counters"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT computed_at FROM dashboard_stats WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.max_stale_seconds
+
+    def put(self, key, payload):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO dashboard_stats (key, payload, computed_at) VALUES (?, ?, ?)",
+                (key, json.dumps(payload), time.time())
+            )
+
+    def refresh_in_background(self, key, compute):
+        """Recompute an entry on a daemon thread; at most one refresh per key at a time"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.refreshes += 1
+
+        def run():
+            try:
+                self.put(key, compute())
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                print(f"Background dashboard refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'background_refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'refreshing': len(self._refreshing)
+            }
+
+
+class SeriesStore:
+    """
+    Persistent (SQLite) per-ROI NDVI time series.
+    Each ROI keeps the per-scene observations and the single date range [start, end)
+    that has already been reduced, so later calls only fetch what lies outside it.
+    """
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ndvi_series ("
+                " roi_key TEXT NOT NULL, date TEXT NOT NULL, ndvi REAL NOT NULL, pixels INTEGER NOT NULL,"
+                " PRIMARY KEY (roi_key, date))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ndvi_coverage ("
+                " roi_key TEXT PRIMARY KEY, start TEXT NOT NULL, end TEXT NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and is closed on exit"""
+        with contextlib.closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            yield conn
+
+    def coverage(self, roi_key):
+        """Return (start, end) already reduced for the ROI, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT start, end FROM ndvi_coverage WHERE roi_key = ?", (roi_key,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def merge(self, roi_key, observations, start, end):
+        """Upsert observations [(date, ndvi, pixels)] and set the covered range to [start, end)"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ndvi_series (roi_key, date, ndvi, pixels) VALUES (?, ?, ?, ?)",
+                [(roi_key, date, ndvi, pixels) for date, ndvi, pixels in observations]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO ndvi_coverage (roi_key, start, end) VALUES (?, ?, ?)",
+                (roi_key, start, end)
+            )
+
+    def series(self, roi_key, start, end):
+        """Stored observations [(date, ndvi, pixels)] with start <= date < end, oldest first"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT date, ndvi, pixels FROM ndvi_series"
+                " WHERE roi_key = ? AND date >= ? AND date < ? ORDER BY date",
+                (roi_key, start, end)
+            ).fetchall()
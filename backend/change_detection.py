@@ -0,0 +1,182 @@
+import ee
+
+import gee_service
+import metrics
+import periods
+from cache import ResultCache
+
+# ==========================================
+# CHANGE DETECTION (two periods, one graph)
+# ==========================================
+# Both period composites and their difference are built together: the delta
+# layer's getMapId and one getInfo with the before/after/delta statistics run
+# concurrently on the same graph. Period means are kept in PERIOD_STATS_CACHE,
+# so an earlier period already reduced (e.g. as the "after" of a previous
+# comparison) is not reduced again. The earlier window comes from
+# periods.comparison_window.
+
+PERIOD_STATS_CACHE = ResultCache(max_entries=1024, ttl_seconds=6 * 3600)
+# Decrease (red) to increase (blue); the range is half the layer's vis range, centered on 0
+CHANGE_PALETTE = ['#b2182b', '#ef8a62', '#fddbc7', '#f7f7f7', '#d1e5f0', '#67a9cf', '#2166ac']
+
+def get_indicator_change(coords, date_start=None, date_end=None, compare_to='previous', indicator='NDVI'):
+    """
+    Change of an indicator between an earlier window (see periods.comparison_window)
+    and [date_start, date_end): the delta tile URL and before/after/delta statistics.
+    Served from LAYER_CACHE when possible.
+    """
+    coords, date_start, date_end, indicator = gee_service.normalize_layer_request(
+        coords, date_start, date_end, indicator
+    )
+    if gee_service.INDICATORS_CONFIG[indicator]['type'] == 'DEM':
+        raise ValueError(f"{indicator} is a static dataset; change detection needs a time series indicator")
+
+    # The earlier window is derived from the snapped one, so a 'previous' window ends
+    # exactly where the snapped window starts
+    before_start, before_end = periods.comparison_window(date_start, date_end, compare_to)
+    _, before_start, before_end, _ = gee_service.normalize_layer_request(coords, before_start, before_end, indicator)
+
+    layer_key = gee_service.layer_cache_key(coords, date_start, date_end, indicator)
+    key = ('CHANGE',) + layer_key + (before_start, before_end)
+    return gee_service.LAYER_CACHE.get_or_compute(key, lambda: compute_indicator_change(
+        coords, (before_start, before_end), (date_start, date_end), indicator
+    ))
+
+def compute_indicator_change(coords, before, after, indicator):
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    indicator = gee_service.indicator_key(indicator)
+    config = gee_service.INDICATORS_CONFIG[indicator]
+    params = gee_service.reduction_params(
+        gee_service.estimate_area_m2(coords), gee_service.SOURCE_SCALES[config['type']]
+    )
+    keys = {
+        name: gee_service.layer_cache_key(coords, *window, indicator)
+        for name, window in (('before', before), ('after', after))
+    }
+    before_mean = PERIOD_STATS_CACHE.get(keys['before'])
+
+    print(f"Processing {indicator} change from {before[0]}..{before[1]} to {after[0]}..{after[1]}")
+    with gee_service.composite_scope(), metrics.INDICATOR_SECONDS.time(f'change.{indicator}', indicator=indicator):
+        before_image = gee_service.layer_image(roi, *before, indicator).select([0]).rename('value')
+        after_image = gee_service.layer_image(roi, *after, indicator).select([0]).rename('value')
+        delta = after_image.subtract(before_image)
+
+        reductions = {
+            'after': after_image.reduceRegion(reducer=ee.Reducer.mean(), geometry=roi, **params),
+            'delta': delta.reduceRegion(
+                reducer=ee.Reducer.mean().combine(ee.Reducer.minMax(), '', True), geometry=roi, **params
+            )
+        }
+        if before_mean is None:
+            reductions['before'] = before_image.reduceRegion(reducer=ee.Reducer.mean(), geometry=roi, **params)
+
+        span = (config['vis']['max'] - config['vis']['min']) / 2
+        vis = {'min': -span, 'max': span, 'palette': CHANGE_PALETTE}
+        results = gee_service.run_concurrently({
+            'map_id': lambda: gee_service.gee_request('getMapId', f'change_{indicator}', lambda: delta.getMapId(vis)),
+            'stats': lambda: gee_service.gee_get_info(ee.Dictionary(reductions), f'change_{indicator}')
+        })
+
+    stats = results['stats']
+    after_mean = stats['after'].get('value')
+    if before_mean is None:
+        before_mean = stats['before'].get('value')
+    # Empty periods (no scenes) reduce to None and are not worth keeping
+    for name, mean in (('before', before_mean), ('after', after_mean)):
+        if mean is not None:
+            PERIOD_STATS_CACHE.put(keys[name], mean)
+
+    delta_mean = stats['delta'].get('value_mean')
+    return {
+        'tile_url': results['map_id']['tile_fetcher'].url_format,
+        'vis': {'min': -span, 'max': span},
+        'before': {'dates': {'start': before[0], 'end': before[1]}, 'mean': before_mean},
+        'after': {'dates': {'start': after[0], 'end': after[1]}, 'mean': after_mean},
+        'delta': {
+            'mean': delta_mean,
+            'min': stats['delta'].get('value_min'),
+            'max': stats['delta'].get('value_max'),
+            'percent_change': round((after_mean - before_mean) / abs(before_mean) * 100, 2)
+            if before_mean and after_mean is not None else None
+        },
+        'reused_before': 'before' not in reductions
+    }
+
+def get_dashboard_change(coords, date_start, date_end, compare_to, crop_type, input_costs, backend='gee'):
+    """
+    Dashboard metrics for [date_start, date_end) and for an earlier window (see
+    periods.comparison_window), with the differences between them.
+    A window already in DASHBOARD_STORE is reused as is; when neither is, both
+    windows are reduced in one batched graph (a single getInfo).
+    Returns (stats, comparison, cache_status) where comparison holds the earlier
+    window's dates, stats, delta and cache status.
+    """
+    after = gee_service.resolve_dashboard_window(date_start, date_end)
+    before = periods.comparison_window(*after, compare_to)
+    windows = {'before': before, 'after': after}
+    keys = {
+        name: gee_service.dashboard_cache_key(coords, *window, backend)
+        for name, window in windows.items()
+    }
+
+    if (backend == 'gee' and gee_service.DASHBOARD_BATCHED
+            and not any(gee_service.DASHBOARD_STORE.contains(key) for key in keys.values())
+            and not any(gee_service.precomputed_covers(coords, *window) for window in windows.values())):
+        stages = evaluate_dashboard_change_stages(coords, before, after, crop_type)
+        for name, key in keys.items():
+            gee_service.DASHBOARD_STORE.put(key, stages[name])
+        status = dict.fromkeys(windows, 'miss')
+    else:
+        stages, status = {}, {}
+        for name, window in windows.items():
+            stages[name], status[name] = gee_service.get_dashboard_stages(coords, *window, crop_type, backend)
+
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    stats = {
+        name: gee_service.assemble_dashboard_metrics(stages[name], roi, *window, crop_type, input_costs)
+        for name, window in windows.items()
+    }
+    comparison = {
+        'dates': {'start': before[0], 'end': before[1]},
+        'stats': stats['before'],
+        'delta': dashboard_delta(stats['before'], stats['after']),
+        'cache': status['before']
+    }
+    return stats['after'], comparison, status['after']
+
+def evaluate_dashboard_change_stages(coords, before, after, crop_type):
+    """The batched reductions of both windows in one ee.Dictionary: {'before': stages, 'after': stages}"""
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    plan = gee_service.reduction_plan(coords)
+    timer = metrics.DASHBOARD_STAGE_SECONDS.time('dashboard.satellite', stage='satellite')
+    with gee_service.composite_scope(), timer:
+        values = gee_service.gee_get_info(ee.Dictionary({
+            'before': gee_service.dashboard_reductions(roi, *before, plan),
+            'after': gee_service.dashboard_reductions(roi, *after, plan)
+        }), 'dashboard_change')
+    scales = {stage: params['scale'] for stage, params in plan.items()}
+    return {
+        name: {**gee_service.score_dashboard_values(values[name], crop_type), 'reduction_scales': scales}
+        for name in ('before', 'after')
+    }
+
+# Figures compared by dashboard_delta: name -> (block, field). The soil moisture
+# proxy always reads the last 60 days, so it does not differ between windows.
+DASHBOARD_DELTA_FIELDS = {
+    'mean_ndvi': ('productivity_index', 'mean_ndvi'),
+    'expected_yield_tons_ha': ('productivity_index', 'expected_yield_tons_ha'),
+    'avg_temperature_c': ('weather_risk', 'avg_temperature_c'),
+    'max_temperature_c': ('weather_risk', 'max_temperature_c'),
+    'total_rainfall_mm': ('weather_risk', 'total_rainfall_mm'),
+    'pest_risk_score': ('pest_risk', 'risk_score'),
+    'expected_revenue_usd': ('financial', 'expected_revenue_usd'),
+    'net_profit_usd': ('financial', 'net_profit_usd'),
+    'roi_percent': ('financial', 'roi_percent')
+}
+
+def dashboard_delta(before, after):
+    """after - before for the numeric dashboard figures"""
+    return {
+        name: round(after[block][field] - before[block][field], 3)
+        for name, (block, field) in DASHBOARD_DELTA_FIELDS.items()
+    }
@@ -0,0 +1,480 @@
+"""
+Stand-in for the earthengine-api package, for load tests without GEE credentials.
+
+    import fake_ee
+    fake_ee.install(latency_ms={'getInfo': (400, 100)}, failure_rate=0.01)
+    import app   # gee_service now talks to the fake
+
+It mimics the subset of the client API used by gee_service (collection filters,
+image band math, reduceRegion/reduceRegions, ee.Dictionary, getInfo, getMapId,
+tile fetches, ee.data.computePixels, per-scene features with Image.date()).
+Collections mapped to features get one scene every SCENE_INTERVAL_DAYS of their
+filterDate window. Objects only track band names symbolically; every getInfo(),
+getMapId(), pixel fetch and tile fetch sleeps for a configurable latency, may
+fail with a quota EEException at failure_rate (retried by gee_scheduler), and
+returns plausible random values with the same keys and shapes as the real
+service. Serialized graph templates are not supported, so install() turns
+gee_service.GRAPH_TEMPLATES off if needed.
+"""
+import datetime
+import math
+import random
+import sys
+import threading
+import time
+import types
+
+# Per round-trip kind: (mean latency ms, standard deviation ms)
+DEFAULT_LATENCY_MS = {'getInfo': (400, 100), 'getMapId': (250, 50), 'fetch_tile': (80, 20)}
+
+CONFIG = {
+    'latency_ms': dict(DEFAULT_LATENCY_MS),
+    'failure_rate': 0.0,
+}
+CALLS = {}
+FAILURES = {}
+_lock = threading.Lock()
+
+EARTH_RADIUS_M = 6371008.8
+SCENE_INTERVAL_DAYS = 5
+
+# Bands of the collections gee_service reads
+DATASET_BANDS = {
+    'COPERNICUS/S2_SR_HARMONIZED': ['B2', 'B3', 'B4', 'B8', 'B11', 'QA60'],
+    'COPERNICUS/S1_GRD': ['VV', 'VH'],
+    'MODIS/006/MOD11A2': ['LST_Day_1km'],
+    'UCSB-CHG/CHIRPS/PENTAD': ['precipitation'],
+    'NASA/NASADEM_HGT/001': ['elevation'],
+}
+
+# Value ranges of reduced bands, by band name prefix
+VALUE_RANGES = (
+    ('NDVI_count', (100.0, 5000.0)),
+    ('NDVI', (0.2, 0.8)),
+    ('NDMI', (0.05, 0.45)),
+    ('nd', (0.05, 0.45)),
+    ('LST', (12.0, 38.0)),
+    ('precipitation_sum', (5.0, 300.0)),
+    ('precipitation', (0.5, 15.0)),
+    ('elevation', (0.0, 1500.0)),
+    ('slope', (0.0, 30.0)),
+    ('VV', (-20.0, -5.0)),
+)
+
+
+class EEException(Exception):
+    pass
+
+
+def configure(latency_ms=None, failure_rate=None):
+    """Update the simulated latency ({kind: (mean_ms, stddev_ms)}) and failure rate"""
+    with _lock:
+        if latency_ms:
+            CONFIG['latency_ms'].update(latency_ms)
+        if failure_rate is not None:
+            CONFIG['failure_rate'] = failure_rate
+
+def reset_stats():
+    with _lock:
+        CALLS.clear()
+        FAILURES.clear()
+
+def stats():
+    with _lock:
+        return {'calls': dict(CALLS), 'failures': dict(FAILURES)}
+
+def install(latency_ms=None, failure_rate=None):
+    """Register this module as `ee` (call before importing gee_service / app)"""
+    configure(latency_ms, failure_rate)
+    sys.modules['ee'] = sys.modules[__name__]
+    gee_service = sys.modules.get('gee_service')
+    if gee_service is not None:
+        gee_service.GRAPH_TEMPLATES = False
+
+def _round_trip(kind):
+    with _lock:
+        mean, stddev = CONFIG['latency_ms'].get(kind, (0, 0))
+        failure_rate = CONFIG['failure_rate']
+        CALLS[kind] = CALLS.get(kind, 0) + 1
+    time.sleep(max(0.0, random.gauss(mean, stddev)) / 1000)
+    if random.random() < failure_rate:
+        with _lock:
+            FAILURES[kind] = FAILURES.get(kind, 0) + 1
+        raise EEException(f"Too many concurrent aggregations. (simulated {kind} failure)")
+
+def _band_value(band):
+    for prefix, (low, high) in VALUE_RANGES:
+        if band.startswith(prefix):
+            return random.uniform(low, high)
+    return random.uniform(0.0, 1.0)
+
+def _evaluate(value):
+    if isinstance(value, ComputedObject):
+        return value._evaluate()
+    if isinstance(value, dict):
+        return {key: _evaluate(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_evaluate(item) for item in value]
+    return value
+
+def Initialize(*args, **kwargs):
+    pass
+
+def Authenticate(*args, **kwargs):
+    pass
+
+def Reset():
+    pass
+
+
+class ComputedObject:
+    def getInfo(self):
+        _round_trip('getInfo')
+        return self._evaluate()
+
+    def _evaluate(self):
+        raise EEException(f"fake_ee cannot evaluate {type(self).__name__}")
+
+
+class Number(ComputedObject):
+    def __init__(self, value):
+        self.value = value
+
+    def _evaluate(self):
+        return self.value
+
+
+class Dictionary(ComputedObject):
+    def __init__(self, values=None):
+        self.values = values if not isinstance(values, Dictionary) else values.values
+
+    def get(self, key):
+        return _Lazy(lambda: self._evaluate().get(key))
+
+    def _evaluate(self):
+        values = self.values() if callable(self.values) else self.values
+        return _evaluate(values or {})
+
+
+class List(ComputedObject):
+    def __init__(self, items):
+        self.items = items
+
+    def _evaluate(self):
+        return _evaluate(self.items)
+
+
+class _Lazy(ComputedObject):
+    def __init__(self, compute):
+        self.compute = compute
+
+    def _evaluate(self):
+        return self.compute()
+
+
+class Geometry(ComputedObject):
+    def __init__(self, geojson=None, bbox=None):
+        if bbox is None and isinstance(geojson, Geometry):
+            bbox = geojson.bbox
+        if bbox is None and geojson is not None:
+            points = list(_coordinates(geojson.get('coordinates', [])))
+            bbox = [min(p[0] for p in points), min(p[1] for p in points),
+                    max(p[0] for p in points), max(p[1] for p in points)]
+        self.bbox = bbox or [0, 0, 0, 0]
+
+    @staticmethod
+    def Rectangle(coords, *args, **kwargs):
+        return Geometry(bbox=list(coords))
+
+    def area(self, *args, **kwargs):
+        west, south, east, north = self.bbox
+        d_lon = math.radians(abs(east - west))
+        d_sin_lat = abs(math.sin(math.radians(north)) - math.sin(math.radians(south)))
+        return Number(EARTH_RADIUS_M ** 2 * d_lon * d_sin_lat)
+
+    def bounds(self, *args, **kwargs):
+        return self
+
+    def difference(self, *args, **kwargs):
+        return self
+
+    def _evaluate(self):
+        west, south, east, north = self.bbox
+        return {'type': 'Polygon', 'coordinates': [[[west, south], [east, south], [east, north], [west, north]]]}
+
+def _coordinates(value):
+    if value and isinstance(value[0], (int, float)):
+        yield value
+        return
+    for item in value:
+        yield from _coordinates(item)
+
+
+class Filter:
+    def __init__(self, *args, **kwargs):
+        self.args = args
+
+    @staticmethod
+    def lt(*args):
+        return Filter(*args)
+
+    @staticmethod
+    def eq(*args):
+        return Filter(*args)
+
+    @staticmethod
+    def listContains(*args):
+        return Filter(*args)
+
+    @staticmethod
+    def notNull(*args):
+        return Filter(*args)
+
+
+class Reducer:
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    @staticmethod
+    def mean():
+        return Reducer(['mean'])
+
+    @staticmethod
+    def max():
+        return Reducer(['max'])
+
+    @staticmethod
+    def minMax():
+        return Reducer(['min', 'max'])
+
+    @staticmethod
+    def sum():
+        return Reducer(['sum'])
+
+    @staticmethod
+    def count():
+        return Reducer(['count'])
+
+    @staticmethod
+    def toList(*args):
+        return Reducer(['list'])
+
+    def combine(self, reducer2, outputPrefix='', sharedInputs=False):
+        return Reducer(self.outputs + reducer2.outputs)
+
+    def output_names(self, bands):
+        if len(self.outputs) == 1:
+            return list(bands)
+        return [f'{band}_{output}' for band in bands for output in self.outputs]
+
+
+class Date(ComputedObject):
+    def __init__(self, date):
+        self.date = _to_date(date)
+
+    def format(self, pattern=None):
+        # Only 'YYYY-MM-dd' is used
+        return _Lazy(lambda: self.date.isoformat() if self.date else None)
+
+    def _evaluate(self):
+        return {'type': 'Date', 'value': self.date.isoformat() if self.date else None}
+
+def _to_date(value):
+    if value is None or isinstance(value, datetime.date):
+        return value
+    if isinstance(value, Date):
+        return value.date
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+class Image(ComputedObject):
+    def __init__(self, source=None, bands=None, date=None):
+        if isinstance(source, Image):
+            bands = source.bands
+        elif isinstance(source, str):
+            bands = DATASET_BANDS.get(source, ['b1'])
+        self.bands = list(bands if bands is not None else ['constant'])
+        self._date = date
+
+    def date(self):
+        return Date(self._date)
+
+    def _same(self, *args, **kwargs):
+        return Image(bands=self.bands)
+
+    clip = updateMask = multiply = subtract = divide = add = bitwiseAnd = eq = gt = And = Or = unmask = toFloat = _same
+
+    def select(self, names, *args):
+        names = [names] if isinstance(names, (str, int)) else list(names)
+        # Band indexes select by position
+        return Image(bands=[self.bands[name] if isinstance(name, int) else name for name in names])
+
+    def rename(self, *names):
+        return Image(bands=list(names[0]) if len(names) == 1 and isinstance(names[0], list) else list(names))
+
+    def normalizedDifference(self, bands=None):
+        return Image(bands=['nd'])
+
+    def expression(self, *args, **kwargs):
+        return Image(bands=['constant'])
+
+    def addBands(self, other, *args, **kwargs):
+        return Image(bands=self.bands + other.bands)
+
+    def visualize(self, **kwargs):
+        return Image(bands=['vis-red', 'vis-green', 'vis-blue'])
+
+    def reduceRegion(self, reducer=None, geometry=None, **kwargs):
+        names = reducer.output_names(self.bands)
+        return Dictionary(lambda: {name: _band_value(name) for name in names})
+
+    def reduceRegions(self, collection=None, reducer=None, **kwargs):
+        names = reducer.output_names(self.bands)
+        return FeatureCollection([
+            feature.set({name: _Lazy(lambda name=name: _band_value(name)) for name in names})
+            for feature in collection.features
+        ])
+
+    def getMapId(self, vis_params=None):
+        _round_trip('getMapId')
+        map_id = f'projects/fake/maps/{random.getrandbits(64):016x}'
+        return {'mapid': map_id, 'token': '', 'tile_fetcher': TileFetcher(map_id)}
+
+
+class Terrain:
+    @staticmethod
+    def slope(image):
+        return Image(bands=['slope'])
+
+
+class TileFetcher:
+    # 1x1 transparent PNG
+    TILE = bytes.fromhex(
+        '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+        '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+    )
+
+    def __init__(self, map_id):
+        self.url_format = f'https://earthengine.fake/v1/{map_id}/tiles/{{z}}/{{x}}/{{y}}'
+
+    def fetch_tile(self, x, y, z):
+        _round_trip('fetch_tile')
+        return self.TILE
+
+
+class ImageCollection(ComputedObject):
+    def __init__(self, source=None, bands=None, window=None):
+        if bands is None and isinstance(source, list):
+            bands = source[0].bands if source else []
+        self.bands = list(bands if bands is not None else DATASET_BANDS.get(source, ['b1']))
+        self.window = window    # (start, end) dates of filterDate
+
+    def _same(self, *args, **kwargs):
+        return ImageCollection(bands=self.bands, window=self.window)
+
+    filterBounds = filter = sort = limit = _same
+
+    def filterDate(self, start, end=None):
+        start = _to_date(start)
+        end = _to_date(end) if end is not None else start + datetime.timedelta(days=1)
+        return ImageCollection(bands=self.bands, window=(start, end))
+
+    def select(self, names, *args):
+        return ImageCollection(bands=[names] if isinstance(names, str) else list(names), window=self.window)
+
+    def map(self, func):
+        result = func(Image(bands=self.bands))
+        if isinstance(result, Feature):
+            return FeatureCollection(func(Image(bands=self.bands, date=day)) for day in self.scene_dates())
+        return ImageCollection(bands=result.bands, window=self.window)
+
+    def scene_dates(self):
+        """One scene every SCENE_INTERVAL_DAYS over the filterDate window (none without one)"""
+        if self.window is None:
+            return []
+        start, end = self.window
+        return [start + datetime.timedelta(days=offset)
+                for offset in range(0, (end - start).days, SCENE_INTERVAL_DAYS)]
+
+    def _composite(self):
+        return Image(bands=self.bands)
+
+    median = mean = sum = max = min = count = mosaic = first = _composite
+
+    def reduce(self, reducer):
+        return Image(bands=reducer.output_names(self.bands))
+
+
+class Feature(ComputedObject):
+    def __init__(self, geometry=None, properties=None):
+        self._geometry = geometry if isinstance(geometry, Geometry) else Geometry(geometry) if geometry else None
+        self.properties = dict(properties or {})
+
+    def geometry(self):
+        return self._geometry
+
+    def set(self, *args):
+        properties = args[0] if len(args) == 1 else {args[0]: args[1]}
+        return Feature(self._geometry, {**self.properties, **properties})
+
+    def _evaluate(self):
+        return {'type': 'Feature', 'geometry': None, 'properties': _evaluate(self.properties)}
+
+
+class FeatureCollection(ComputedObject):
+    def __init__(self, features):
+        self.features = list(features)
+
+    def geometry(self):
+        boxes = [f.geometry().bbox for f in self.features if f.geometry() is not None]
+        return Geometry(bbox=[min(b[0] for b in boxes), min(b[1] for b in boxes),
+                              max(b[2] for b in boxes), max(b[3] for b in boxes)])
+
+    def map(self, func):
+        return FeatureCollection(func(feature) for feature in self.features)
+
+    def filter(self, *args):
+        return FeatureCollection(self.features)
+
+    def reduceColumns(self, reducer, selectors, *args):
+        rows = List([[feature.properties.get(name) for name in selectors] for feature in self.features])
+        return Dictionary({reducer.outputs[0]: rows})
+
+    def select(self, propertySelectors, newProperties=None, retainGeometry=True):
+        keep = set(propertySelectors)
+        return FeatureCollection(
+            Feature(None, {k: v for k, v in f.properties.items() if k in keep}) for f in self.features
+        )
+
+    def _evaluate(self):
+        return {'type': 'FeatureCollection', 'features': [f._evaluate() for f in self.features]}
+
+
+def _compute_pixels(request):
+    """ee.data.computePixels with fileFormat NUMPY_NDARRAY: one float32 field per band"""
+    import numpy as np
+    _round_trip('computePixels')
+    dimensions = request['grid']['dimensions']
+    bands = request['expression'].bands
+    pixels = np.zeros((dimensions['height'], dimensions['width']), dtype=[(band, '<f4') for band in bands])
+    for band in bands:
+        low, high = next((r for prefix, r in VALUE_RANGES if band.startswith(prefix)), (0.0, 1.0))
+        pixels[band] = np.random.uniform(low, high, pixels.shape)
+    return pixels
+
+data = types.SimpleNamespace(computePixels=_compute_pixels)
+
+
+# Graph templates (graph_templates.py) need the real serializer; these names only
+# exist so that module can be imported
+class _Unsupported:
+    def __getattr__(self, name):
+        raise EEException("fake_ee does not support serialized graph templates")
+
+class CustomFunction:
+    @staticmethod
+    def variable(*args, **kwargs):
+        raise EEException("fake_ee does not support serialized graph templates")
+
+serializer = _Unsupported()
+encodable = types.SimpleNamespace(Encodable=object)
@@ -0,0 +1,232 @@
+import collections
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# ==========================================
+# EARTH ENGINE REQUEST SCHEDULER
+# ==========================================
+# Every GEE round trip made by gee_service (getInfo, getMapId, tile fetches)
+# goes through SCHEDULER. It keeps the project inside its Earth Engine quotas
+# (concurrent requests and a token bucket for the request rate), serves the
+# waiting calls by priority lane, and retries quota and transient errors with
+# exponential backoff and full jitter.
+
+# Priority lanes, highest first. A call takes the lane of the request (or job)
+# it belongs to; see set_lane().
+LANES = ('interactive', 'dashboard', 'batch')
+DEFAULT_LANE = 'batch'
+
+# Match these to the Cloud project's Earth Engine quota
+GEE_MAX_CONCURRENT = int(os.environ.get('GAIAEYE_GEE_MAX_CONCURRENT', 40))
+GEE_REQUESTS_PER_SECOND = float(os.environ.get('GAIAEYE_GEE_REQUESTS_PER_SECOND', 100))
+GEE_BURST = int(os.environ.get('GAIAEYE_GEE_BURST', 40))
+
+# Retries of quota / transient errors: delay = uniform(0, min(cap, base * 2^attempt))
+GEE_MAX_RETRIES = 4
+GEE_BACKOFF_BASE_SECONDS = 0.5
+GEE_BACKOFF_CAP_SECONDS = 8.0
+
+# Lower-cased fragments of Earth Engine / HTTP error messages worth retrying
+QUOTA_ERROR_MARKERS = (
+    'too many concurrent', 'too many requests', 'quota', 'rate limit', 'resource_exhausted',
+    'resource exhausted', 'httperror 429'
+)
+TRANSIENT_ERROR_MARKERS = (
+    'unavailable', 'backend error', 'internal error', 'temporarily', 'connection reset',
+    'connection aborted', 'httperror 50'
+)
+
+
+class GeeUnavailable(Exception):
+    """Earth Engine kept refusing a call (quota or transient errors) after every retry"""
+    retry_after_seconds = int(GEE_BACKOFF_CAP_SECONDS)
+
+
+class QueueTimeout(Exception):
+    """No quota slot freed up before the caller's time ran out"""
+
+
+def is_quota_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in QUOTA_ERROR_MARKERS)
+
+def is_retryable(error):
+    """Quota errors, transient server errors and dropped connections"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if type(error).__name__ not in ('EEException', 'HttpError'):
+        return False
+    message = str(error).lower()
+    return is_quota_error(error) or any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry (0-based)"""
+    return random.uniform(0, min(GEE_BACKOFF_CAP_SECONDS, GEE_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class GeeScheduler:
+    """
+    Admits calls when a concurrency slot and a rate token are both free.
+    Waiting calls are served strictly by lane (LANES order), first come first
+    served within a lane.
+    """
+    def __init__(self, max_concurrent, requests_per_second, burst, lanes=LANES):
+        self.max_concurrent = max_concurrent
+        self.rate = requests_per_second
+        self.burst = burst
+        self.lanes = tuple(lanes)
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._active = 0
+        self._waiting = {lane: collections.deque() for lane in self.lanes}
+        self._cond = threading.Condition()
+        self.admitted = {lane: 0 for lane in self.lanes}
+        self.retries = 0
+        self.gave_up = 0
+
+    def run(self, func, lane=None, operation='gee', time_left=None):
+        """
+        Call func() inside a slot, retrying quota and transient errors.
+        time_left() returns the seconds the caller may still wait (None: no limit);
+        when it runs out in the queue, QueueTimeout is raised.
+        Raises GeeUnavailable once the retries are used up.
+        """
+        lane = lane or current_lane()
+        for attempt in range(GEE_MAX_RETRIES + 1):
+            self.acquire(lane, time_left)
+            try:
+                return func()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt == GEE_MAX_RETRIES:
+                    with self._cond:
+                        self.gave_up += 1
+                    raise GeeUnavailable(f"Earth Engine unavailable after {attempt + 1} attempts: {e}") from e
+                delay = backoff_delay(attempt)
+                print(f"GEE {operation} failed ({e}), retrying in {delay:.2f}s")
+                with self._cond:
+                    self.retries += 1
+                metrics.RETRIES.inc(operation=f'gee_{operation}')
+            finally:
+                self.release()
+
+            limit = time_left() if time_left else None
+            time.sleep(delay if limit is None else max(0.0, min(delay, limit)))
+
+    def acquire(self, lane, time_left=None):
+        """Block until this call may start; records the queue wait"""
+        started = time.perf_counter()
+        ticket = object()
+        with self._cond:
+            queue = self._waiting[lane]
+            queue.append(ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._is_next(ticket, lane) and self._active < self.max_concurrent:
+                        self._refill()
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            self._active += 1
+                            self.admitted[lane] += 1
+                            break
+                        wait = (1 - self._tokens) / self.rate
+                    limit = time_left() if time_left else None
+                    if limit is not None:
+                        if limit <= 0:
+                            raise QueueTimeout(f"Timed out waiting for an Earth Engine slot ({lane})")
+                        wait = limit if wait is None else min(wait, limit)
+                    self._cond.wait(wait)
+            finally:
+                queue.remove(ticket)
+                # The next caller in line may be able to go now
+                self._cond.notify_all()
+
+        waited = time.perf_counter() - started
+        metrics.GEE_QUEUE_WAIT_SECONDS.observe(waited, lane=lane)
+        metrics.record_timing('gee_queue', waited)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _is_next(self, ticket, lane):
+        # Caller holds the lock
+        for name in self.lanes:
+            if self._waiting[name]:
+                return name == lane and self._waiting[name][0] is ticket
+        return False
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'max_concurrent': self.max_concurrent,
+                'requests_per_second': self.rate,
+                'queued': {lane: len(queue) for lane, queue in self._waiting.items()},
+                'admitted': dict(self.admitted),
+                'retries': self.retries,
+                'gave_up': self.gave_up
+            }
+
+
+# --- PRIORITY LANE OF THE CURRENT REQUEST ---
+
+_current_lane = contextvars.ContextVar('gee_lane', default=DEFAULT_LANE)
+
+def set_lane(lane):
+    """Lane for the GEE calls of the current request (pool threads see it through contextvars.copy_context)"""
+    if lane not in LANES:
+        raise ValueError(f"lane must be one of {list(LANES)}")
+    _current_lane.set(lane)
+
+@contextlib.contextmanager
+def lane_scope(lane):
+    """Run the block's GEE calls in the given lane"""
+    if lane not in LANES:
+        raise ValueError(f"lane must be one of {list(LANES)}")
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+def current_lane():
+    return _current_lane.get()
+
+
+SCHEDULER = GeeScheduler(GEE_MAX_CONCURRENT, GEE_REQUESTS_PER_SECOND, GEE_BURST)
+
+# --- SHARED WORKER POOLS ---
+# Fan-out of GEE round trips (concurrent getMapId calls, unbatched dashboard
+# stages, change detection periods, export blocks, proxied tiles) runs on
+# GEE_POOL, speculative prefetch on BACKGROUND_POOL. Together they hold
+# GEE_MAX_CONCURRENT threads: more could only wait for a slot in SCHEDULER.
+# Request threads (the server's, asgi.EXECUTOR, job workers) wait on these pools.
+# A task on a pool must never wait for another task of the same pool.
+BACKGROUND_WORKERS = 2
+GEE_POOL = ThreadPoolExecutor(max_workers=max(1, GEE_MAX_CONCURRENT - BACKGROUND_WORKERS),
+                              thread_name_prefix='gee-worker')
+BACKGROUND_POOL = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='gee-background')
+
+metrics.register(metrics.Gauge(
+    'gaiaeye_gee_queue_depth', 'GEE calls waiting for a quota slot by lane', ('lane',),
+    lambda: {(lane,): depth for lane, depth in SCHEDULER.stats()['queued'].items()}
+))
+metrics.register(metrics.Gauge(
+    'gaiaeye_gee_in_flight', 'GEE calls currently running', (), lambda: {(): SCHEDULER.stats()['active']}
+))
@@ -1,11 +1,29 @@
 import ee
+import contextlib
+import contextvars
 import datetime
+import math
+import os
+import threading
+import time
+import weakref
+import concurrent.futures
+import numpy as np
+
+import local_engine
+import metrics
+from gee_scheduler import SCHEDULER, GEE_POOL, QueueTimeout
+from cache import ResultCache, DashboardStore, SeriesStore
+from graph_templates import TemplateRegistry
 
 # ==========================================
 # CONFIGURATION
 # ==========================================
 GEE_PROJECT_ID = 'ee-mohamed-projet' 
 
+# Local persistent state (SQLite caches and stores)
+DATA_DIR = os.environ.get('GAIAEYE_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
 INDICATORS_CONFIG = {
     # --- VEGETATION & AGRI (Sentinel-2) ---
     'NDVI': {'type': 'S2', 'name': 'NDVI (Vegetation)', 'vis': {'min': 0, 'max': 0.8, 'palette': ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850']}},
@@ -32,7 +50,103 @@ INDICATORS_CONFIG = {
     'SAR':  {'type': 'S1', 'name': 'SAR Radar (VV)', 'vis': {'min': -25, 'max': 0, 'palette': ['black', 'white']}},
 }
 
-def initialize_gee():
+# --- LAYER RESULT CACHE (/api/analyze) ---
+# Requests are normalized before lookup: bbox edges are snapped outward to this grid (degrees)
+CACHE_GRID_DEG = 0.001
+# ...and dates are snapped to the revisit period of the source (days). None = static dataset.
+REVISIT_DAYS = {'S2': 5, 'S1': 6, 'MODIS': 8, 'CHIRPS': 5, 'DEM': None}
+# Native pixel size (meters) by source type
+SOURCE_SCALES = {'S2': 10, 'S1': 10, 'MODIS': 1000, 'CHIRPS': 5000, 'DEM': 30}
+# GEE map IDs are short-lived; cached entries must expire before the map ID does
+MAP_ID_LIFETIME_SECONDS = 4 * 3600
+MAP_ID_SAFETY_MARGIN_SECONDS = 15 * 60
+LAYER_CACHE_MAX_ENTRIES = 512
+
+LAYER_CACHE = ResultCache(
+    max_entries=LAYER_CACHE_MAX_ENTRIES,
+    ttl_seconds=MAP_ID_LIFETIME_SECONDS - MAP_ID_SAFETY_MARGIN_SECONDS
+)
+
+# Layer pipelines and the batched dashboard reductions are serialized once per
+# shape (see graph_templates); requests only substitute ROI, dates and scales.
+# Each template is compiled on its own, but their nodes go through the request's
+# serializer, so layers encoded in one graph still share the ROI and S2 composite
+# as composite_scope() does for rebuilt graphs (tests/test_graph_templates.py)
+GRAPH_TEMPLATES = True
+TEMPLATES = TemplateRegistry()
+
+def gee_get_info(obj, stage):
+    """obj.getInfo(), counted and timed as one GEE round trip of the given stage"""
+    return gee_request('getInfo', stage, obj.getInfo)
+
+def gee_request(method, stage, func):
+    """
+    Run one GEE round trip func() through the quota scheduler (priority lane of the
+    current request, retries with backoff); each attempt is counted and timed.
+    """
+    def attempt():
+        check_deadline()
+        with metrics.gee_call(method, stage):
+            return func()
+
+    try:
+        return SCHEDULER.run(attempt, operation=method, time_left=remaining_time)
+    except QueueTimeout:
+        check_deadline()
+        raise
+
+# --- REQUEST DEADLINES ---
+# A serving mode (see asgi.py) may give a request a deadline. GEE round trips
+# started after it has passed fail with DeadlineExceeded, and concurrent stages
+# still waiting for a worker are cancelled. Without a deadline nothing changes.
+
+class DeadlineExceeded(Exception):
+    pass
+
+class Deadline:
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+        self.exceeded = False
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+_request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+def set_deadline(deadline):
+    """Apply a Deadline to the current context (pool threads see it through contextvars.copy_context)"""
+    _request_deadline.set(deadline)
+
+def remaining_time():
+    """Seconds left before the current request's deadline, or None without one"""
+    deadline = _request_deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+def check_deadline():
+    deadline = _request_deadline.get()
+    if deadline is not None and deadline.remaining() <= 0:
+        deadline.exceeded = True
+        raise DeadlineExceeded("Request deadline exceeded")
+
+def run_concurrently(tasks):
+    """
+    Run {name: callable} on GEE_POOL and return {name: result}.
+    The first failure, or the request deadline passing, cancels the tasks that have not started.
+    """
+    futures = {
+        name: GEE_POOL.submit(contextvars.copy_context().run, func)
+        for name, func in tasks.items()
+    }
+    try:
+        return {name: future.result(timeout=remaining_time()) for name, future in futures.items()}
+    except concurrent.futures.TimeoutError:
+        check_deadline()
+        raise
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+def initialize_gee(allow_authenticate=True):
     try:
         if GEE_PROJECT_ID and GEE_PROJECT_ID != 'your-project-id-here':
             print(f"Initializing GEE with project: {GEE_PROJECT_ID}")
@@ -41,55 +155,369 @@ def initialize_gee():
             ee.Initialize()
     except Exception as e:
         print(f"GEE Initialization failed: {e}")
+        if not allow_authenticate:
+            raise RuntimeError(f"GEE Initialization failed (run authenticate.bat): {e}")
         try:
             ee.Authenticate()
             ee.Initialize()
         except Exception as e2:
             raise RuntimeError(f"Auth failed: {e2}")
 
+# --- BACKGROUND INITIALIZATION ---
+# The API starts without waiting for Earth Engine: initialize_gee() runs on a
+# daemon thread, requests that need EE wait for it (wait_for_gee), and a failed
+# attempt is retried after GEE_INIT_RETRY_SECONDS.
+
+GEE_INIT_RETRY_SECONDS = 30
+
+_gee_init_lock = threading.Lock()
+_gee_init_done = threading.Event()
+_gee_status = {'state': 'not_started', 'error': None, 'started_at': None, 'finished_at': None}
+
+_gee_ready_callbacks = []
+
+def on_gee_ready(func):
+    """Run func() on the initialization thread once Earth Engine is ready (e.g. cache warmup)"""
+    _gee_ready_callbacks.append(func)
+
+def start_gee_initialization(allow_authenticate=False):
+    """
+    Initialize Earth Engine on a background thread unless that is already done or under way.
+    Returns True if a new attempt was started.
+    """
+    with _gee_init_lock:
+        state = _gee_status['state']
+        if state in ('initializing', 'ready'):
+            return False
+        if state == 'failed' and time.time() - _gee_status['finished_at'] < GEE_INIT_RETRY_SECONDS:
+            return False
+        _gee_status.update(state='initializing', error=None, started_at=time.time(), finished_at=None)
+        _gee_init_done.clear()
+
+    def run():
+        try:
+            initialize_gee(allow_authenticate)
+        except Exception as e:
+            print(f"Background GEE initialization failed: {e}")
+            with _gee_init_lock:
+                _gee_status.update(state='failed', error=str(e), finished_at=time.time())
+            _gee_init_done.set()
+            return
+        with _gee_init_lock:
+            _gee_status.update(state='ready', finished_at=time.time())
+        _gee_init_done.set()
+        for callback in _gee_ready_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"GEE ready callback failed: {e}")
+
+    threading.Thread(target=run, name='gee-init', daemon=True).start()
+    return True
+
+def wait_for_gee(timeout=None):
+    """Start initialization if needed and wait up to timeout seconds; True once EE is usable"""
+    start_gee_initialization()
+    _gee_init_done.wait(timeout)
+    return gee_status()['state'] == 'ready'
+
+def gee_status():
+    """{'state': 'not_started' | 'initializing' | 'ready' | 'failed', 'error', 'started_at', 'finished_at'}"""
+    with _gee_init_lock:
+        return dict(_gee_status)
+
+# --- CACHE WARMUP ---
+
+_warmup_lock = threading.Lock()
+_warmup_status = {'state': 'idle', 'rois': 0, 'layers': 0, 'dashboards': 0, 'errors': [], 'seconds': None}
+
+def warm_caches(rois, indicators=('NDVI',), dashboard=True, crop_type='wheat'):
+    """
+    Pre-compute the layer map IDs (LAYER_CACHE) and stored dashboards (DASHBOARD_STORE)
+    of hot ROIs, compiling their graph templates on the way, so the first user requests
+    hit warm caches. Each ROI is {'north', 'south', 'east', 'west'} plus optional
+    'date_start', 'date_end' and 'crop_type'; missing dates use the API defaults.
+    """
+    started = time.perf_counter()
+    with _warmup_lock:
+        _warmup_status.update(state='running', rois=len(rois), layers=0, dashboards=0, errors=[], seconds=None)
+
+    for roi in rois:
+        try:
+            coords = {side: float(roi[side]) for side in ('north', 'south', 'east', 'west')}
+        except (KeyError, TypeError, ValueError) as e:
+            with _warmup_lock:
+                _warmup_status['errors'].append(f"Invalid ROI {roi}: {e}")
+            continue
+        date_start, date_end = roi.get('date_start'), roi.get('date_end')
+
+        tile_urls, errors = get_indicator_layers(coords, date_start, date_end, indicators)
+        with _warmup_lock:
+            _warmup_status['layers'] += len(tile_urls)
+            _warmup_status['errors'].extend(f"{ind}: {error}" for ind, error in errors.items())
+
+        if dashboard:
+            try:
+                get_dashboard_metrics(coords, date_start, date_end, roi.get('crop_type', crop_type), 500)
+                with _warmup_lock:
+                    _warmup_status['dashboards'] += 1
+            except Exception as e:
+                print(f"Dashboard warmup failed for {coords}: {e}")
+                with _warmup_lock:
+                    _warmup_status['errors'].append(f"dashboard: {e}")
+
+    with _warmup_lock:
+        _warmup_status.update(state='done', seconds=round(time.perf_counter() - started, 2))
+        print(f"Cache warmup done: {_warmup_status['layers']} layers, "
+              f"{_warmup_status['dashboards']} dashboards in {_warmup_status['seconds']}s")
+
+def warmup_status():
+    with _warmup_lock:
+        return {**_warmup_status, 'errors': list(_warmup_status['errors'])}
+
 def get_indicator_layer(coords, date_start=None, date_end=None, indicator='NDVI'):
-    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
-    
+    map_id = get_indicator_map_id(coords, date_start, date_end, indicator)
+    return map_id['tile_fetcher'].url_format
+
+def get_indicator_layers(coords, date_start=None, date_end=None, indicators=('NDVI',)):
+    """
+    Tile URLs for several indicators in one call.
+    Indicators of the same source type share their collection work through
+    composite_scope(), and the getMapId round trips run concurrently on GEE_POOL.
+    Returns (tile_urls, errors), both keyed by uppercased indicator.
+    """
+    indicators = list(dict.fromkeys(ind.upper() for ind in indicators))
+    with composite_scope():
+        futures = {
+            ind: GEE_POOL.submit(
+                contextvars.copy_context().run, get_indicator_map_id, coords, date_start, date_end, ind
+            )
+            for ind in indicators
+        }
+        tile_urls, errors = {}, {}
+        try:
+            for ind, future in futures.items():
+                try:
+                    tile_urls[ind] = future.result(timeout=remaining_time())['tile_fetcher'].url_format
+                except concurrent.futures.TimeoutError:
+                    check_deadline()
+                    raise
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    print(f"Error processing {ind}: {e}")
+                    errors[ind] = str(e)
+        finally:
+            for future in futures.values():
+                future.cancel()
+    return tile_urls, errors
+
+# Compute backends selectable per request: 'gee' (Earth Engine) or 'local'
+# (NumPy engine over local_engine.LOCAL_ARCHIVE_DIR, Sentinel-2 indices only)
+COMPUTE_BACKENDS = ('gee', 'local')
+
+def get_local_indicator_stats(coords, date_start=None, date_end=None, indicator='NDVI'):
+    """Indicator statistics from the local raster engine (the local stand-in for a tile layer)"""
+    indicator = indicator.upper()
     if not date_end: date_end = datetime.date.today().strftime('%Y-%m-%d')
     if not date_start: date_start = (datetime.date.today() - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+    return local_engine.indicator_stats(coords, date_start, date_end, indicator, max_cloud=20)
 
-    indicator = indicator.upper()
-    config = INDICATORS_CONFIG.get(indicator, INDICATORS_CONFIG['NDVI'])
+def get_indicator_map_id(coords, date_start=None, date_end=None, indicator='NDVI', use_cache=True):
+    """Return the GEE map ID for a layer, served from LAYER_CACHE when possible"""
+    coords, date_start, date_end, indicator = normalize_layer_request(coords, date_start, date_end, indicator)
+    if not use_cache:
+        return compute_indicator_map_id(coords, date_start, date_end, indicator)
+
+    key = layer_cache_key(coords, date_start, date_end, indicator)
+    for hook in _layer_lookup_hooks:
+        hook(key)
+    return LAYER_CACHE.get_or_compute(
+        key, lambda: compute_indicator_map_id(coords, date_start, date_end, indicator)
+    )
+
+def on_layer_lookup(func):
+    """Call func(key) with the LAYER_CACHE key of every cached layer lookup (e.g. prefetch accounting)"""
+    _layer_lookup_hooks.append(func)
+
+_layer_lookup_hooks = []
+
+def fetch_indicator_tile(coords, date_start, date_end, indicator, z, x, y):
+    """
+    Raw tile bytes for a layer through the EE tile fetcher.
+    If the cached map ID has expired, it is dropped from LAYER_CACHE and re-minted once.
+    """
+    coords, date_start, date_end, indicator = normalize_layer_request(coords, date_start, date_end, indicator)
+    key = layer_cache_key(coords, date_start, date_end, indicator)
+
+    for attempt in range(2):
+        map_id = get_indicator_map_id(coords, date_start, date_end, indicator)
+        try:
+            return gee_request('fetch_tile', indicator,
+                               lambda: map_id['tile_fetcher'].fetch_tile(x=x, y=y, z=z))
+        except ee.EEException as e:
+            if attempt:
+                raise
+            print(f"Tile fetch failed for {indicator} ({e}), re-minting map ID")
+            metrics.RETRIES.inc(operation='tile_fetch')
+            LAYER_CACHE.invalidate(key)
+
+def layer_id(coords, date_start, date_end, indicator):
+    """Stable string id of a normalized layer request (used as the tile store layer name)"""
+    coords, date_start, date_end, indicator = normalize_layer_request(coords, date_start, date_end, indicator)
+    return '|'.join(str(part) for part in layer_cache_key(coords, date_start, date_end, indicator))
+
+def compute_indicator_map_id(coords, date_start, date_end, indicator):
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+
+    # Metric labels only ever take INDICATORS_CONFIG keys
+    indicator = indicator_key(indicator)
+    config = INDICATORS_CONFIG[indicator]
     dtype = config['type']
     
     print(f"Processing {indicator} ({dtype}) from {date_start} to {date_end}")
 
+    with metrics.INDICATOR_SECONDS.time(f'layer.{indicator}', indicator=indicator):
+        image = layer_image(roi, date_start, date_end, indicator)
+        return gee_request('getMapId', indicator, lambda: image.getMapId(config['vis']))
+
+def layer_image(roi, date_start, date_end, indicator):
+    """build_indicator_image(), through its graph template when GRAPH_TEMPLATES is on"""
+    if GRAPH_TEMPLATES:
+        dtype = INDICATORS_CONFIG.get(indicator, INDICATORS_CONFIG['NDVI'])['type']
+        values = {'roi': roi} if dtype == 'DEM' else {'roi': roi, 'start': date_start, 'end': date_end}
+        return ee.Image(indicator_template(indicator).image(**values))
+    return ee.Image(build_indicator_image(roi, date_start, date_end, indicator))
+
+def build_indicator_image(roi, date_start, date_end, indicator):
+    """The clipped layer image for an indicator (before visualization)"""
+    config = INDICATORS_CONFIG.get(indicator, INDICATORS_CONFIG['NDVI'])
+    dtype = config['type']
     image = None
 
+    # Source images are memoized in the active composite_scope(), so indicators of the
+    # same type (e.g. ELEVATION and SLOPE) reuse one collection
     if dtype == 'S2':
         image = get_sentinel2_image(roi, date_start, date_end, indicator)
     elif dtype == 'S1':
-        image = get_sentinel1_image(roi, date_start, date_end)
+        image = scoped_source(('S1', roi, date_start, date_end), lambda: get_sentinel1_image(roi, date_start, date_end))
     elif dtype == 'MODIS':
-        image = get_modis_image(roi, date_start, date_end)
+        image = scoped_source(('MODIS', roi, date_start, date_end), lambda: get_modis_image(roi, date_start, date_end))
     elif dtype == 'CHIRPS':
-        image = get_chirps_image(roi, date_start, date_end)
+        image = scoped_source(('CHIRPS', roi, date_start, date_end), lambda: get_chirps_image(roi, date_start, date_end))
     elif dtype == 'DEM':
-        image = get_dem_image(roi)
+        image = scoped_source(('DEM', roi), lambda: get_dem_image(roi))
+        if indicator == 'SLOPE':
+            image = ee.Terrain.slope(image)
 
     if not image:
         raise ValueError("Could not generate image")
 
-    # Clip and Visualize
-    image = image.clip(roi)
-    map_id = ee.Image(image).getMapId(config['vis'])
-    return map_id['tile_fetcher'].url_format
+    # Clip (visualization is applied by getMapId)
+    return image.clip(roi)
+
+# --- SERIALIZED GRAPH TEMPLATES ---
+
+def indicator_template(indicator):
+    """Compiled build_indicator_image() pipeline, one per INDICATORS_CONFIG entry"""
+    if INDICATORS_CONFIG.get(indicator, INDICATORS_CONFIG['NDVI'])['type'] == 'DEM':
+        return compile_template(
+            ('layer', indicator), lambda roi: build_indicator_image(roi, None, None, indicator), {'roi': 'Geometry'}
+        )
+    return compile_template(
+        ('layer', indicator),
+        lambda roi, start, end: build_indicator_image(roi, start, end, indicator),
+        {'roi': 'Geometry', 'start': None, 'end': None}
+    )
+
+def dashboard_template(plan):
+    """
+    Compiled build_dashboard_reductions() for plans with the same parameter names.
+    Parameters: roi, start, end, moisture_start, moisture_end and '<stage>_<param>' for every plan entry.
+    """
+    shape = tuple((stage, tuple(sorted(params))) for stage, params in sorted(plan.items()))
+
+    def build(roi, start, end, moisture_start, moisture_end, **values):
+        placeholder_plan = {
+            stage: {name: values[f'{stage}_{name}'] for name in names} for stage, names in shape
+        }
+        return build_dashboard_reductions(roi, start, end, placeholder_plan, (moisture_start, moisture_end))
+
+    params = {'roi': 'Geometry', 'start': None, 'end': None, 'moisture_start': None, 'moisture_end': None}
+    params.update({f'{stage}_{name}': None for stage, names in shape for name in names})
+    return compile_template(('dashboard', shape), build, params)
+
+def dashboard_template_values(roi, start, end, plan):
+    moisture_start, moisture_end = soil_moisture_window()
+    values = {'roi': roi, 'start': start, 'end': end,
+              'moisture_start': moisture_start, 'moisture_end': moisture_end}
+    values.update({f'{stage}_{name}': value for stage, params in plan.items() for name, value in params.items()})
+    return values
+
+def compile_template(key, build, params):
+    # Built in an empty context so placeholder composites never land in a caller's composite_scope()
+    def isolated(**placeholders):
+        def run():
+            with composite_scope():
+                return build(**placeholders)
+        return contextvars.Context().run(run)
+    return TEMPLATES.get(key, isolated, params)
+
+# --- REQUEST NORMALIZATION ---
+
+def indicator_key(indicator):
+    """The INDICATORS_CONFIG key for a requested indicator name (any case); ValueError if there is none"""
+    key = str(indicator).upper()
+    if key not in INDICATORS_CONFIG:
+        raise ValueError(f"Unknown indicator {indicator!r}; must be one of {sorted(INDICATORS_CONFIG)}")
+    return key
+
+def normalize_layer_request(coords, date_start, date_end, indicator):
+    """Snap a layer request onto the cache grid so near-identical requests share a result"""
+    indicator = indicator_key(indicator)
+    config = INDICATORS_CONFIG[indicator]
+
+    if not date_end: date_end = datetime.date.today().strftime('%Y-%m-%d')
+    if not date_start: date_start = (datetime.date.today() - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+
+    coords = {
+        'north': snap_coordinate(coords['north'], CACHE_GRID_DEG, up=True),
+        'south': snap_coordinate(coords['south'], CACHE_GRID_DEG, up=False),
+        'east': snap_coordinate(coords['east'], CACHE_GRID_DEG, up=True),
+        'west': snap_coordinate(coords['west'], CACHE_GRID_DEG, up=False)
+    }
+
+    period = REVISIT_DAYS.get(config['type'])
+    if config['type'] == 'DEM':
+        # Static dataset: the window does not change the image
+        date_start, date_end = None, None
+    elif period:
+        date_start = snap_date(date_start, period, up=False)
+        date_end = snap_date(date_end, period, up=True)
+
+    return coords, date_start, date_end, indicator
+
+def layer_cache_key(coords, date_start, date_end, indicator):
+    return (indicator, coords['west'], coords['south'], coords['east'], coords['north'], date_start, date_end)
+
+def snap_coordinate(value, grid, up):
+    """Snap a coordinate outward to the grid so the snapped bbox still covers the request"""
+    steps = value / grid
+    steps = math.ceil(steps - 1e-9) if up else math.floor(steps + 1e-9)
+    return round(steps * grid, 9)
+
+def snap_date(value, period_days, up):
+    """Snap a YYYY-MM-DD date to a period boundary (floor for starts, ceil for ends)"""
+    day = datetime.date.fromisoformat(str(value)[:10]).toordinal()
+    offset = day % period_days
+    if offset:
+        day = day + (period_days - offset) if up else day - offset
+    return datetime.date.fromordinal(day).strftime('%Y-%m-%d')
 
 # --- DATA SOURCE HANDLERS ---
 
 def get_sentinel2_image(roi, start, end, indicator):
-    s2 = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") \
-           .filterBounds(roi) \
-           .filterDate(start, end) \
-           .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20)) \
-           .map(mask_s2_clouds)
-    
-    composite = s2.median()
+    composite = s2_composite(roi, start, end, max_cloud=20)
     
     if indicator == 'NDVI': return composite.normalizedDifference(['B8', 'B4'])
     if indicator == 'NDWI': return composite.normalizedDifference(['B3', 'B8'])
@@ -131,6 +559,7 @@ def get_chirps_image(roi, start, end):
     return chirps.select('precipitation').sum()
 
 def get_dem_image(roi):
+    """NASADEM elevation (m); SLOPE layers derive ee.Terrain.slope (degrees) from it"""
     dem = ee.Image("NASA/NASADEM_HGT/001").select('elevation')
     return dem 
 
@@ -139,6 +568,61 @@ def mask_s2_clouds(image):
     mask = qa.bitwiseAnd(1<<10).eq(0).And(qa.bitwiseAnd(1<<11).eq(0))
     return image.updateMask(mask).divide(10000)
 
+# --- SENTINEL-2 COMPOSITE REGISTRY ---
+# Within a composite_scope() (one request or job) the masked S2 collection and its
+# median are built once per (ROI, window, cloud threshold) and shared by every
+# S2 indicator and dashboard stage that asks for them. Other source images
+# (S1, MODIS, CHIRPS, DEM) are memoized the same way through scoped_source().
+
+_active_composites = contextvars.ContextVar('s2_composites', default=None)
+_registry_lock = threading.RLock()
+
+@contextlib.contextmanager
+def composite_scope():
+    """Share S2 composites between everything built inside the block; nested scopes reuse the outer one"""
+    if _active_composites.get() is not None:
+        yield
+        return
+    token = _active_composites.set({})
+    try:
+        yield
+    finally:
+        _active_composites.reset(token)
+
+def scoped_source(key, build):
+    """Build a source image once per composite_scope(); without a scope, always build"""
+    registry = _active_composites.get()
+    if registry is None:
+        return build()
+    # Pool threads of get_indicator_layers() share the same registry
+    with _registry_lock:
+        if key not in registry:
+            registry[key] = build()
+        return registry[key]
+
+def s2_collection(roi, start, end, max_cloud=20):
+    """Cloud-masked COPERNICUS/S2_SR_HARMONIZED collection for the window"""
+    return _s2_entry(roi, start, end, max_cloud)['collection']
+
+def s2_composite(roi, start, end, max_cloud=20):
+    """Median of s2_collection()"""
+    entry = _s2_entry(roi, start, end, max_cloud)
+    with _registry_lock:
+        if entry['median'] is None:
+            entry['median'] = entry['collection'].median()
+        return entry['median']
+
+def _s2_entry(roi, start, end, max_cloud):
+    def build():
+        collection = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") \
+                       .filterBounds(roi) \
+                       .filterDate(start, end) \
+                       .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud)) \
+                       .map(mask_s2_clouds)
+        return {'collection': collection, 'median': None}
+
+    return scoped_source(('S2', roi, str(start), str(end), max_cloud), build)
+
 # ==========================================
 # AGRICULTURAL DASHBOARD FUNCTIONS
 # ==========================================
@@ -151,30 +635,238 @@ CROP_YIELDS = {
     'soybean': {'base_yield': 3.2, 'price_per_ton': 450}
 }
 
-def calculate_dashboard_metrics(coords, date_start, date_end, crop_type, input_costs):
+# Dashboard evaluation mode. When True, every reduction is packed into one
+# server-side ee.Dictionary and fetched with a single getInfo() round trip;
+# when False, each stage issues its own getInfo() as before.
+DASHBOARD_BATCHED = True
+
+# --- DASHBOARD RESULT STORE (persistent, stale-while-revalidate) ---
+DASHBOARD_CACHE_PATH = os.environ.get('GAIAEYE_DASHBOARD_CACHE', os.path.join(DATA_DIR, 'dashboard_cache.sqlite'))
+DASHBOARD_CACHE_TTL_SECONDS = 6 * 3600            # fresh for 6h, then refreshed in the background
+DASHBOARD_CACHE_MAX_STALE_SECONDS = 7 * 24 * 3600  # never serve anything older than a week
+
+DASHBOARD_STORE = DashboardStore(
+    DASHBOARD_CACHE_PATH,
+    ttl_seconds=DASHBOARD_CACHE_TTL_SECONDS,
+    max_stale_seconds=DASHBOARD_CACHE_MAX_STALE_SECONDS
+)
+
+def get_dashboard_metrics(coords, date_start, date_end, crop_type, input_costs, backend='gee'):
     """
-    Calculate comprehensive agricultural metrics from GEE data
+    Dashboard metrics served from DASHBOARD_STORE.
+    Only the satellite stages are cached, under a key without the crop; the crop's
+    yield, financial, irrigation and fertilization blocks are re-derived on every
+    call, so changing input_costs or crop_type never hits GEE.
+    Returns (stats, cache_status) where cache_status is 'hit', 'stale' or 'miss'.
     """
+    date_start, date_end = resolve_dashboard_window(date_start, date_end)
+    stages, status = get_dashboard_stages(coords, date_start, date_end, crop_type, backend)
+
     roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
-    
+    stats = assemble_dashboard_metrics(stages, roi, date_start, date_end, crop_type, input_costs)
+    return stats, status
+
+def get_dashboard_stages(coords, date_start, date_end, crop_type, backend='gee'):
+    """
+    The satellite stages of a resolved dashboard window through DASHBOARD_STORE: (stages, cache_status).
+    crop_type is only used to score a miss; assemble_dashboard_metrics() rescores the yield for the crop.
+    """
+    key = dashboard_cache_key(coords, date_start, date_end, backend)
+
+    def compute():
+        roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+        return evaluate_dashboard_stages(
+            roi, date_start, date_end, crop_type, plan=reduction_plan(coords), backend=backend, coords=coords
+        )
+
+    cached = DASHBOARD_STORE.get(key)
+    if cached is None:
+        stages = compute()
+        DASHBOARD_STORE.put(key, stages)
+        return stages, 'miss'
+
+    stages, is_stale = cached
+    if is_stale:
+        DASHBOARD_STORE.refresh_in_background(key, compute)
+    return stages, 'stale' if is_stale else 'hit'
+
+def dashboard_cache_key(coords, date_start, date_end, backend='gee'):
+    key = f"{roi_cache_key(coords)}|{date_start}|{date_end}"
+    return key if backend == 'gee' else f"{key}|{backend}"
+
+def roi_cache_key(coords):
+    return ','.join(f"{coords[k]:.6f}" for k in ('west', 'south', 'east', 'north'))
+
+def resolve_dashboard_window(date_start, date_end):
+    """Fill in the default 90-day dashboard window"""
     if not date_end: date_end = datetime.date.today().strftime('%Y-%m-%d')
     if not date_start: date_start = (datetime.date.today() - datetime.timedelta(days=90)).strftime('%Y-%m-%d')
-    
-    # Calculate area in hectares
-    area_m2 = roi.area().getInfo()
-    area_ha = area_m2 / 10000
-    
-    # 1. Productivity Index (based on NDVI integral)
-    productivity = calculate_productivity_index(roi, date_start, date_end, crop_type)
-    
-    # 2. Weather Risk Analysis
-    weather_risk = calculate_weather_risk(roi, date_start, date_end)
-    
-    # 3. Pest Risk (based on temperature and humidity proxies)
-    pest_risk = calculate_pest_risk(roi, date_start, date_end)
-    
-    # 4. Soil Health Proxies
-    soil_health = calculate_soil_proxies(roi)
+    return date_start, date_end
+
+def calculate_dashboard_metrics(coords, date_start, date_end, crop_type, input_costs, batched=None, backend='gee'):
+    """
+    Calculate comprehensive agricultural metrics from GEE data
+    """
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    date_start, date_end = resolve_dashboard_window(date_start, date_end)
+
+    stages = evaluate_dashboard_stages(
+        roi, date_start, date_end, crop_type, batched, plan=reduction_plan(coords), backend=backend, coords=coords
+    )
+    return assemble_dashboard_metrics(stages, roi, date_start, date_end, crop_type, input_costs)
+
+def iter_progressive_dashboard(coords, date_start, date_end, crop_type, input_costs, backend='gee'):
+    """
+    Progressive dashboard: yields a quick coarse-scale estimate, then the native-resolution result.
+    The coarse pass is skipped when the result is already stored or would use the same scales.
+    Each item is {'stage': 'coarse' | 'final', 'stats': ..., 'cache': ...}.
+    """
+    date_start, date_end = resolve_dashboard_window(date_start, date_end)
+    key = dashboard_cache_key(coords, date_start, date_end, backend)
+
+    coarse_plan = reduction_plan(coords, COARSE_PIXEL_BUDGET)
+    if (backend == 'gee' and coarse_plan != reduction_plan(coords) and not DASHBOARD_STORE.contains(key)
+            and not precomputed_covers(coords, date_start, date_end)):
+        roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+        stages = evaluate_dashboard_stages(roi, date_start, date_end, crop_type, plan=coarse_plan)
+        stats = assemble_dashboard_metrics(stages, roi, date_start, date_end, crop_type, input_costs)
+        yield {'stage': 'coarse', 'stats': stats, 'cache': None}
+
+    stats, cache_status = get_dashboard_metrics(coords, date_start, date_end, crop_type, input_costs, backend)
+    yield {'stage': 'final', 'stats': stats, 'cache': cache_status}
+
+def evaluate_dashboard_stages(roi, date_start, date_end, crop_type, batched=None, plan=None,
+                              backend='gee', coords=None):
+    """
+    Run the satellite-backed stages (the only part that talks to GEE).
+    plan maps stage -> reduceRegion parameters (see reduction_plan); None keeps native scales.
+    backend='local' computes the Sentinel-2 stages with local_engine (needs coords).
+    """
+    if batched is None:
+        batched = DASHBOARD_BATCHED
+    if plan is None:
+        plan = native_reduction_plan()
+
+    with composite_scope(), metrics.DASHBOARD_STAGE_SECONDS.time('dashboard.satellite', stage='satellite'):
+        if backend == 'local':
+            stages = _evaluate_local_dashboard_stages(roi, coords, date_start, date_end, crop_type, plan)
+        else:
+            stages = None
+            if coords is not None:
+                stages = precomputed_stages(coords, date_start, date_end, crop_type, plan)
+            if stages is None:
+                stages = _evaluate_dashboard_stages(roi, date_start, date_end, crop_type, batched, plan)
+    stages.setdefault('reduction_scales', {stage: params['scale'] for stage, params in plan.items()})
+    return stages
+
+# --- PRECOMPUTED STAGE SOURCES ---
+# Modules that can answer the dashboard stages without reducing the ROI live
+# (grid_service) register here; the first one with an answer wins.
+
+def register_stage_source(stages, covers):
+    """
+    stages(coords, date_start, date_end, crop_type, plan) returns the stages or None;
+    covers(coords, date_start, date_end) tells beforehand whether it would answer.
+    """
+    _stage_sources.append((stages, covers))
+
+_stage_sources = []
+
+def precomputed_stages(coords, date_start, date_end, crop_type, plan):
+    for stages, _ in _stage_sources:
+        result = stages(coords, date_start, date_end, crop_type, plan)
+        if result is not None:
+            return result
+    return None
+
+def precomputed_covers(coords, date_start, date_end):
+    return any(covers(coords, date_start, date_end) for _, covers in _stage_sources)
+
+def _evaluate_dashboard_stages(roi, date_start, date_end, crop_type, batched, plan):
+    if batched:
+        # Single round trip: area, NDVI, LST, rainfall and NDMI in one dictionary
+        values = gee_get_info(dashboard_reductions(roi, date_start, date_end, plan), 'dashboard_batch')
+        return score_dashboard_values(values, crop_type)
+    else:
+        def timed(stage, func, *args):
+            def run():
+                with metrics.DASHBOARD_STAGE_SECONDS.time(stage=stage):
+                    return func(*args)
+            return run
+
+        # Independent stages, one or two getInfo() each, evaluated concurrently
+        results = run_concurrently({
+            # Area in m2
+            'area': timed('area', gee_get_info, roi.area(), 'area'),
+            # 1. Productivity Index (based on NDVI integral)
+            'productivity': timed('productivity', calculate_productivity_index,
+                                  roi, date_start, date_end, crop_type, plan['ndvi']),
+            # 2. Weather Risk Analysis
+            'weather_risk': timed('weather_risk', calculate_weather_risk, roi, date_start, date_end, plan),
+            # 3. Pest Risk (based on temperature and humidity proxies)
+            'pest_risk': timed('pest_risk', calculate_pest_risk, roi, date_start, date_end, plan['lst']),
+            # 4. Soil Health Proxies
+            'soil_health': timed('soil_health', calculate_soil_proxies, roi, plan['ndmi'])
+        })
+        area_m2 = results['area']
+        productivity = results['productivity']
+        weather_risk = results['weather_risk']
+        pest_risk = results['pest_risk']
+        soil_health = results['soil_health']
+
+    return {
+        'area_ha': area_m2 / 10000,
+        'productivity': productivity,
+        'weather_risk': weather_risk,
+        'pest_risk': pest_risk,
+        'soil_health': soil_health
+    }
+
+def dashboard_reductions(roi, date_start, date_end, plan):
+    """build_dashboard_reductions(), through its graph template when GRAPH_TEMPLATES is on"""
+    if GRAPH_TEMPLATES:
+        return dashboard_template(plan).dictionary(**dashboard_template_values(roi, date_start, date_end, plan))
+    return build_dashboard_reductions(roi, date_start, date_end, plan)
+
+def score_dashboard_values(values, crop_type):
+    """Stage results from the values of a batched dashboard reduction"""
+    return {
+        'area_ha': values['area_m2'] / 10000,
+        'productivity': score_productivity(values['ndvi'].get('NDVI', 0.5), crop_type),
+        'weather_risk': score_weather_risk(values['lst'], values['rain']),
+        'pest_risk': score_pest_risk(values['lst'].get('LST_Day_1km_mean', 20)),
+        'soil_health': score_soil_proxies(values['ndmi'].get('nd', 0.3))
+    }
+
+def _evaluate_local_dashboard_stages(roi, coords, date_start, date_end, crop_type, plan):
+    # NDVI and NDMI come from the local archive; MODIS LST and CHIRPS rainfall are
+    # not in it, so area, LST and rainfall still take one (batched) GEE round trip
+    values = gee_get_info(ee.Dictionary({
+        'area_m2': roi.area(),
+        'lst': reduce_lst_stats(roi, date_start, date_end, plan['lst']),
+        'rain': reduce_rain_stats(roi, date_start, date_end, plan['rain'])
+    }), 'dashboard_batch')
+
+    today = datetime.date.today()
+    with metrics.DASHBOARD_STAGE_SECONDS.time('dashboard.local_engine', stage='local_engine'):
+        ndvi = local_engine.mean_ndvi(coords, date_start, date_end)
+        ndmi = local_engine.mean_ndmi(coords, today - datetime.timedelta(days=60), today)
+
+    return {
+        'area_ha': values['area_m2'] / 10000,
+        'productivity': score_productivity(0.5 if ndvi is None else ndvi, crop_type),
+        'weather_risk': score_weather_risk(values['lst'], values['rain']),
+        'pest_risk': score_pest_risk(values['lst'].get('LST_Day_1km_mean', 20)),
+        'soil_health': score_soil_proxies(0.3 if ndmi is None else ndmi)
+    }
+
+def assemble_dashboard_metrics(stages, roi, date_start, date_end, crop_type, input_costs):
+    """Derive the pure-Python blocks from the stage results and build the response"""
+    area_ha = stages['area_ha']
+    # Stored stages may have been scored for another crop
+    productivity = productivity_for_crop(stages['productivity'], crop_type)
+    weather_risk = stages['weather_risk']
+    soil_health = stages['soil_health']
     
     # 5. Financial Analysis
     financial = calculate_financial_metrics(
@@ -187,42 +879,209 @@ def calculate_dashboard_metrics(coords, date_start, date_end, crop_type, input_c
     # 7. Fertilization Recommendations
     fertilization = generate_fertilization_recommendations(soil_health, productivity)
     
-    return {
+    stats = {
         'area_hectares': round(area_ha, 2),
         'productivity_index': productivity,
         'weather_risk': weather_risk,
-        'pest_risk': pest_risk,
+        'pest_risk': stages['pest_risk'],
         'soil_health': soil_health,
         'financial': financial,
         'irrigation': irrigation,
         'fertilization': fertilization,
-        'crop_type': crop_type
+        'crop_type': crop_type,
+        'reduction_scales': stages.get('reduction_scales', {})
     }
+    if 'source' in stages:
+        stats['source'] = stages['source']
+    return stats
 
-def calculate_productivity_index(roi, start, end, crop_type):
-    """Calculate expected yield based on NDVI time series"""
-    s2 = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") \
-           .filterBounds(roi) \
-           .filterDate(start, end) \
-           .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20)) \
-           .map(mask_s2_clouds)
+def build_dashboard_reductions(roi, start, end, plan=None, moisture_window=None):
+    """Build every dashboard reduction into one server-side ee.Dictionary"""
+    plan = plan or native_reduction_plan()
+    moisture_start, moisture_end = moisture_window or soil_moisture_window()
+    # The LST reduction is shared: weather risk reads mean/max, pest risk reads the mean
+    return ee.Dictionary({
+        'area_m2': roi.area(),
+        'ndvi': reduce_mean_ndvi(roi, start, end, plan['ndvi']),
+        'lst': reduce_lst_stats(roi, start, end, plan['lst']),
+        'rain': reduce_rain_stats(roi, start, end, plan['rain']),
+        'ndmi': reduce_soil_moisture(roi, plan['ndmi'], moisture_start, moisture_end)
+    })
+
+# --- ADAPTIVE REDUCTION PARAMETERS ---
+
+# Native resolution (m) of the data behind each dashboard stage
+NATIVE_SCALES = {'ndvi': 10, 'lst': 1000, 'rain': 5000, 'ndmi': 10}
+# Target pixel count per reduceRegion; larger ROIs are reduced at a coarser scale
+REDUCTION_PIXEL_BUDGET = 1e7
+# Pixel budget of the quick first pass in progressive mode
+COARSE_PIXEL_BUDGET = 1e5
+EARTH_RADIUS_M = 6371008.8
+
+def estimate_area_m2(coords):
+    """Spherical area of a lat/lon bbox, computed client-side (no round trip)"""
+    d_lon = math.radians(abs(coords['east'] - coords['west']))
+    d_sin_lat = abs(math.sin(math.radians(coords['north'])) - math.sin(math.radians(coords['south'])))
+    return EARTH_RADIUS_M ** 2 * d_lon * d_sin_lat
+
+def reduction_params(area_m2, native_scale, pixel_budget=REDUCTION_PIXEL_BUDGET):
+    """reduceRegion scale/tileScale/bestEffort for an ROI of area_m2 and a pixel budget"""
+    if area_m2 / native_scale ** 2 <= pixel_budget:
+        scale = native_scale
+    else:
+        scale = math.ceil(math.sqrt(area_m2 / pixel_budget))
+
+    # Spread large reductions over more, smaller tiles to stay inside per-tile memory
+    pixels = area_m2 / scale ** 2
+    if pixels < 1e6:
+        tile_scale = 1
+    elif pixels < 5e6:
+        tile_scale = 2
+    else:
+        tile_scale = 4
+
+    return {
+        'scale': scale,
+        'tileScale': tile_scale,
+        'bestEffort': scale > native_scale,
+        'maxPixels': 1e9
+    }
+
+def reduction_plan(coords, pixel_budget=REDUCTION_PIXEL_BUDGET):
+    """Reduction parameters for every dashboard stage, chosen from the ROI area"""
+    area_m2 = estimate_area_m2(coords)
+    return {stage: reduction_params(area_m2, native, pixel_budget) for stage, native in NATIVE_SCALES.items()}
+
+def native_reduction_plan():
+    """The fixed native-resolution parameters used before adaptive scaling"""
+    return {stage: {'scale': native, 'maxPixels': 1e9} for stage, native in NATIVE_SCALES.items()}
+
+# --- SERVER-SIDE STAT IMAGES ---
+# Shared by the single-ROI reductions below and by the batch (reduceRegions) path
+
+def mean_ndvi_image(roi, start, end):
+    """Per-pixel mean of the masked S2 NDVI time series (band 'NDVI')"""
+    s2 = s2_collection(roi, start, end, max_cloud=20)
     
     # Calculate NDVI time series
     def calc_ndvi(img):
         return img.normalizedDifference(['B8', 'B4']).rename('NDVI')
     
-    ndvi_collection = s2.map(calc_ndvi)
+    return s2.map(calc_ndvi).mean()
+
+def lst_stats_image(roi, start, end):
+    """Per-pixel mean and max MODIS LST in Celsius (bands 'LST_Day_1km_mean', 'LST_Day_1km_max')"""
+    modis = ee.ImageCollection('MODIS/006/MOD11A2') \
+              .filterBounds(roi) \
+              .filterDate(start, end)
+    
+    def to_celsius(img):
+        return img.select('LST_Day_1km').multiply(0.02).subtract(273.15)
+    
+    return modis.map(to_celsius).reduce(ee.Reducer.mean().combine(
+        ee.Reducer.max(), '', True
+    ))
+
+def rain_stats_image(roi, start, end):
+    """Per-pixel CHIRPS rainfall sum and mean (bands 'precipitation_sum', 'precipitation_mean')"""
+    chirps = ee.ImageCollection('UCSB-CHG/CHIRPS/PENTAD') \
+               .filterBounds(roi) \
+               .filterDate(start, end)
+    
+    return chirps.select('precipitation').reduce(
+        ee.Reducer.sum().combine(ee.Reducer.mean(), '', True)
+    )
+
+def soil_moisture_window():
+    """The last 60 days, as used by the NDMI soil proxy"""
+    today = datetime.date.today()
+    return (today - datetime.timedelta(days=60)).strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+
+def ndmi_image(roi, start=None, end=None):
+    """NDMI median composite of [start, end), by default the last 60 days (band 'nd')"""
+    if start is None:
+        start, end = soil_moisture_window()
+    # Use Sentinel-2 bands as soil proxies
+    s2 = s2_composite(roi, start, end, max_cloud=10)
     
-    # Get mean NDVI
-    mean_ndvi = ndvi_collection.mean().reduceRegion(
+    # Calculate soil indices
+    # NDMI (moisture)
+    return s2.normalizedDifference(['B8', 'B11'])
+
+# --- SERVER-SIDE REDUCTIONS ---
+
+def reduce_mean_ndvi(roi, start, end, params=None):
+    """Mean NDVI over the window (ee.Dictionary with key 'NDVI')"""
+    return mean_ndvi_image(roi, start, end).reduceRegion(
+        reducer=ee.Reducer.mean(),
+        geometry=roi,
+        **(params or native_reduction_plan()['ndvi'])
+    )
+
+def reduce_lst_stats(roi, start, end, params=None):
+    """Mean and max MODIS LST in Celsius (keys 'LST_Day_1km_mean', 'LST_Day_1km_max')"""
+    return lst_stats_image(roi, start, end).reduceRegion(
+        reducer=ee.Reducer.mean(),
+        geometry=roi,
+        **(params or native_reduction_plan()['lst'])
+    )
+
+def reduce_rain_stats(roi, start, end, params=None):
+    """CHIRPS rainfall sum and mean (keys 'precipitation_sum', 'precipitation_mean')"""
+    return rain_stats_image(roi, start, end).reduceRegion(
+        reducer=ee.Reducer.mean(),
+        geometry=roi,
+        **(params or native_reduction_plan()['rain'])
+    )
+
+def reduce_soil_moisture(roi, params=None, start=None, end=None):
+    """Mean NDMI of the last 60 days or [start, end) (ee.Dictionary with key 'nd')"""
+    return ndmi_image(roi, start, end).reduceRegion(
         reducer=ee.Reducer.mean(),
         geometry=roi,
-        scale=10,
-        maxPixels=1e9
-    ).getInfo()
+        **(params or native_reduction_plan()['ndmi'])
+    )
+
+# --- PER-STAGE EVALUATION (one getInfo() each) ---
+
+def calculate_productivity_index(roi, start, end, crop_type, params=None):
+    """Calculate expected yield based on NDVI time series"""
+    mean_ndvi = gee_get_info(reduce_mean_ndvi(roi, start, end, params), 'productivity')
+    return score_productivity(mean_ndvi.get('NDVI', 0.5), crop_type)
+
+def calculate_weather_risk(roi, start, end, plan=None):
+    """Analyze weather patterns for risk assessment"""
+    plan = plan or native_reduction_plan()
+    temp_stats = gee_get_info(reduce_lst_stats(roi, start, end, plan['lst']), 'weather_lst')
+    rain_stats = gee_get_info(reduce_rain_stats(roi, start, end, plan['rain']), 'weather_rain')
+    return score_weather_risk(temp_stats, rain_stats)
+
+def calculate_pest_risk(roi, start, end, params=None):
+    """Estimate pest risk based on environmental conditions"""
+    # Use temperature and humidity proxies
+    modis = ee.ImageCollection('MODIS/006/MOD11A2') \
+              .filterBounds(roi) \
+              .filterDate(start, end)
     
-    ndvi_value = mean_ndvi.get('NDVI', 0.5)
+    temp_mean = modis.select('LST_Day_1km').mean().multiply(0.02).subtract(273.15) \
+                     .reduceRegion(
+                         reducer=ee.Reducer.mean(),
+                         geometry=roi,
+                         **(params or native_reduction_plan()['lst'])
+                     )
+    temp_mean = gee_get_info(temp_mean, 'pest_risk')
     
+    return score_pest_risk(temp_mean.get('LST_Day_1km', 20))
+
+def calculate_soil_proxies(roi, params=None):
+    """Estimate soil properties using satellite proxies"""
+    stats = gee_get_info(reduce_soil_moisture(roi, params), 'soil_health')
+    return score_soil_proxies(stats.get('nd', 0.3))
+
+# --- SCORING (pure Python on reduced values) ---
+
+def score_productivity(ndvi_value, crop_type):
+    """Convert a mean NDVI into the productivity block"""
     # Calculate yield estimate
     crop_params = CROP_YIELDS.get(crop_type, CROP_YIELDS['wheat'])
     
@@ -246,39 +1105,14 @@ def calculate_productivity_index(roi, start, end, crop_type):
         'yield_factor': round(yield_factor, 2)
     }
 
-def calculate_weather_risk(roi, start, end):
-    """Analyze weather patterns for risk assessment"""
-    # Temperature analysis (MODIS LST)
-    modis = ee.ImageCollection('MODIS/006/MOD11A2') \
-              .filterBounds(roi) \
-              .filterDate(start, end)
-    
-    def to_celsius(img):
-        return img.select('LST_Day_1km').multiply(0.02).subtract(273.15)
-    
-    temp_stats = modis.map(to_celsius).reduce(ee.Reducer.mean().combine(
-        ee.Reducer.max(), '', True
-    )).reduceRegion(
-        reducer=ee.Reducer.mean(),
-        geometry=roi,
-        scale=1000,
-        maxPixels=1e9
-    ).getInfo()
-    
-    # Rainfall analysis (CHIRPS)
-    chirps = ee.ImageCollection('UCSB-CHG/CHIRPS/PENTAD') \
-               .filterBounds(roi) \
-               .filterDate(start, end)
-    
-    rain_stats = chirps.select('precipitation').reduce(
-        ee.Reducer.sum().combine(ee.Reducer.mean(), '', True)
-    ).reduceRegion(
-        reducer=ee.Reducer.mean(),
-        geometry=roi,
-        scale=5000,
-        maxPixels=1e9
-    ).getInfo()
-    
+def productivity_for_crop(productivity, crop_type):
+    """A productivity block with the expected yield of crop_type (the NDVI part is crop-independent)"""
+    crop_params = CROP_YIELDS.get(crop_type, CROP_YIELDS['wheat'])
+    return {**productivity,
+            'expected_yield_tons_ha': round(crop_params['base_yield'] * productivity['yield_factor'], 2)}
+
+def score_weather_risk(temp_stats, rain_stats):
+    """Convert LST and rainfall reductions into the weather risk block"""
     avg_temp = temp_stats.get('LST_Day_1km_mean', 25)
     max_temp = temp_stats.get('LST_Day_1km_max', 30)
     total_rain = rain_stats.get('precipitation_sum', 100)
@@ -298,23 +1132,8 @@ def calculate_weather_risk(roi, start, end):
         'overall_risk': overall_risk
     }
 
-def calculate_pest_risk(roi, start, end):
-    """Estimate pest risk based on environmental conditions"""
-    # Use temperature and humidity proxies
-    modis = ee.ImageCollection('MODIS/006/MOD11A2') \
-              .filterBounds(roi) \
-              .filterDate(start, end)
-    
-    temp_mean = modis.select('LST_Day_1km').mean().multiply(0.02).subtract(273.15) \
-                     .reduceRegion(
-                         reducer=ee.Reducer.mean(),
-                         geometry=roi,
-                         scale=1000,
-                         maxPixels=1e9
-                     ).getInfo()
-    
-    temp = temp_mean.get('LST_Day_1km', 20)
-    
+def score_pest_risk(temp):
+    """Convert a mean temperature into the pest risk block"""
     # Pest risk increases with temperature (20-30°C optimal for many pests)
     if 20 <= temp <= 30:
         risk_score = 0.7
@@ -333,29 +1152,8 @@ def calculate_pest_risk(roi, start, end):
         'recommendation': get_pest_recommendation(risk_level)
     }
 
-def calculate_soil_proxies(roi):
-    """Estimate soil properties using satellite proxies"""
-    # Use Sentinel-2 bands as soil proxies
-    s2 = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") \
-           .filterBounds(roi) \
-           .filterDate(datetime.date.today() - datetime.timedelta(days=60), datetime.date.today()) \
-           .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10)) \
-           .map(mask_s2_clouds) \
-           .median()
-    
-    # Calculate soil indices
-    # NDMI (moisture)
-    ndmi = s2.normalizedDifference(['B8', 'B11'])
-    
-    stats = ndmi.reduceRegion(
-        reducer=ee.Reducer.mean(),
-        geometry=roi,
-        scale=10,
-        maxPixels=1e9
-    ).getInfo()
-    
-    moisture_index = stats.get('nd', 0.3)
-    
+def score_soil_proxies(moisture_index):
+    """Convert a mean NDMI into the soil health block"""
     # Classify soil health
     if moisture_index > 0.4:
         health = 'good'
@@ -393,6 +1191,75 @@ def calculate_financial_metrics(productivity, area_ha, crop_type, input_costs):
         'price_per_ton_usd': crop_params['price_per_ton']
     }
 
+# --- SCENARIO GRID (/api/scenarios) ---
+# The financial block for every crop x input cost x price combination. The
+# satellite stages are evaluated (or read from DASHBOARD_STORE) once; the grid
+# itself is plain array arithmetic and follows calculate_financial_metrics.
+SCENARIO_PRICE_FACTORS = (0.8, 0.9, 1.0, 1.1, 1.2)
+SCENARIO_INPUT_COSTS = tuple(range(200, 1001, 100))
+SCENARIO_MAX_CELLS = 1_000_000
+
+def get_scenario_grid(coords, date_start, date_end, crops, input_costs, price_factors, backend='gee'):
+    """
+    Scenario grid for an ROI: the dashboard stages once, then calculate_scenario_grid().
+    Returns (result, cache_status).
+    """
+    date_start, date_end = resolve_dashboard_window(date_start, date_end)
+    # Only the crop-independent yield factor and area are used, so any crop's stored stages do
+    stages, status = get_dashboard_stages(coords, date_start, date_end, crops[0], backend)
+
+    with metrics.DASHBOARD_STAGE_SECONDS.time('dashboard.scenarios', stage='scenarios'):
+        grid = calculate_scenario_grid(
+            stages['productivity']['yield_factor'], stages['area_ha'], crops, input_costs, price_factors
+        )
+    result = {
+        'area_hectares': round(stages['area_ha'], 2),
+        'mean_ndvi': stages['productivity']['mean_ndvi'],
+        'yield_factor': stages['productivity']['yield_factor'],
+        **grid
+    }
+    if 'source' in stages:
+        result['source'] = stages['source']
+    return result, status
+
+def calculate_scenario_grid(yield_factor, area_ha, crops, input_costs, price_factors):
+    """
+    calculate_financial_metrics for all combinations at once.
+    input_costs are $/ha; price_factors multiply each crop's price_per_ton.
+    Arrays are indexed [crop][input cost][price factor] (yield and revenue do not
+    depend on the cost, so they drop that axis). The break-even input cost is the
+    $/ha at which the net profit is zero, per crop and price factor.
+    """
+    base_price = np.array([CROP_YIELDS[crop]['price_per_ton'] for crop in crops], dtype=float)
+    costs = np.asarray(input_costs, dtype=float)
+    factors = np.asarray(price_factors, dtype=float)
+
+    # score_productivity's expected_yield_tons_ha, rounded the same way: np.round
+    # disagrees with round() on ties such as 5.5 * 0.85
+    yield_ha = np.array([round(CROP_YIELDS[crop]['base_yield'] * yield_factor, 2) for crop in crops])  # (crops,)
+    prices = base_price[:, None] * factors[None, :]                     # (crops, prices)
+    revenue = (yield_ha * area_ha)[:, None] * prices                    # (crops, prices)
+    total_costs = costs * area_ha                                       # (costs,)
+    net_profit = revenue[:, None, :] - total_costs[None, :, None]       # (crops, costs, prices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(total_costs[None, :, None] > 0, net_profit / total_costs[None, :, None] * 100, 0.0)
+    break_even = yield_ha[:, None] * prices                             # (crops, prices), $/ha
+
+    return {
+        'crops': list(crops),
+        'input_costs': costs.tolist(),
+        'price_factors': factors.tolist(),
+        'prices_per_ton_usd': np.round(prices, 2).tolist(),
+        'expected_yield_total_tons': np.round(yield_ha * area_ha, 2).tolist(),
+        'expected_revenue_usd': np.round(revenue, 2).tolist(),
+        'total_input_costs_usd': np.round(total_costs, 2).tolist(),
+        'net_profit_usd': np.round(net_profit, 2).tolist(),
+        'roi_percent': np.round(roi, 1).tolist(),
+        'break_even_input_costs_usd_ha': {
+            crop: np.round(row, 2).tolist() for crop, row in zip(crops, break_even)
+        }
+    }
+
 def calculate_irrigation_needs(roi, start, end, weather_risk):
     """Generate irrigation recommendations"""
     total_rain = weather_risk['total_rainfall_mm']
@@ -469,3 +1336,269 @@ def get_pest_recommendation(risk_level):
     else:
         return 'Continue routine observation'
 
+# ==========================================
+# BATCH FIELD ANALYTICS
+# ==========================================
+
+# Features evaluated per getInfo(); larger batches are split into chunks of this size
+FIELD_BATCH_CHUNK_SIZE = 500
+# Streaming batches use smaller chunks so the first results arrive within seconds
+FIELD_STREAM_CHUNK_SIZE = 100
+FIELD_GEOMETRY_TYPES = ('Polygon', 'MultiPolygon')
+
+def calculate_field_batch(features, date_start, date_end, crop_type='wheat', input_costs=500):
+    """
+    Score many parcels (GeoJSON Features with Polygon/MultiPolygon geometry).
+    NDVI, NDMI, LST and rainfall are reduced for all features with reduceRegions,
+    one getInfo() per FIELD_BATCH_CHUNK_SIZE features. Results keep the input order.
+    """
+    return list(iter_field_batch(features, date_start, date_end, crop_type, input_costs))
+
+def iter_field_batch(features, date_start, date_end, crop_type='wheat', input_costs=500,
+                     chunk_size=FIELD_BATCH_CHUNK_SIZE):
+    """
+    Generator version of calculate_field_batch for any iterable of features.
+    Only one chunk is held in memory at a time; each result is yielded as soon as
+    its chunk has been reduced. A chunk that fails yields one error entry per feature
+    instead of aborting the whole batch.
+    """
+    date_start, date_end = resolve_dashboard_window(date_start, date_end)
+
+    chunk, offset = [], 0
+    for feature in features:
+        chunk.append(feature)
+        if len(chunk) >= chunk_size:
+            yield from _score_field_chunk(chunk, offset, date_start, date_end, crop_type, input_costs)
+            offset += len(chunk)
+            chunk = []
+    if chunk:
+        yield from _score_field_chunk(chunk, offset, date_start, date_end, crop_type, input_costs)
+
+def _score_field_chunk(chunk, offset, date_start, date_end, crop_type, input_costs):
+    ids = [feature_id(feature, offset + index) if isinstance(feature, dict) else offset + index
+           for index, feature in enumerate(chunk)]
+    valid = [index for index, feature in enumerate(chunk) if is_field_feature(feature)]
+
+    try:
+        values = reduce_field_chunk([chunk[index] for index in valid], date_start, date_end) if valid else {}
+        error = None
+    except Exception as e:
+        print(f"Error reducing field chunk at offset {offset}: {e}")
+        values, error = {}, str(e)
+
+    positions = {index: position for position, index in enumerate(valid)}
+    for index, field_id in enumerate(ids):
+        if index not in positions:
+            yield {'id': field_id, 'error': 'Feature must have a Polygon or MultiPolygon geometry'}
+        elif error is not None:
+            yield {'id': field_id, 'error': error}
+        else:
+            yield score_field(field_id, values.get(positions[index], {}), crop_type, input_costs)
+
+def reduce_field_chunk(features, date_start, date_end):
+    """Reduce all stats for a list of features in one round trip; returns {index: properties}"""
+    fc = ee.FeatureCollection([
+        ee.Feature(ee.Geometry(feature['geometry']), {'fid': index})
+        for index, feature in enumerate(features)
+    ])
+    region = fc.geometry().bounds()
+
+    with composite_scope():
+        s2_stats = mean_ndvi_image(region, date_start, date_end).addBands(ndmi_image(region).rename('NDMI'))
+        lst_stats = lst_stats_image(region, date_start, date_end)
+        rain_stats = rain_stats_image(region, date_start, date_end)
+
+    # Each reduceRegions keeps the properties of its input, so the stats accumulate on one collection
+    reduced = fc.map(lambda f: f.set('area_m2', f.geometry().area()))
+    reduced = s2_stats.reduceRegions(collection=reduced, reducer=ee.Reducer.mean(), scale=10)
+    reduced = lst_stats.reduceRegions(collection=reduced, reducer=ee.Reducer.mean(), scale=1000)
+    reduced = rain_stats.reduceRegions(collection=reduced, reducer=ee.Reducer.mean(), scale=5000)
+
+    info = gee_get_info(reduced.select(
+        ['fid', 'area_m2', 'NDVI', 'NDMI', 'LST_Day_1km_mean', 'LST_Day_1km_max', 'precipitation_sum'],
+        retainGeometry=False
+    ), 'field_chunk')
+    return {f['properties']['fid']: f['properties'] for f in info['features']}
+
+def score_field(field_id, props, crop_type, input_costs):
+    """Run the dashboard scoring helpers on one feature's reduced properties"""
+    def value(key, default):
+        # Fully masked parcels come back without the property (or with null)
+        v = props.get(key)
+        return default if v is None else v
+
+    area_ha = value('area_m2', 0) / 10000
+    productivity = score_productivity(value('NDVI', 0.5), crop_type)
+    weather_risk = score_weather_risk(
+        {'LST_Day_1km_mean': value('LST_Day_1km_mean', 25), 'LST_Day_1km_max': value('LST_Day_1km_max', 30)},
+        {'precipitation_sum': value('precipitation_sum', 100)}
+    )
+    soil_health = score_soil_proxies(value('NDMI', 0.3))
+
+    return {
+        'id': field_id,
+        'area_hectares': round(area_ha, 2),
+        'productivity_index': productivity,
+        'weather_risk': weather_risk,
+        'pest_risk': score_pest_risk(value('LST_Day_1km_mean', 20)),
+        'soil_health': soil_health,
+        'financial': calculate_financial_metrics(productivity, area_ha, crop_type, input_costs),
+        'irrigation': calculate_irrigation_needs(None, None, None, weather_risk),
+        'fertilization': generate_fertilization_recommendations(soil_health, productivity),
+        'crop_type': crop_type
+    }
+
+def feature_id(feature, index):
+    """Caller-supplied id of a GeoJSON feature, falling back to its position"""
+    if feature.get('id') is not None:
+        return feature['id']
+    return (feature.get('properties') or {}).get('id', index)
+
+def is_field_feature(feature):
+    """True for a GeoJSON feature with a polygon geometry"""
+    geometry = feature.get('geometry') if isinstance(feature, dict) else None
+    return bool(geometry) and geometry.get('type') in FIELD_GEOMETRY_TYPES
+
+def validate_field_features(features):
+    """Raise ValueError unless every feature carries a polygon geometry"""
+    for index, feature in enumerate(features):
+        if not is_field_feature(feature):
+            raise ValueError(f"Feature {index} must have a Polygon or MultiPolygon geometry")
+
+# ==========================================
+# NDVI TIME SERIES (incremental)
+# ==========================================
+
+NDVI_SERIES_PATH = os.environ.get('GAIAEYE_SERIES_STORE', os.path.join(DATA_DIR, 'ndvi_series.sqlite'))
+# Scenes can be ingested a few days late, so forward refreshes re-read this many days before the stored end
+NDVI_SERIES_REFETCH_DAYS = 5
+# Longest date range reduced by one getInfo; a larger gap is split into chunks reduced concurrently
+NDVI_SERIES_CHUNK_DAYS = 92
+NDVI_SERIES_PERIODS = ('scene', 'week', 'month')
+
+SERIES_STORE = SeriesStore(NDVI_SERIES_PATH)
+
+# One lock per ROI, so concurrent refreshes of the same series do not race on its coverage
+_series_locks = weakref.WeakValueDictionary()
+_series_locks_guard = threading.Lock()
+
+def series_lock(roi_key):
+    with _series_locks_guard:
+        lock = _series_locks.get(roi_key)
+        if lock is None:
+            lock = _series_locks[roi_key] = threading.Lock()
+        return lock
+
+def get_ndvi_timeseries(coords, date_start=None, date_end=None, period='scene'):
+    """
+    Mean NDVI per scene (or per week / month) for an ROI.
+    Already reduced dates are read from SERIES_STORE; only the parts of the window outside
+    the stored range go to GEE, in chunks of at most NDVI_SERIES_CHUNK_DAYS reduced
+    concurrently. Returns (series, fetched_intervals).
+    """
+    if period not in NDVI_SERIES_PERIODS:
+        raise ValueError(f"period must be one of {NDVI_SERIES_PERIODS}")
+    date_start, date_end = resolve_dashboard_window(date_start, date_end)
+    roi_key = roi_cache_key(coords)
+
+    # Coverage is read and extended under the ROI's lock: a second request for the same
+    # ROI waits and then only fetches what the first one did not
+    with series_lock(roi_key):
+        coverage = SERIES_STORE.coverage(roi_key)
+        missing = missing_series_intervals(coverage, date_start, date_end)
+        if missing:
+            roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+            params = reduction_plan(coords)['ndvi']
+            chunks = [chunk for start, end in missing for chunk in series_chunks(start, end)]
+            scenes = run_concurrently({
+                chunk: lambda chunk=chunk: gee_get_info(ndvi_scene_means(roi, *chunk, params), 'ndvi_series')
+                for chunk in chunks
+            })
+            observations = merge_same_day_scenes(row for rows in scenes.values() for row in rows)
+
+            covered_start = min(date_start, coverage[0]) if coverage else date_start
+            covered_end = max(date_end, coverage[1]) if coverage else date_end
+            SERIES_STORE.merge(roi_key, observations, covered_start, covered_end)
+
+    rows = SERIES_STORE.series(roi_key, date_start, date_end)
+    return aggregate_ndvi_series(rows, period), missing
+
+def missing_series_intervals(coverage, date_start, date_end):
+    """
+    Date ranges [start, end) that still need reducing so that the stored range stays
+    contiguous and includes [date_start, date_end)
+    """
+    if coverage is None:
+        return [(date_start, date_end)]
+
+    covered_start, covered_end = coverage
+    missing = []
+    if date_start < covered_start:
+        missing.append((date_start, covered_start))
+    if date_end > covered_end:
+        refetch_from = (datetime.date.fromisoformat(covered_end)
+                        - datetime.timedelta(days=NDVI_SERIES_REFETCH_DAYS)).strftime('%Y-%m-%d')
+        missing.append((max(refetch_from, covered_start), date_end))
+    return missing
+
+def series_chunks(date_start, date_end, days=None):
+    """[date_start, date_end) split into consecutive ranges of at most days (NDVI_SERIES_CHUNK_DAYS)"""
+    step = datetime.timedelta(days=days or NDVI_SERIES_CHUNK_DAYS)
+    start, end = datetime.date.fromisoformat(date_start), datetime.date.fromisoformat(date_end)
+    chunks = []
+    while start < end:
+        chunk_end = min(start + step, end)
+        chunks.append((start.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d')))
+        start = chunk_end
+    return chunks
+
+def ndvi_scene_means(roi, start, end, params=None):
+    """ee.List of [date, mean NDVI, valid pixel count] for every S2 scene in [start, end)"""
+    # mask_s2_clouds() drops image properties, so the date is read from the raw scene
+    s2 = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") \
+           .filterBounds(roi) \
+           .filterDate(start, end) \
+           .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
+
+    def scene_mean(img):
+        stats = mask_s2_clouds(img).normalizedDifference(['B8', 'B4']).rename('NDVI').reduceRegion(
+            reducer=ee.Reducer.mean().combine(ee.Reducer.count(), '', True),
+            geometry=roi,
+            **(params or native_reduction_plan()['ndvi'])
+        )
+        return ee.Feature(None, {
+            'date': img.date().format('YYYY-MM-dd'),
+            'ndvi': stats.get('NDVI_mean'),
+            'pixels': stats.get('NDVI_count')
+        })
+
+    scenes = s2.map(scene_mean).filter(ee.Filter.notNull(['ndvi']))
+    return scenes.reduceColumns(ee.Reducer.toList(3), ['date', 'ndvi', 'pixels']).get('list')
+
+def merge_same_day_scenes(rows):
+    """Combine granules acquired on the same day into one pixel-weighted observation"""
+    by_date = {}
+    for date, ndvi, pixels in rows:
+        total, count = by_date.get(date, (0.0, 0))
+        by_date[date] = (total + ndvi * pixels, count + pixels)
+    return [(date, total / count, count) for date, (total, count) in sorted(by_date.items()) if count]
+
+def aggregate_ndvi_series(rows, period):
+    """Format stored observations, optionally grouped per ISO week or calendar month"""
+    if period == 'scene':
+        return [{'date': date, 'mean_ndvi': round(ndvi, 4), 'pixels': pixels} for date, ndvi, pixels in rows]
+
+    groups = {}
+    for date, ndvi, pixels in rows:
+        day = datetime.date.fromisoformat(date)
+        if period == 'week':
+            label = (day - datetime.timedelta(days=day.weekday())).strftime('%Y-%m-%d')
+        else:
+            label = day.strftime('%Y-%m-01')
+        total, count, scenes = groups.get(label, (0.0, 0, 0))
+        groups[label] = (total + ndvi * pixels, count + pixels, scenes + 1)
+
+    return [
+        {'date': label, 'mean_ndvi': round(total / count, 4), 'pixels': count, 'scenes': scenes}
+        for label, (total, count, scenes) in sorted(groups.items()) if count
+    ]
@@ -0,0 +1,99 @@
+import math
+import struct
+
+import numpy as np
+
+# ==========================================
+# STREAMING GEOTIFF WRITER
+# ==========================================
+# Single-band float32 GeoTIFFs in EPSG:4326, written as a tiled, uncompressed
+# TIFF. Every tile has a fixed size on disk, so the header (with all tile
+# offsets) can be written before any pixel is known, and the tiles can then be
+# streamed out one by one in row-major order.
+
+TIFF_SHORT, TIFF_LONG, TIFF_ASCII, TIFF_DOUBLE = 3, 4, 2, 12
+TYPE_FORMATS = {TIFF_SHORT: 'H', TIFF_LONG: 'I', TIFF_DOUBLE: 'd'}
+
+# GeoKeyDirectory: version 1.1.0, then (key, location, count, value) for
+# GTModelType = geographic, GTRasterType = pixel is area, GeographicType = WGS 84
+WGS84_GEO_KEYS = (1, 1, 0, 3, 1024, 0, 1, 2, 1025, 0, 1, 1, 2048, 0, 1, 4326)
+
+SAMPLE_BYTES = 4
+MAX_FILE_BYTES = 2 ** 32 - 1
+
+
+def tile_grid(width, height, tile_size):
+    """(tiles_across, tiles_down) covering a width x height raster"""
+    return math.ceil(width / tile_size), math.ceil(height / tile_size)
+
+def tiled_header(width, height, tile_size, pixel_size, west, north, nodata):
+    """
+    Header and IFD of the GeoTIFF; the tiles follow it directly, in row-major order.
+    pixel_size is (x, y) in degrees; (west, north) is the outer corner of the top-left pixel.
+    """
+    if tile_size % 16:
+        raise ValueError("TIFF tile size must be a multiple of 16")
+    across, down = tile_grid(width, height, tile_size)
+    tile_bytes = tile_size * tile_size * SAMPLE_BYTES
+
+    entries = [
+        (256, TIFF_LONG, [width]),                  # ImageWidth
+        (257, TIFF_LONG, [height]),                 # ImageLength
+        (258, TIFF_SHORT, [32]),                    # BitsPerSample
+        (259, TIFF_SHORT, [1]),                     # Compression: none
+        (262, TIFF_SHORT, [1]),                     # PhotometricInterpretation: BlackIsZero
+        (277, TIFF_SHORT, [1]),                     # SamplesPerPixel
+        (284, TIFF_SHORT, [1]),                     # PlanarConfiguration: chunky
+        (322, TIFF_LONG, [tile_size]),              # TileWidth
+        (323, TIFF_LONG, [tile_size]),              # TileLength
+        (324, TIFF_LONG, [0] * (across * down)),    # TileOffsets (filled in below)
+        (325, TIFF_LONG, [tile_bytes] * (across * down)),   # TileByteCounts
+        (339, TIFF_SHORT, [3]),                     # SampleFormat: IEEE float
+        (33550, TIFF_DOUBLE, [*pixel_size, 0.0]),                       # ModelPixelScale
+        (33922, TIFF_DOUBLE, [0.0, 0.0, 0.0, west, north, 0.0]),        # ModelTiepoint
+        (34735, TIFF_SHORT, list(WGS84_GEO_KEYS)),  # GeoKeyDirectory
+        (42113, TIFF_ASCII, f'{nodata:g}'.encode('ascii') + b'\0'),     # GDAL_NODATA
+    ]
+
+    # Layout: 8-byte header, IFD, then the values too large to fit in an entry
+    ifd_size = 2 + 12 * len(entries) + 4
+    extra_offset = 8 + ifd_size
+    extra_size = sum(_padded(len(_pack(kind, values))) for _, kind, values in entries
+                     if len(_pack(kind, values)) > 4)
+    data_offset = extra_offset + extra_size
+    if data_offset + across * down * tile_bytes > MAX_FILE_BYTES:
+        raise ValueError("Raster too large for a classic TIFF (4 GB)")
+    entries[9] = (324, TIFF_LONG, [data_offset + index * tile_bytes for index in range(across * down)])
+
+    ifd = [struct.pack('<H', len(entries))]
+    extra = []
+    for tag, kind, values in entries:
+        packed = _pack(kind, values)
+        count = len(values)
+        if len(packed) <= 4:
+            ifd.append(struct.pack('<HHI', tag, kind, count) + packed.ljust(4, b'\0'))
+        else:
+            ifd.append(struct.pack('<HHII', tag, kind, count, extra_offset))
+            extra.append(packed.ljust(_padded(len(packed)), b'\0'))
+            extra_offset += _padded(len(packed))
+    ifd.append(struct.pack('<I', 0))   # no further IFDs
+
+    return b'II*\0' + struct.pack('<I', 8) + b''.join(ifd) + b''.join(extra)
+
+def encode_tile(block, tile_size, nodata):
+    """Little-endian float32 bytes of one tile; edge blocks are padded with nodata"""
+    block = np.asarray(block, dtype='<f4')
+    if block.shape != (tile_size, tile_size):
+        padded = np.full((tile_size, tile_size), nodata, dtype='<f4')
+        padded[:block.shape[0], :block.shape[1]] = block
+        block = padded
+    return block.tobytes()
+
+def _pack(kind, values):
+    if kind == TIFF_ASCII:
+        return values
+    return struct.pack(f'<{len(values)}{TYPE_FORMATS[kind]}', *values)
+
+def _padded(size):
+    # Out-of-line values start on a word boundary
+    return size + (size & 1)
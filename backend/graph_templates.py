@@ -0,0 +1,208 @@
+import json
+import threading
+
+import ee
+from ee import serializer
+
+# ==========================================
+# COMPUTATION-GRAPH TEMPLATES
+# ==========================================
+# A pipeline (indicator image, dashboard reductions, ...) is built once with
+# placeholder variables for its parameters and serialized to an Earth Engine
+# expression. Requests then encode that expression again with their own
+# parameter values (ROI, dates, scales) instead of rebuilding the Python ee
+# object graph and serializing it node by node.
+
+PLACEHOLDER_PREFIX = '__gaiaeye_'
+
+# Expression nodes whose content is copied as is
+_LEAF_NODES = {'constantValue', 'integerValue', 'bytesValue', 'nullValue'}
+
+
+class GraphTemplate:
+    def __init__(self, build, params):
+        """
+        build(**placeholders) returns the ee object to serialize.
+        params maps parameter name -> EE class name for its placeholder ('Geometry'),
+        or None for plain values (strings, numbers, booleans).
+        """
+        self.params = tuple(params)
+        placeholders = {
+            name: ee.CustomFunction.variable(type_name, PLACEHOLDER_PREFIX + name)
+            for name, type_name in params.items()
+        }
+        expression = serializer.encode(build(**placeholders), for_cloud_api=True)
+        self.result = expression['result']
+        self._values = {name: _expand_constants(node) for name, node in expression['values'].items()}
+        # Encoding the template with its own placeholders must give the expression back;
+        # if the serializer ever emits nodes _fill() does not know, this fails here, not on a request
+        if serializer.encode(TemplateImage(self, placeholders), for_cloud_api=True) != expression:
+            raise ValueError("Graph template does not re-encode to its own expression")
+
+    def check_params(self, values):
+        missing = set(self.params) - set(values)
+        if missing:
+            raise ValueError(f"Missing template parameters: {sorted(missing)}")
+        return {name: values[name] for name in self.params}
+
+    def emit(self, encoder, values, wrappers):
+        """
+        Encode the template through the caller's encoder, as ComputedObject.encode_cloud_value does.
+        Every node and parameter value is handed to the encoder as a value of its own, so the caller's
+        serializer shares equal subtrees (the ROI, an S2 composite used by several templates in one
+        graph) and then optimizes the whole expression, exactly as for a rebuilt object graph.
+        wrappers holds the encodable of each node; the serializer keys objects by id(), so they must
+        live as long as the filled template.
+        """
+        def wrap(node):
+            wrapper = wrappers.get(id(node))
+            if wrapper is None:
+                wrapper = wrappers.setdefault(id(node), _Value(lambda inner: self._fill(node, inner, values, wrap)))
+            return wrapper
+
+        return self._fill(self._values[self.result], encoder, values, wrap)
+
+    def _fill(self, node, encoder, values, wrap):
+        """Copy of an expression node, with its references and placeholders encoded by encoder"""
+        kind, content = _node_kind(node)
+        if kind in _LEAF_NODES:
+            return node
+        if kind == 'valueReference':
+            return {kind: encoder(wrap(self._values[content]))}
+        if kind == 'argumentReference':
+            if content.startswith(PLACEHOLDER_PREFIX):
+                return {'valueReference': encoder(values[content[len(PLACEHOLDER_PREFIX):]])}
+            return node
+
+        def child(item):
+            # A nested node becomes a value of its own again, as the serializer encodes it before optimizing
+            if _node_kind(item)[0] == 'valueReference' or item.get('argumentReference', '').startswith(
+                    PLACEHOLDER_PREFIX):
+                return self._fill(item, encoder, values, wrap)
+            return {'valueReference': encoder(wrap(item))}
+
+        if kind == 'arrayValue':
+            return {kind: {'values': [child(item) for item in content['values']]}}
+        if kind == 'dictionaryValue':
+            return {kind: {'values': {key: child(item) for key, item in content['values'].items()}}}
+        if kind == 'functionDefinitionValue':
+            return {kind: {'argumentNames': content['argumentNames'],
+                           'body': encoder(wrap(self._values[content['body']]))}}
+        if kind == 'functionInvocationValue':
+            invocation = {'arguments': {name: child(item) for name, item in content['arguments'].items()}}
+            if 'functionReference' in content:
+                invocation['functionReference'] = encoder(wrap(self._values[content['functionReference']]))
+            else:
+                invocation['functionName'] = content['functionName']
+            return {kind: invocation}
+        raise ValueError(f"Unexpected expression node in graph template: {kind}")
+
+    def image(self, **values):
+        return TemplateImage(self, self.check_params(values))
+
+    def dictionary(self, **values):
+        return TemplateDictionary(self, self.check_params(values))
+
+
+def _expand_constants(node):
+    """
+    The node with constant lists and dicts written out element by element again, as the serializer
+    encodes them before its optimizer collapses them (the caller's optimizer collapses them again)
+    """
+    kind, content = _node_kind(node)
+    if kind == 'constantValue' and isinstance(content, list):
+        return {'arrayValue': {'values': [_expand_constants({kind: item}) for item in content]}}
+    if kind == 'constantValue' and isinstance(content, dict):
+        return {'dictionaryValue': {'values': {key: _expand_constants({kind: item}) for key, item in content.items()}}}
+    if kind == 'arrayValue':
+        return {kind: {'values': [_expand_constants(item) for item in content['values']]}}
+    if kind == 'dictionaryValue':
+        return {kind: {'values': {key: _expand_constants(item) for key, item in content['values'].items()}}}
+    if kind == 'functionInvocationValue':
+        return {kind: {**content, 'arguments': {
+            name: _expand_constants(item) for name, item in content['arguments'].items()
+        }}}
+    return node
+
+def _node_kind(node):
+    """(kind, content) of a serialized expression node such as {'constantValue': 3}"""
+    if not isinstance(node, dict) or len(node) != 1:
+        raise ValueError(f"Unexpected expression node in graph template: {node!r}")
+    return next(iter(node.items()))
+
+
+class _Value(ee.encodable.Encodable):
+    def __init__(self, encode):
+        self._encode = encode
+
+    def encode(self, encoder):
+        raise NotImplementedError("Graph templates only support the Cloud API encoding")
+
+    def encode_cloud_value(self, encoder):
+        return self._encode(encoder)
+
+
+class _Filled:
+    """ee object encoded from a GraphTemplate and its parameter values (no object graph is built)"""
+    def __init__(self, template, values):
+        ee.ComputedObject.__init__(self, None, None)
+        self.template = template
+        self.values = values
+        self._wrappers = {}
+
+    def isVariable(self):
+        return False
+
+    def encode(self, encoder=None):
+        raise NotImplementedError("Graph templates only support the Cloud API encoding")
+
+    def encode_cloud_value(self, encoder=None):
+        return self.template.emit(encoder, self.values, self._wrappers)
+
+    def _key(self):
+        return json.dumps(serializer.encode(self.values, is_compound=False, for_cloud_api=True), sort_keys=True)
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.template is other.template and self._key() == other._key()
+
+    def __hash__(self):
+        return hash((id(self.template), self._key()))
+
+
+class TemplateImage(_Filled, ee.Image):
+    pass
+
+
+class TemplateDictionary(_Filled, ee.Dictionary):
+    pass
+
+
+class TemplateRegistry:
+    """Compiled templates by key, each built once (thread-safe)"""
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.uses = 0
+
+    def get(self, key, build, params):
+        with self._lock:
+            self.uses += 1
+            template = self._templates.get(key)
+        if template is not None:
+            return template
+
+        template = GraphTemplate(build, params)
+        with self._lock:
+            if key not in self._templates:
+                self._templates[key] = template
+                self.builds += 1
+            return self._templates[key]
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'templates': len(self._templates), 'builds': self.builds, 'uses': self.uses}
@@ -0,0 +1,358 @@
+import datetime
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+# ==========================================
+# PRE-AGGREGATED GRID INDEX
+# ==========================================
+# Monthly per-cell sums and counts of the dashboard quantities, on a lat/lon
+# grid of GRID_CELL_DEG cells with coarser levels of GRID_FACTOR x GRID_FACTOR
+# blocks on top. Each indexed region is one .npz file; grid_service fills it in
+# (build_grid_index) and answers dashboard bboxes from it (grid_dashboard_stages).
+#
+# A bbox is split into the whole finest cells it contains, summed here with as
+# many coarse cells as fit, and the partial cells along its edges.
+
+GRID_CELL_DEG = 0.01        # finest level (~1.1 km)
+GRID_FACTOR = 4             # a level-k cell is GRID_FACTOR^k finest cells across
+GRID_LEVELS = 3             # 0.01, 0.04 and 0.16 degree cells
+
+# Quantities per cell and month (each stored as <name>_sum and <name>_count):
+#   ndvi, lst  - sum and count of valid pixel observations
+#   lst_max    - sum over pixels of the pixel's monthly max LST, pixels counted
+#   rain       - sum over pixels of the pixel's monthly CHIRPS total, pixels counted
+# NDMI is not stored: the dashboard reads it from a rolling 60-day median composite.
+QUANTITIES = ('ndvi', 'lst', 'lst_max', 'rain')
+BANDS = tuple(f'{name}_{stat}' for name in QUANTITIES for stat in ('sum', 'count'))
+
+# Coordinates within this many cells of a grid line are treated as on it
+EDGE_TOLERANCE_CELLS = 1e-6
+
+
+def months_between(date_start, date_end):
+    """'YYYY-MM' of every month overlapping [date_start, date_end)"""
+    start = datetime.date.fromisoformat(str(date_start)[:10])
+    end = datetime.date.fromisoformat(str(date_end)[:10]) - datetime.timedelta(days=1)
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f'{year:04d}-{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def month_bounds(month):
+    """[first day, first day of the next month) of a 'YYYY-MM' month, as ISO strings"""
+    year, number = (int(part) for part in month.split('-'))
+    start = datetime.date(year, number, 1)
+    end = datetime.date(year + 1, 1, 1) if number == 12 else datetime.date(year, number + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+def aligned_region(coords, cell_deg=GRID_CELL_DEG, factor=GRID_FACTOR, levels=GRID_LEVELS):
+    """coords grown to whole coarsest-level cells: (west, south, rows, cols) in finest cells"""
+    block = cell_deg * factor ** (levels - 1)
+    west = math.floor(coords['west'] / block) * block
+    south = math.floor(coords['south'] / block) * block
+    east = math.ceil(coords['east'] / block) * block
+    north = math.ceil(coords['north'] / block) * block
+    return (round(west, 9), round(south, 9),
+            round((north - south) / cell_deg), round((east - west) / cell_deg))
+
+
+class GridRegion:
+    """
+    One indexed region: for each month an array per level of shape
+    (len(BANDS), rows, cols), row 0 being the southernmost.
+    The months and their arrays are replaced together by set_month, so readers
+    working from one snapshot() never see a month without its data.
+    """
+    def __init__(self, name, west, south, rows, cols,
+                 cell_deg=GRID_CELL_DEG, factor=GRID_FACTOR, levels=GRID_LEVELS):
+        self.name = name
+        self.west = west
+        self.south = south
+        self.rows = rows
+        self.cols = cols
+        self.cell_deg = cell_deg
+        self.factor = factor
+        self.levels = levels
+        self.built_at = {}          # month -> unix time
+        # (sorted 'YYYY-MM' months, [array per level with one entry per month])
+        self._snapshot = ([], [np.zeros((0, len(BANDS), rows // factor ** k, cols // factor ** k))
+                               for k in range(levels)])
+
+    @property
+    def months(self):
+        return self._snapshot[0]
+
+    @property
+    def data(self):
+        return self._snapshot[1]
+
+    def snapshot(self):
+        """(months, data) as of now; set_month never modifies either in place"""
+        return self._snapshot
+
+    @property
+    def bounds(self):
+        return {
+            'west': self.west,
+            'south': self.south,
+            'east': round(self.west + self.cols * self.cell_deg, 9),
+            'north': round(self.south + self.rows * self.cell_deg, 9)
+        }
+
+    def contains(self, coords):
+        bounds = self.bounds
+        return (coords['west'] >= bounds['west'] and coords['east'] <= bounds['east'] and
+                coords['south'] >= bounds['south'] and coords['north'] <= bounds['north'])
+
+    def cell_bounds(self, row, col):
+        west = self.west + col * self.cell_deg
+        south = self.south + row * self.cell_deg
+        return [west, south, west + self.cell_deg, south + self.cell_deg]
+
+    def empty_month(self):
+        """Zeroed finest-level array for set_month"""
+        return np.zeros((len(BANDS), self.rows, self.cols))
+
+    def set_month(self, month, level0):
+        """Store a month's finest-level array and derive the coarser levels by block sums"""
+        level0 = np.asarray(level0, dtype=np.float64)
+        if level0.shape != (len(BANDS), self.rows, self.cols):
+            raise ValueError(f"Expected shape {(len(BANDS), self.rows, self.cols)}, got {level0.shape}")
+        levels = [level0]
+        for _ in range(1, self.levels):
+            below = levels[-1]
+            bands, rows, cols = below.shape
+            levels.append(below.reshape(bands, rows // self.factor, self.factor,
+                                        cols // self.factor, self.factor).sum(axis=(2, 4)))
+
+        # Build the new months and arrays aside, then swap them in with one assignment
+        months, data = self._snapshot
+        if month in months:
+            index = months.index(month)
+            new_data = []
+            for k in range(self.levels):
+                array = data[k].copy()
+                array[index] = levels[k]
+                new_data.append(array)
+            new_months = list(months)
+        else:
+            new_months = sorted(months + [month])
+            index = new_months.index(month)
+            new_data = [np.insert(data[k], index, levels[k], axis=0) for k in range(self.levels)]
+        self.built_at[month] = time.time()
+        self._snapshot = (new_months, new_data)
+
+    def whole_cells(self, coords):
+        """Finest-cell range (r0, r1, c0, c1) of the cells lying entirely inside coords"""
+        tol = EDGE_TOLERANCE_CELLS
+        c0 = math.ceil((coords['west'] - self.west) / self.cell_deg - tol)
+        c1 = math.floor((coords['east'] - self.west) / self.cell_deg + tol)
+        r0 = math.ceil((coords['south'] - self.south) / self.cell_deg - tol)
+        r1 = math.floor((coords['north'] - self.south) / self.cell_deg + tol)
+        return r0, max(r0, r1), c0, max(c0, c1)
+
+    def sum_cells(self, months, r0, r1, c0, c1):
+        """
+        Totals of every band over the given months and finest-cell range, using the
+        coarsest whole cells that fit. Returns (totals, cells read per level).
+        """
+        stored, data = self._snapshot
+        indices = [stored.index(month) for month in months]
+        totals = np.zeros(len(BANDS))
+        cells = [0] * self.levels
+        self._sum_range(data, indices, self.levels - 1, r0, r1, c0, c1, totals, cells)
+        return totals, cells
+
+    def cell_values(self, months, band, r0, r1, c0, c1):
+        """Finest-level values of one band, shape (len(months), r1 - r0, c1 - c0)"""
+        stored, data = self._snapshot
+        indices = [stored.index(month) for month in months]
+        return data[0][indices, BANDS.index(band), r0:r1, c0:c1]
+
+    def _sum_range(self, data, indices, level, r0, r1, c0, c1, totals, cells):
+        if r0 >= r1 or c0 >= c1:
+            return
+        size = self.factor ** level
+        R0, R1 = -(-r0 // size), r1 // size
+        C0, C1 = -(-c0 // size), c1 // size
+        if level == 0 or (R0 < R1 and C0 < C1):
+            block = data[level][indices, :, R0:R1, C0:C1]
+            totals += block.sum(axis=(0, 2, 3))
+            cells[level] += (R1 - R0) * (C1 - C0)
+            # Frame around the block, at the next finer level
+            ir0, ir1, ic0, ic1 = R0 * size, R1 * size, C0 * size, C1 * size
+            if level == 0:
+                return
+            for rect in ((r0, ir0, c0, c1), (ir1, r1, c0, c1), (ir0, ir1, c0, ic0), (ir0, ir1, ic1, c1)):
+                self._sum_range(data, indices, level - 1, *rect, totals, cells)
+        else:
+            self._sum_range(data, indices, level - 1, r0, r1, c0, c1, totals, cells)
+
+    def sum_partial_cells(self, months, coords):
+        """
+        Totals over the cells cut by the edges of coords, each weighted by the
+        fraction of it inside coords (an area-weighted stand-in for reducing the
+        edge strips exactly).
+        """
+        stored, data = self._snapshot
+        indices = [stored.index(month) for month in months]
+        r0, r1, c0, c1 = self.whole_cells(coords)
+        row_weights = self._edge_weights(coords['south'], coords['north'], self.south, r0, r1)
+        col_weights = self._edge_weights(coords['west'], coords['east'], self.west, c0, c1)
+        rows = row_weights + [(r0, r1, 1.0)] if r1 > r0 else row_weights
+        cols = col_weights + [(c0, c1, 1.0)] if c1 > c0 else col_weights
+
+        totals = np.zeros(len(BANDS))
+        for rs, re, rw in rows:
+            for cs, ce, cw in cols:
+                if rw == 1.0 and cw == 1.0:
+                    continue  # the whole cells
+                block = data[0][indices, :, rs:re, cs:ce]
+                totals += block.sum(axis=(0, 2, 3)) * rw * cw
+        return totals
+
+    def cell_weights(self, coords):
+        """(r0, r1, c0, c1, weights): the finest cells touched by coords and the fraction of each inside it"""
+        r0, r1, c0, c1 = self.whole_cells(coords)
+        r0, r1, row_weights = self._axis_weights(coords['south'], coords['north'], self.south, r0, r1)
+        c0, c1, col_weights = self._axis_weights(coords['west'], coords['east'], self.west, c0, c1)
+        return r0, r1, c0, c1, np.outer(row_weights, col_weights)
+
+    def _axis_weights(self, low, high, origin, i0, i1):
+        spans = self._edge_weights(low, high, origin, i0, i1)
+        if i1 > i0:
+            spans.append((i0, i1, 1.0))
+        start, end = min(s for s, _, _ in spans), max(e for _, e, _ in spans)
+        weights = np.zeros(end - start)
+        for s, e, weight in spans:
+            weights[s - start:e - start] = weight
+        return start, end, weights
+
+    def _edge_weights(self, low, high, origin, i0, i1):
+        # [(start, end, weight)] for the partial cell(s) below i0 and above i1
+        position_low = (low - origin) / self.cell_deg
+        position_high = (high - origin) / self.cell_deg
+        weights = []
+        if i1 <= i0:
+            # low and high fall in the same cell (or two neighbours)
+            first = math.floor(position_low)
+            last = math.ceil(position_high)
+            for cell in range(first, last):
+                overlap = min(position_high, cell + 1) - max(position_low, cell)
+                if overlap > 0:
+                    weights.append((cell, cell + 1, overlap))
+            return weights
+        if i0 - position_low > EDGE_TOLERANCE_CELLS:
+            weights.append((i0 - 1, i0, i0 - position_low))
+        if position_high - i1 > EDGE_TOLERANCE_CELLS:
+            weights.append((i1, i1 + 1, position_high - i1))
+        return weights
+
+    def save(self, path):
+        months, data = self._snapshot
+        arrays = {f'level{k}': data[k] for k in range(self.levels)}
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(
+            tmp_path,
+            name=self.name,
+            origin=np.array([self.west, self.south]),
+            shape=np.array([self.rows, self.cols]),
+            grid=np.array([self.cell_deg, self.factor, self.levels]),
+            months=np.array(months, dtype=str),
+            built_at=np.array([self.built_at.get(month, 0.0) for month in months]),
+            **arrays
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            cell_deg, factor, levels = archive['grid']
+            region = cls(
+                str(archive['name']), float(archive['origin'][0]), float(archive['origin'][1]),
+                int(archive['shape'][0]), int(archive['shape'][1]),
+                float(cell_deg), int(factor), int(levels)
+            )
+            months = [str(month) for month in archive['months']]
+            data = [archive[f'level{k}'] for k in range(region.levels)]
+            if data[0].shape[1] != len(BANDS):
+                raise ValueError(f"built with {data[0].shape[1]} bands instead of {len(BANDS)}; rebuild it")
+            region.built_at = dict(zip(months, (float(t) for t in archive['built_at'])))
+            region._snapshot = (months, data)
+        return region
+
+
+class GridIndex:
+    """The regions stored under a directory (one .npz each), reloaded when a file changes"""
+    def __init__(self, directory):
+        self.directory = directory
+        self._regions = {}      # path -> (mtime, GridRegion)
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.answered = 0
+
+    def path(self, name):
+        return os.path.join(self.directory, f'{name}.npz')
+
+    def regions(self):
+        if not os.path.isdir(self.directory):
+            return []
+        with self._lock:
+            seen = set()
+            for entry in os.listdir(self.directory):
+                if not entry.endswith('.npz') or entry.endswith('.tmp.npz'):
+                    continue
+                path = os.path.join(self.directory, entry)
+                seen.add(path)
+                mtime = os.path.getmtime(path)
+                cached = self._regions.get(path)
+                if cached is None or cached[0] != mtime:
+                    try:
+                        self._regions[path] = (mtime, GridRegion.load(path))
+                    except Exception as e:
+                        print(f"Could not load grid region {path}: {e}")
+                        self._regions.pop(path, None)
+            for path in set(self._regions) - seen:
+                del self._regions[path]
+            return [region for _, region in self._regions.values()]
+
+    def find(self, coords, months=()):
+        """The region containing coords with every given month built, or None"""
+        for region in self.regions():
+            if region.contains(coords) and set(months) <= set(region.months):
+                return region
+        return None
+
+    def region_for(self, coords):
+        """The stored region containing coords, or a new empty region aligned around them"""
+        for region in self.regions():
+            if region.contains(coords):
+                return region
+        west, south, rows, cols = aligned_region(coords)
+        name = f'grid_{west:+.2f}_{south:+.2f}_{rows}x{cols}'.replace('+', 'p').replace('-', 'm')
+        return GridRegion(name, west, south, rows, cols)
+
+    def save(self, region):
+        os.makedirs(self.directory, exist_ok=True)
+        region.save(self.path(region.name))
+
+    def count_query(self, answered):
+        with self._lock:
+            self.queries += 1
+            if answered:
+                self.answered += 1
+
+    def stats(self):
+        regions = self.regions()
+        with self._lock:
+            return {
+                'regions': [{'name': r.name, **r.bounds, 'months': r.months} for r in regions],
+                'queries': self.queries,
+                'answered': self.answered
+            }
@@ -0,0 +1,268 @@
+import datetime
+import os
+
+import ee
+import numpy as np
+
+import gee_service
+import grid_index
+import metrics
+import periods
+
+# ==========================================
+# PRE-AGGREGATED GRID INDEX (see grid_index.py)
+# ==========================================
+# build_grid_index (a job) reduces monthly per-cell sums and counts into
+# GRID_INDEX; grid_dashboard_stages answers dashboards from them as a stage
+# source of gee_service. Only windows of whole calendar months ([1st, 1st of a
+# later month)) are answered, anything else is reduced live.
+#
+# Compared with the live dashboard reduction (same sources, same cloud thresholds):
+#   rainfall   per-pixel window totals, added up month by month: exact
+#   LST max    per cell, the max over months of the monthly max: exact where a
+#              cell holds one MODIS pixel (0.01 degree cells, 1 km pixels)
+#   NDVI, LST  pooled over every observation: equal to the mean of the per-pixel
+#              temporal means only when every pixel has as many clear observations
+#   NDMI       not indexed; its 60-day median composite is reduced live, in the
+#              round trip that also reduces the partial edge cells
+# The pooled means are why the index is off unless GAIAEYE_GRID_INDEX=1.
+
+GRID_INDEX_ENABLED = os.environ.get('GAIAEYE_GRID_INDEX', '0') != '0'
+GRID_INDEX_DIR = os.environ.get('GAIAEYE_GRID_INDEX_DIR', os.path.join(gee_service.DATA_DIR, 'grid_index'))
+GRID_INDEX = grid_index.GridIndex(GRID_INDEX_DIR)
+
+# Partial cells along a bbox's edges: 'gee' reduces the edge strips exactly (in the
+# NDMI round trip), 'weighted' weights the stored cells by their overlap
+GRID_EDGE_MODE = os.environ.get('GAIAEYE_GRID_EDGE_MODE', 'gee')
+
+# reduceRegions scale per quantity group when building cells or reducing edges
+GRID_SCALES = {'ndvi': 100, 'lst': 1000, 'rain': 5000}
+
+# Cells reduced per round trip by build_grid_index
+GRID_BUILD_CHUNK_CELLS = 1024
+
+# MODIS and CHIRPS arrive with a delay: a month built less than this many days
+# after it ended is rebuilt by the next build job
+GRID_SETTLE_DAYS = 20
+
+# --- BUILDING ---
+
+def build_grid_index(coords, date_start=None, date_end=None, rebuild=False):
+    """
+    Grid index job: pre-aggregate every month overlapping [date_start, date_end)
+    (default: the last 12 months) over the indexed region containing coords,
+    creating a new aligned region when none does. Settled months already built
+    are skipped unless rebuild is set.
+    """
+    today = datetime.date.today()
+    if not date_end: date_end = today.strftime('%Y-%m-%d')
+    if not date_start: date_start = (today - datetime.timedelta(days=365)).strftime('%Y-%m-%d')
+
+    region = GRID_INDEX.region_for(coords)
+    bounds = region.bounds
+    roi = ee.Geometry.Rectangle([bounds['west'], bounds['south'], bounds['east'], bounds['north']])
+    cells = [(row, col) for row in range(region.rows) for col in range(region.cols)]
+
+    built = []
+    for month in grid_index.months_between(date_start, date_end):
+        if not rebuild and grid_month_settled(region, month):
+            continue
+        level0 = region.empty_month()
+        with gee_service.composite_scope():
+            images = grid_images(roi, *grid_index.month_bounds(month))
+            for offset in range(0, len(cells), GRID_BUILD_CHUNK_CELLS):
+                chunk = cells[offset:offset + GRID_BUILD_CHUNK_CELLS]
+                for index, props in reduce_grid_cells(region, chunk, images).items():
+                    row, col = chunk[index]
+                    level0[:, row, col] = [props.get(band) or 0 for band in grid_index.BANDS]
+        region.set_month(month, level0)
+        GRID_INDEX.save(region)
+        built.append(month)
+        print(f"Grid index {region.name}: built {month}")
+
+    return {'region': region.name, 'bounds': bounds, 'built_months': built, 'months': region.months}
+
+def grid_month_settled(region, month):
+    if month not in region.built_at:
+        return False
+    _, month_end = grid_index.month_bounds(month)
+    settled_at = datetime.datetime.fromisoformat(month_end) + datetime.timedelta(days=GRID_SETTLE_DAYS)
+    return region.built_at[month] >= settled_at.timestamp()
+
+def grid_images(roi, start, end):
+    """Per-pixel sums and counts of the grid quantities over [start, end), one image per group of GRID_SCALES"""
+    def sum_and_count(collection, name):
+        return collection.sum().rename(f'{name}_sum').addBands(collection.count().rename(f'{name}_count'))
+
+    # Same sources and cloud thresholds as the dashboard stages
+    ndvi = gee_service.s2_collection(roi, start, end, max_cloud=20) \
+                      .map(lambda img: img.normalizedDifference(['B8', 'B4']))
+    lst = ee.ImageCollection('MODIS/006/MOD11A2') \
+            .filterBounds(roi) \
+            .filterDate(start, end) \
+            .map(lambda img: img.select('LST_Day_1km').multiply(0.02).subtract(273.15))
+    rain = ee.ImageCollection('UCSB-CHG/CHIRPS/PENTAD') \
+             .filterBounds(roi) \
+             .filterDate(start, end) \
+             .select('precipitation')
+
+    # lst_max and rain are per-pixel values over the whole window, so their count is one per observed pixel
+    return {
+        'ndvi': sum_and_count(ndvi, 'ndvi'),
+        'lst': sum_and_count(lst, 'lst')
+                 .addBands(lst.max().rename('lst_max_sum'))
+                 .addBands(lst.count().gt(0).rename('lst_max_count')),
+        'rain': rain.sum().rename('rain_sum').addBands(rain.count().gt(0).rename('rain_count'))
+    }
+
+def reduce_grid_cells(region, cells, images):
+    """Sum every grid band over each (row, col) cell in one round trip; returns {position in cells: properties}"""
+    fc = ee.FeatureCollection([
+        ee.Feature(ee.Geometry.Rectangle(region.cell_bounds(row, col)), {'cell': index})
+        for index, (row, col) in enumerate(cells)
+    ])
+    # Each reduceRegions keeps the properties of its input, so the sums accumulate on one collection
+    reduced = fc
+    for group, image in images.items():
+        reduced = image.reduceRegions(collection=reduced, reducer=ee.Reducer.sum(), scale=GRID_SCALES[group])
+
+    info = gee_service.gee_get_info(reduced.select(['cell'] + list(grid_index.BANDS), retainGeometry=False),
+                                    'grid_build')
+    return {f['properties']['cell']: f['properties'] for f in info['features']}
+
+# --- ANSWERING DASHBOARDS ---
+
+def grid_window_months(date_start, date_end):
+    """The calendar months making up [date_start, date_end), or None unless both dates are a 1st"""
+    start, end = periods.parse_date(date_start), periods.parse_date(date_end)
+    if start.day != 1 or end.day != 1 or end <= start:
+        return None
+    return grid_index.months_between(date_start, date_end)
+
+def grid_region(coords, months):
+    """The indexed region holding every month and at least one whole cell of coords, or None"""
+    if not months:
+        return None
+    region = GRID_INDEX.find(coords, months)
+    if region is None:
+        return None
+    r0, r1, c0, c1 = region.whole_cells(coords)
+    return region if r0 < r1 and c0 < c1 else None
+
+def grid_covers(coords, date_start, date_end):
+    """True if GRID_INDEX can answer the dashboard for this bbox and window"""
+    if not GRID_INDEX_ENABLED:
+        return False
+    return grid_region(coords, grid_window_months(date_start, date_end)) is not None
+
+def grid_dashboard_stages(coords, date_start, date_end, crop_type, plan):
+    """
+    Dashboard stages from GRID_INDEX, or None when the window is not made of whole
+    months, or the bbox (with a whole cell) or one of its months is not indexed.
+    """
+    if not GRID_INDEX_ENABLED:
+        return None
+    months = grid_window_months(date_start, date_end)
+    region = grid_region(coords, months)
+    if region is None:
+        GRID_INDEX.count_query(False)
+        return None
+
+    with metrics.DASHBOARD_STAGE_SECONDS.time('dashboard.grid_index', stage='grid_index'):
+        totals = grid_window_totals(region, coords, months)
+    ndmi, edges = reduce_grid_live(region, coords, date_start, date_end, plan['ndmi'])
+    for name, (total, count) in totals.items():
+        totals[name] = (total + edges.get(f'{name}_sum', 0), count + edges.get(f'{name}_count', 0))
+    GRID_INDEX.count_query(True)
+
+    values = grid_dashboard_values(totals, ndmi, gee_service.estimate_area_m2(coords))
+    return {
+        **gee_service.score_dashboard_values(values, crop_type),
+        'reduction_scales': {**GRID_SCALES, 'ndmi': plan['ndmi']['scale']},
+        'source': 'grid_index'
+    }
+
+def grid_window_totals(region, coords, months):
+    """
+    {quantity: (sum, pixels or observations)} over the window's months and the
+    whole cells of coords (plus the overlap-weighted edge cells in 'weighted' mode)
+    """
+    whole = region.whole_cells(coords)
+    summed, _ = region.sum_cells(months, *whole)
+    if GRID_EDGE_MODE == 'weighted':
+        summed = summed + region.sum_partial_cells(months, coords)
+        r0, r1, c0, c1, weights = region.cell_weights(coords)
+    else:
+        r0, r1, c0, c1 = whole
+        weights = np.ones((r1 - r0, c1 - c0))
+    bands = dict(zip(grid_index.BANDS, (float(value) for value in summed)))
+
+    # A max does not add up over months, so lst_max is taken cell by cell at the finest level
+    sums = region.cell_values(months, 'lst_max_sum', r0, r1, c0, c1)
+    counts = region.cell_values(months, 'lst_max_count', r0, r1, c0, c1)
+    observed = counts > 0
+    cell_max = np.where(observed, sums / np.where(observed, counts, 1), -np.inf).max(axis=0)
+    pixels = counts.max(axis=0) * weights
+    seen = observed.any(axis=0)
+
+    return {
+        'ndvi': (bands['ndvi_sum'], bands['ndvi_count']),
+        'lst': (bands['lst_sum'], bands['lst_count']),
+        'lst_max': (float((cell_max[seen] * pixels[seen]).sum()), float(pixels[seen].sum())),
+        # rain_count counts each pixel once per month, while its window total spans all of them
+        'rain': (bands['rain_sum'], bands['rain_count'] / len(months))
+    }
+
+def grid_dashboard_values(totals, ndmi, area_m2):
+    """Window totals as the values of a batched dashboard reduction (see score_dashboard_values)"""
+    values = {'area_m2': area_m2, 'ndvi': {}, 'lst': {}, 'rain': {}, 'ndmi': ndmi}
+    for group, key, name in (('ndvi', 'NDVI', 'ndvi'),
+                             ('lst', 'LST_Day_1km_mean', 'lst'),
+                             ('lst', 'LST_Day_1km_max', 'lst_max'),
+                             ('rain', 'precipitation_sum', 'rain')):
+        total, count = totals[name]
+        if count > 0:
+            values[group][key] = total / count
+    return values
+
+def reduce_grid_live(region, coords, date_start, date_end, ndmi_params):
+    """
+    What the index does not hold, in one round trip: the soil moisture reduction and,
+    in 'gee' edge mode, the band totals over the part of coords outside its whole cells.
+    Returns (NDMI values, {band: edge total}).
+    """
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    reductions = {'ndmi': gee_service.reduce_soil_moisture(roi, ndmi_params)}
+    edges = grid_edges(region, coords) if GRID_EDGE_MODE != 'weighted' else None
+    if edges is not None:
+        with gee_service.composite_scope():
+            reductions['edges'] = ee.Dictionary({
+                group: image.reduceRegion(
+                    reducer=ee.Reducer.sum(),
+                    geometry=edges,
+                    scale=GRID_SCALES[group],
+                    maxPixels=1e9
+                )
+                for group, image in grid_images(roi, date_start, date_end).items()
+            })
+
+    values = gee_service.gee_get_info(ee.Dictionary(reductions), 'grid_live')
+    totals = {}
+    for group_values in (values.get('edges') or {}).values():
+        for band, value in (group_values or {}).items():
+            totals[band] = value or 0
+    return values.get('ndmi') or {}, totals
+
+def grid_edges(region, coords):
+    """The part of coords outside its whole cells, or None if coords lies on cell lines"""
+    r0, r1, c0, c1 = region.whole_cells(coords)
+    inner_west, inner_south, _, _ = region.cell_bounds(r0, c0)
+    _, _, inner_east, inner_north = region.cell_bounds(r1 - 1, c1 - 1)
+    tolerance = region.cell_deg * grid_index.EDGE_TOLERANCE_CELLS
+    if (abs(inner_west - coords['west']) < tolerance and abs(inner_east - coords['east']) < tolerance and
+            abs(inner_south - coords['south']) < tolerance and abs(inner_north - coords['north']) < tolerance):
+        return None
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    return roi.difference(ee.Geometry.Rectangle([inner_west, inner_south, inner_east, inner_north]), 1)
+
+gee_service.register_stage_source(grid_dashboard_stages, grid_covers)
@@ -0,0 +1,140 @@
+import json
+import queue
+import threading
+import time
+import uuid
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds max_queue jobs waiting for a worker"""
+
+
+class Job:
+    def __init__(self, job_id, kind, key):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    """
+    Fixed worker pool that runs slow API work off the request threads.
+    Identical jobs (same kind and params) that are still queued or running are merged.
+    Finished jobs are kept for result_ttl_seconds.
+    """
+    def __init__(self, workers=4, max_queue=64, result_ttl_seconds=3600):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl_seconds = result_ttl_seconds
+        self._queue = queue.Queue()
+        self._jobs = {}      # job_id -> Job
+        self._active = {}    # dedup key -> job_id (queued or running)
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        self.merged = 0
+        self.rejected = 0
+
+    def submit(self, kind, params, func):
+        """
+        Queue func() for kind/params and return (job, merged).
+        Raises JobQueueFull when max_queue jobs are already waiting.
+        """
+        key = (kind, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            self._prune()
+            job_id = self._active.get(key)
+            if job_id is not None:
+                self.merged += 1
+                return self._jobs[job_id], True
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise JobQueueFull(f"Job queue is full ({self.max_queue} waiting)")
+
+            job = Job(uuid.uuid4().hex, kind, key)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._queued += 1
+            self._start_workers()
+
+        self._queue.put((job, func))
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queued': self._queued,
+                'jobs': counts,
+                'merged': self.merged,
+                'rejected': self.rejected
+            }
+
+    # --- internal helpers ---
+
+    def _start_workers(self):
+        # Caller holds the lock; threads are started on first use
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job, func = self._queue.get()
+            with self._lock:
+                self._queued -= 1
+                job.status = 'running'
+                job.started_at = time.time()
+            try:
+                result = func()
+            except Exception as e:
+                print(f"Job {job.id} ({job.kind}) failed: {e}")
+                with self._lock:
+                    job.status = 'failed'
+                    job.error = str(e)
+            else:
+                with self._lock:
+                    job.status = 'done'
+                    job.result = result
+            finally:
+                with self._lock:
+                    job.finished_at = time.time()
+                    if self._active.get(job.key) == job.id:
+                        del self._active[job.key]
+                self._queue.task_done()
+
+    def _prune(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
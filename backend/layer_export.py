@@ -0,0 +1,116 @@
+import collections
+import concurrent.futures
+import contextvars
+import datetime
+import itertools
+import math
+
+import ee
+
+import gee_service
+import geotiff
+from gee_scheduler import GEE_POOL
+
+# ==========================================
+# GEOTIFF EXPORT (/api/export)
+# ==========================================
+# The clipped indicator image (raw values, not the visualized tiles) as a
+# single-band float32 GeoTIFF in EPSG:4326. The ROI's pixel grid is cut into
+# EXPORT_CHUNK_PX blocks that are fetched with ee.data.computePixels on the
+# shared GEE_POOL and written out in order as the tiles of the file, so at most
+# EXPORT_WINDOW blocks are held in memory whatever the size of the raster.
+
+EXPORT_CHUNK_PX = 512
+# Blocks fetched ahead of the one being written, per export
+EXPORT_WINDOW = 16
+EXPORT_MAX_PIXELS = 100_000_000
+EXPORT_NODATA = -9999.0
+
+
+def export_grid(coords, indicator, scale=None):
+    """
+    Pixel grid of an export: west/north corner, pixel size in degrees (x, y), width and height.
+    scale is the pixel size in meters (default: the native resolution of the source). A degree
+    of longitude shrinks with cos(latitude), so the x step is widened to keep pixels about
+    scale meters across at the ROI's center latitude.
+    """
+    config = gee_service.INDICATORS_CONFIG[gee_service.indicator_key(indicator)]
+    scale = float(scale or gee_service.SOURCE_SCALES[config['type']])
+    if scale <= 0:
+        raise ValueError("scale must be positive")
+    pixel_y = math.degrees(scale / gee_service.EARTH_RADIUS_M)
+    pixel_x = pixel_y / math.cos(math.radians((coords['north'] + coords['south']) / 2))
+    return {
+        'west': coords['west'],
+        'north': coords['north'],
+        'scale': scale,
+        'pixel_deg_x': pixel_x,
+        'pixel_deg_y': pixel_y,
+        'width': max(1, math.ceil((coords['east'] - coords['west']) / pixel_x)),
+        'height': max(1, math.ceil((coords['north'] - coords['south']) / pixel_y))
+    }
+
+def export_blocks(grid):
+    """(x, y, width, height) pixel blocks of the grid, row-major like the TIFF tiles"""
+    size = EXPORT_CHUNK_PX
+    for y in range(0, grid['height'], size):
+        for x in range(0, grid['width'], size):
+            yield x, y, min(size, grid['width'] - x), min(size, grid['height'] - y)
+
+def stream_indicator_geotiff(coords, date_start, date_end, indicator, grid):
+    """
+    Generator of the GeoTIFF bytes for an export_grid(): the header (once the first
+    block has arrived, so early EE errors surface before anything is sent), then one
+    tile per block, fetching up to EXPORT_WINDOW blocks ahead.
+    """
+    indicator = indicator.upper()
+    if not date_end: date_end = datetime.date.today().strftime('%Y-%m-%d')
+    if not date_start: date_start = (datetime.date.today() - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    image = gee_service.layer_image(roi, date_start, date_end, indicator).select([0]).toFloat().unmask(EXPORT_NODATA)
+    header = geotiff.tiled_header(grid['width'], grid['height'], EXPORT_CHUNK_PX,
+                                  (grid['pixel_deg_x'], grid['pixel_deg_y']),
+                                  grid['west'], grid['north'], EXPORT_NODATA)
+
+    def submit(block):
+        return GEE_POOL.submit(contextvars.copy_context().run, fetch_export_block, image, grid, block, indicator)
+
+    blocks = export_blocks(grid)
+    futures = collections.deque(submit(block) for block in itertools.islice(blocks, EXPORT_WINDOW))
+    try:
+        while futures:
+            try:
+                pixels = futures.popleft().result(timeout=gee_service.remaining_time())
+            except concurrent.futures.TimeoutError:
+                gee_service.check_deadline()
+                raise
+            block = next(blocks, None)
+            if block is not None:
+                futures.append(submit(block))
+            if header is not None:
+                yield header
+                header = None
+            yield geotiff.encode_tile(pixels, EXPORT_CHUNK_PX, EXPORT_NODATA)
+    finally:
+        for future in futures:
+            future.cancel()
+
+def fetch_export_block(image, grid, block, indicator):
+    """Pixels of one block as a (height, width) array"""
+    x, y, width, height = block
+    request = {
+        'expression': image,
+        'fileFormat': 'NUMPY_NDARRAY',
+        'grid': {
+            'dimensions': {'width': width, 'height': height},
+            'affineTransform': {
+                'scaleX': grid['pixel_deg_x'], 'shearX': 0, 'translateX': grid['west'] + x * grid['pixel_deg_x'],
+                'shearY': 0, 'scaleY': -grid['pixel_deg_y'], 'translateY': grid['north'] - y * grid['pixel_deg_y']
+            },
+            'crsCode': 'EPSG:4326'
+        }
+    }
+    pixels = gee_service.gee_request('computePixels', indicator, lambda: ee.data.computePixels(request))
+    # A structured array with one field per band
+    return pixels[pixels.dtype.names[0]] if pixels.dtype.names else pixels
@@ -0,0 +1,237 @@
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# ==========================================
+# LOCAL SENTINEL-2 BACKEND
+# ==========================================
+# Evaluates the same indices as gee_service.get_sentinel2_image (with the QA60
+# masking of mask_s2_clouds) on band rasters stored on disk. Archive layout
+# (lat/lon grid, EPSG:4326):
+#
+#   <LOCAL_ARCHIVE_DIR>/<site>/site.json
+#       {"west": float, "north": float, "pixel_size": [dx_deg, dy_deg], "width": int, "height": int}
+#   <LOCAL_ARCHIVE_DIR>/<site>/<YYYY-MM-DD>/<band>.npy    (B2, B3, B4, B8, B11, QA60 digital numbers)
+#   <LOCAL_ARCHIVE_DIR>/<site>/<YYYY-MM-DD>/scene.json    (optional, {"CLOUDY_PIXEL_PERCENTAGE": float})
+#
+# Bands are memory-mapped and processed in row chunks on a process pool, so each
+# worker only holds one chunk at a time. Workers are spawned, not forked: the
+# server process runs threads (GEE pools, schedulers) whose locks a fork would copy.
+
+LOCAL_ARCHIVE_DIR = os.environ.get(
+    'GAIAEYE_LOCAL_ARCHIVE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'local_archive')
+)
+LOCAL_CHUNK_ROWS = 256
+LOCAL_WORKERS = os.cpu_count() or 1
+
+# Bands each index needs (QA60 is always read for cloud masking)
+INDEX_BANDS = {
+    'NDVI': ('B8', 'B4'),
+    'EVI': ('B8', 'B4', 'B2'),
+    'SAVI': ('B8', 'B4'),
+    'LAI': ('B8', 'B4'),
+    'NDWI': ('B3', 'B8'),
+    'MNDWI': ('B3', 'B11'),
+    'NDBI': ('B11', 'B8'),
+    'NDMI': ('B8', 'B11'),
+}
+LOCAL_INDICATORS = ('NDVI', 'EVI', 'SAVI', 'LAI', 'NDWI', 'MNDWI', 'NDBI')
+
+_pool = None
+
+
+class LocalArchiveError(ValueError):
+    """The local archive cannot answer the request (no site, no scenes, bad index)"""
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=LOCAL_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+# --- ARCHIVE LOOKUP ---
+
+def find_site(coords, archive_dir=None):
+    """Return (site_dir, meta) of the first site whose extent contains the bbox"""
+    archive_dir = archive_dir or LOCAL_ARCHIVE_DIR
+    if not os.path.isdir(archive_dir):
+        raise LocalArchiveError(f"Local archive not found: {archive_dir}")
+
+    for name in sorted(os.listdir(archive_dir)):
+        meta_path = os.path.join(archive_dir, name, 'site.json')
+        if not os.path.isfile(meta_path):
+            continue
+        with open(meta_path) as f:
+            meta = json.load(f)
+        dx, dy = meta['pixel_size']
+        east = meta['west'] + dx * meta['width']
+        south = meta['north'] - dy * meta['height']
+        if (meta['west'] <= coords['west'] and coords['east'] <= east and
+                south <= coords['south'] and coords['north'] <= meta['north']):
+            return os.path.join(archive_dir, name), meta
+
+    raise LocalArchiveError("No local site covers the requested area")
+
+def pixel_window(meta, coords):
+    """(row0, row1, col0, col1) of the pixels touching the bbox"""
+    dx, dy = meta['pixel_size']
+    # Rounded first so a bbox edge lying on a pixel edge does not pull in a neighbour
+    col0 = max(0, int(math.floor(round((coords['west'] - meta['west']) / dx, 6))))
+    col1 = min(meta['width'], int(math.ceil(round((coords['east'] - meta['west']) / dx, 6))))
+    row0 = max(0, int(math.floor(round((meta['north'] - coords['north']) / dy, 6))))
+    row1 = min(meta['height'], int(math.ceil(round((meta['north'] - coords['south']) / dy, 6))))
+    if row1 <= row0 or col1 <= col0:
+        raise LocalArchiveError("Requested area is smaller than one pixel")
+    return row0, row1, col0, col1
+
+def list_scenes(site_dir, start, end, max_cloud):
+    """Scene directories with start <= date < end and cloud cover below max_cloud"""
+    start = str(start)[:10]
+    end = str(end)[:10]
+    scenes = []
+    for name in sorted(os.listdir(site_dir)):
+        scene_dir = os.path.join(site_dir, name)
+        if not os.path.isdir(scene_dir):
+            continue
+        try:
+            datetime.date.fromisoformat(name)
+        except ValueError:
+            continue
+        if not (start <= name < end):
+            continue
+        scene_meta = os.path.join(scene_dir, 'scene.json')
+        if os.path.isfile(scene_meta):
+            with open(scene_meta) as f:
+                if json.load(f).get('CLOUDY_PIXEL_PERCENTAGE', 0) >= max_cloud:
+                    continue
+        scenes.append(scene_dir)
+    return scenes
+
+
+# --- PER-CHUNK MATH (runs in worker processes) ---
+
+def mask_s2_clouds(bands):
+    """NumPy twin of gee_service.mask_s2_clouds: QA60 bits 10/11 masked (NaN), reflectance / 10000"""
+    qa = bands['QA60'].astype(np.uint16)
+    clear = ((qa & (1 << 10)) == 0) & ((qa & (1 << 11)) == 0)
+    return {
+        name: np.where(clear, values.astype(np.float32) / 10000, np.float32(np.nan))
+        for name, values in bands.items() if name != 'QA60'
+    }
+
+def normalized_difference(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (a - b) / (a + b)
+
+def index_from_bands(indicator, b):
+    """Same formulas as gee_service.get_sentinel2_image"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if indicator == 'NDVI': return normalized_difference(b['B8'], b['B4'])
+        if indicator == 'NDWI': return normalized_difference(b['B3'], b['B8'])
+        if indicator == 'MNDWI': return normalized_difference(b['B3'], b['B11'])
+        if indicator == 'NDBI': return normalized_difference(b['B11'], b['B8'])
+        if indicator == 'NDMI': return normalized_difference(b['B8'], b['B11'])
+        if indicator == 'LAI': return normalized_difference(b['B8'], b['B4']) * 3  # Simple proxy
+        if indicator == 'EVI':
+            return 2.5 * ((b['B8'] - b['B4']) / (b['B8'] + 6 * b['B4'] - 7.5 * b['B2'] + 1))
+        if indicator == 'SAVI':
+            return ((b['B8'] - b['B4']) / (b['B8'] + b['B4'] + 0.5)) * 1.5
+    raise LocalArchiveError(f"Indicator {indicator} is not available on the local backend")
+
+def read_scene_chunk(scene_dir, band_names, r0, r1, c0, c1):
+    """Masked reflectance for one scene and window, read through memory maps"""
+    raw = {}
+    for name in tuple(band_names) + ('QA60',):
+        raster = np.load(os.path.join(scene_dir, f'{name}.npy'), mmap_mode='r')
+        raw[name] = np.asarray(raster[r0:r1, c0:c1])
+    return mask_s2_clouds(raw)
+
+def _chunk_index(task):
+    """
+    Index values for one row chunk.
+    mode 'composite': index of the per-band median composite (ImageCollection.median()).
+    mode 'series_mean': per-scene index averaged over scenes (as reduce_mean_ndvi does).
+    """
+    mode, scenes, indicator, r0, r1, c0, c1 = task
+    band_names = INDEX_BANDS[indicator]
+    per_scene = [read_scene_chunk(scene, band_names, r0, r1, c0, c1) for scene in scenes]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN pixels simply stay NaN
+        if mode == 'composite':
+            composite = {name: np.nanmedian(np.stack([s[name] for s in per_scene]), axis=0)
+                         for name in band_names}
+            return index_from_bands(indicator, composite).astype(np.float32)
+        values = np.stack([index_from_bands(indicator, s) for s in per_scene])
+        return np.nanmean(values, axis=0).astype(np.float32)
+
+def _chunk_stats(task):
+    """(sum, count, min, max) of the finite index values of one chunk"""
+    values = _chunk_index(task)
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return 0.0, 0, None, None
+    return float(finite.sum(dtype=np.float64)), int(finite.size), float(finite.min()), float(finite.max())
+
+
+# --- PUBLIC API ---
+
+def _tasks(mode, coords, start, end, indicator, max_cloud, archive_dir):
+    indicator = indicator.upper()
+    if indicator not in INDEX_BANDS:
+        raise LocalArchiveError(f"Indicator {indicator} is not available on the local backend")
+    site_dir, meta = find_site(coords, archive_dir)
+    r0, r1, c0, c1 = pixel_window(meta, coords)
+    scenes = list_scenes(site_dir, start, end, max_cloud)
+    if not scenes:
+        raise LocalArchiveError("No local scenes in the requested window")
+    tasks = [(mode, scenes, indicator, row, min(row + LOCAL_CHUNK_ROWS, r1), c0, c1)
+             for row in range(r0, r1, LOCAL_CHUNK_ROWS)]
+    return tasks, meta, (r0, r1, c0, c1)
+
+def compute_indicator(coords, start, end, indicator, max_cloud=20, mode='composite', archive_dir=None):
+    """
+    Full index raster for the bbox as a float32 array (NaN = masked) plus its
+    georeferencing {'west', 'north', 'pixel_size'}.
+    """
+    tasks, meta, (r0, r1, c0, c1) = _tasks(mode, coords, start, end, indicator, max_cloud, archive_dir)
+    chunks = list(get_pool().map(_chunk_index, tasks))
+    dx, dy = meta['pixel_size']
+    georef = {'west': meta['west'] + c0 * dx, 'north': meta['north'] - r0 * dy, 'pixel_size': [dx, dy]}
+    return np.vstack(chunks), georef
+
+def indicator_stats(coords, start, end, indicator, max_cloud=20, mode='composite', archive_dir=None):
+    """Mean/min/max/pixel count of an index over the bbox, reduced chunk by chunk"""
+    tasks, _, _ = _tasks(mode, coords, start, end, indicator, max_cloud, archive_dir)
+    total, count, low, high = 0.0, 0, None, None
+    for chunk_sum, chunk_count, chunk_min, chunk_max in get_pool().map(_chunk_stats, tasks):
+        if not chunk_count:
+            continue
+        total += chunk_sum
+        count += chunk_count
+        low = chunk_min if low is None else min(low, chunk_min)
+        high = chunk_max if high is None else max(high, chunk_max)
+    return {
+        'mean': total / count if count else None,
+        'min': low,
+        'max': high,
+        'pixels': count
+    }
+
+def mean_ndvi(coords, start, end, archive_dir=None):
+    """Local equivalent of gee_service.reduce_mean_ndvi (None when nothing is valid)"""
+    return indicator_stats(coords, start, end, 'NDVI', max_cloud=20, mode='series_mean',
+                           archive_dir=archive_dir)['mean']
+
+def mean_ndmi(coords, start, end, archive_dir=None):
+    """Local equivalent of gee_service.reduce_soil_moisture over [start, end)"""
+    return indicator_stats(coords, start, end, 'NDMI', max_cloud=10, mode='composite',
+                           archive_dir=archive_dir)['mean']
@@ -0,0 +1,241 @@
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+# ==========================================
+# METRICS (Prometheus text exposition)
+# ==========================================
+# Process-wide counters/histograms rendered by GET /metrics, plus an optional
+# per-request trace that collects stage timings and GEE round trips for the
+# Server-Timing header and the opt-in "timing" block of JSON responses.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, trace_name=None, **labels):
+        """Observe the duration of the block (seconds); also record it in the request trace"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            if trace_name:
+                record_timing(trace_name, elapsed)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {_format_value(state[-2])}')
+                lines.append(f'{self.name}_count{labels} {state[-1]}')
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time: func() returns {label values tuple: value}"""
+    def __init__(self, name, help_text, labelnames, func):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.func = func
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        for key, value in sorted(self.func().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+REGISTRY = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render():
+    """All registered metrics in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            print(f"Metric {metric.name} failed to render: {e}")
+    return '\n'.join(lines) + '\n'
+
+# --- APPLICATION METRICS ---
+
+HTTP_REQUEST_SECONDS = register(Histogram(
+    'gaiaeye_http_request_seconds', 'HTTP request latency by route', ('route', 'method', 'status')
+))
+INDICATOR_SECONDS = register(Histogram(
+    'gaiaeye_indicator_layer_seconds', 'Time to build an indicator layer (map ID) by indicator', ('indicator',)
+))
+DASHBOARD_STAGE_SECONDS = register(Histogram(
+    'gaiaeye_dashboard_stage_seconds', 'Dashboard latency by stage', ('stage',)
+))
+GEE_CALL_SECONDS = register(Histogram(
+    'gaiaeye_gee_call_seconds', 'Earth Engine round-trip latency by call and stage', ('method', 'stage')
+))
+GEE_CALLS_PER_REQUEST = register(Histogram(
+    'gaiaeye_gee_round_trips_per_request', 'Earth Engine round trips made while serving one request',
+    ('route',), buckets=COUNT_BUCKETS
+))
+GEE_QUEUE_WAIT_SECONDS = register(Histogram(
+    'gaiaeye_gee_queue_wait_seconds', 'Time GEE calls waited for a quota slot by priority lane', ('lane',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+))
+GEE_CALLS = register(Counter('gaiaeye_gee_calls_total', 'Earth Engine round trips', ('method',)))
+GEE_ERRORS = register(Counter('gaiaeye_gee_errors_total', 'Failed Earth Engine round trips', ('method',)))
+RETRIES = register(Counter('gaiaeye_retries_total', 'Retried operations', ('operation',)))
+HTTP_ERRORS = register(Counter('gaiaeye_http_errors_total', 'Responses with a 5xx status by route', ('route',)))
+REJECTED_REQUESTS = register(Counter(
+    'gaiaeye_rejected_requests_total', 'Requests turned away by admission control (asgi.py)', ('reason',)
+))
+DEADLINES_EXCEEDED = register(Counter(
+    'gaiaeye_deadline_exceeded_total', 'Requests answered with 504 after running past their deadline'
+))
+PREFETCHES = register(Counter(
+    'gaiaeye_prefetch_total',
+    'Speculative layer prefetches by outcome (used / done is how often a prefetch was clicked)', ('outcome',)
+))
+
+# --- PER-REQUEST TRACE ---
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = []    # (name, seconds) in completion order
+        self.gee_calls = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.timings.append((name, seconds))
+
+    def count_gee_call(self):
+        with self._lock:
+            self.gee_calls += 1
+
+    def summary(self):
+        """{'total_ms', 'gee_round_trips', 'stages': {name: ms}} (repeated stages are summed)"""
+        stages = {}
+        with self._lock:
+            for name, seconds in self.timings:
+                stages[name] = stages.get(name, 0.0) + seconds * 1000
+            calls = self.gee_calls
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'gee_round_trips': calls,
+            'stages': {name: round(ms, 2) for name, ms in stages.items()}
+        }
+
+    def server_timing(self):
+        """Server-Timing header value"""
+        summary = self.summary()
+        entries = [
+            f'{"".join(c if c.isalnum() or c in "-_." else "-" for c in name)};dur={ms}'
+            for name, ms in summary['stages'].items()
+        ]
+        entries.append(f'total;dur={summary["total_ms"]}')
+        return ', '.join(entries)
+
+_current_trace = contextvars.ContextVar('request_trace', default=None)
+
+def start_trace():
+    """Begin a trace for the current request (pool threads see it through contextvars.copy_context)"""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+def end_trace():
+    _current_trace.set(None)
+
+def current_trace():
+    return _current_trace.get()
+
+def record_timing(name, seconds):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+@contextlib.contextmanager
+def gee_call(method, stage):
+    """Count, time and trace one Earth Engine round trip (getInfo, getMapId, tile fetch)"""
+    GEE_CALLS.inc(method=method)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count_gee_call()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        GEE_ERRORS.inc(method=method)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        GEE_CALL_SECONDS.observe(elapsed, method=method, stage=stage)
+        record_timing(f'{method}.{stage}', elapsed)
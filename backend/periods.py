@@ -0,0 +1,70 @@
+import datetime
+
+# ==========================================
+# ANALYSIS WINDOWS
+# ==========================================
+# Date arithmetic shared by the speculative prefetch and change detection.
+# Windows are (date_start, date_end) strings in YYYY-MM-DD and, like
+# ee.ImageCollection.filterDate, exclude date_end: a window and the one right
+# before it share that boundary date, so no day falls between them.
+
+COMPARE_MODES = ('previous', 'last_year')
+
+def previous_window(date_start, date_end):
+    """
+    The window right before [date_start, date_end), ending at date_start: the
+    previous calendar month when the window is a whole month, otherwise the same
+    number of days shifted back. A whole month may end on the first of the next
+    month or, as the frontend sends it, on its own last day.
+    """
+    if not date_end: date_end = datetime.date.today().strftime('%Y-%m-%d')
+    if not date_start: date_start = (datetime.date.today() - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+    start = parse_date(date_start)
+    end = parse_date(date_end)
+
+    if is_whole_month(date_start, date_end):
+        prev_start = (start - datetime.timedelta(days=1)).replace(day=1)
+    else:
+        prev_start = start - (end - start)
+    return prev_start.strftime('%Y-%m-%d'), start.strftime('%Y-%m-%d')
+
+def is_whole_month(date_start, date_end):
+    """True for [1st, 1st of the next month) and for [1st, last day of the month)"""
+    start = parse_date(date_start)
+    next_month = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return start.day == 1 and parse_date(date_end) in (next_month, next_month - datetime.timedelta(days=1))
+
+def comparison_window(date_start, date_end, compare_to):
+    """
+    The earlier window to compare [date_start, date_end) with:
+    'previous' (the window right before it), 'last_year' (the same dates a year
+    earlier) or an explicit {"date_start", "date_end"}.
+    """
+    if isinstance(compare_to, dict):
+        try:
+            start, end = parse_date(compare_to['date_start']), parse_date(compare_to['date_end'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("compare_to needs date_start and date_end as YYYY-MM-DD") from None
+        if start >= end:
+            raise ValueError("compare_to date_start must be before date_end")
+        return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+    if compare_to == 'previous':
+        return previous_window(date_start, date_end)
+    if compare_to == 'last_year':
+        # The end moves with the last day it includes, so a window ending on 29 February
+        # still ends right after 28 February
+        last_day = (parse_date(date_end) - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        end = parse_date(shift_years(last_day, -1)) + datetime.timedelta(days=1)
+        return shift_years(date_start, -1), end.strftime('%Y-%m-%d')
+    raise ValueError(f"compare_to must be one of {list(COMPARE_MODES)} or {{date_start, date_end}}")
+
+def shift_years(date, years):
+    day = parse_date(date)
+    try:
+        return day.replace(year=day.year + years).strftime('%Y-%m-%d')
+    except ValueError:
+        # 29 February
+        return day.replace(year=day.year + years, day=28).strftime('%Y-%m-%d')
+
+def parse_date(date):
+    return datetime.datetime.strptime(date, '%Y-%m-%d').date()
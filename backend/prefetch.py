@@ -0,0 +1,144 @@
+import contextvars
+import datetime
+import threading
+import time
+
+import gee_service
+import metrics
+import periods
+from gee_scheduler import BACKGROUND_POOL, lane_scope
+
+# ==========================================
+# SPECULATIVE PREFETCH
+# ==========================================
+# After an interactive layer request, the layers the user is likely to open next
+# (the same indicators one window back, and the other indicators for the area)
+# are minted in the background on the batch lane and left in LAYER_CACHE, so the
+# next click finds a warm map ID instead of waiting for a cold getMapId.
+
+PREFETCH_LANE = 'batch'
+# Speculative layers queued or running, per client and in total
+PREFETCH_MAX_PER_CLIENT = 12
+PREFETCH_MAX_PENDING = 64
+PREFETCH_OUTCOMES = ('scheduled', 'skipped_cached', 'skipped_limit', 'done', 'failed', 'used', 'missed', 'expired')
+
+_prefetch_lock = threading.Lock()
+_prefetch_pending = {}      # client -> prefetches queued or running
+_prefetched = {}            # LAYER_CACHE key -> monotonic time it was scheduled, until first used
+_prefetch_counts = dict.fromkeys(PREFETCH_OUTCOMES, 0)
+
+def prefetch_targets(coords, date_start, date_end, indicators):
+    """
+    Normalized layers to prefetch after a request for `indicators`, most likely first:
+    the same indicators one window back, the other indicators, then those one window back
+    """
+    requested = [ind.upper() for ind in indicators]
+    siblings = [ind for ind in gee_service.INDICATORS_CONFIG if ind not in requested]
+    prev_start, prev_end = previous_request_window(date_start, date_end)
+
+    targets = {}
+    for start, end, names in ((prev_start, prev_end, requested), (date_start, date_end, siblings),
+                              (prev_start, prev_end, siblings)):
+        for ind in names:
+            layer = gee_service.normalize_layer_request(coords, start, end, ind)
+            targets.setdefault(gee_service.layer_cache_key(*layer), layer)
+    return targets
+
+def previous_request_window(date_start, date_end):
+    """
+    periods.previous_window as a client paging back would request it: a month sent
+    as [1st, last day) (as the frontend does) is followed by the previous month in
+    the same form
+    """
+    prev_start, prev_end = periods.previous_window(date_start, date_end)
+    if date_start and date_end and periods.is_whole_month(date_start, date_end) and not date_end.endswith('-01'):
+        prev_end = (periods.parse_date(prev_end) - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    return prev_start, prev_end
+
+def prefetch_layers(client, coords, date_start=None, date_end=None, indicators=('NDVI',)):
+    """
+    Queue background map IDs for the layers likely to follow a request for `indicators`.
+    Layers already cached (or being computed) are skipped, and a client never has more
+    than PREFETCH_MAX_PER_CLIENT prefetches outstanding. Returns how many were queued.
+    """
+    requested = {
+        gee_service.layer_cache_key(*gee_service.normalize_layer_request(coords, date_start, date_end, ind))
+        for ind in indicators
+    }
+    queued = 0
+    for key, layer in prefetch_targets(coords, date_start, date_end, indicators).items():
+        if key in requested:
+            continue
+        with _prefetch_lock:
+            expire_prefetched()
+            if key in _prefetched or gee_service.LAYER_CACHE.contains(key):
+                count_prefetch('skipped_cached')
+                continue
+            if (_prefetch_pending.get(client, 0) >= PREFETCH_MAX_PER_CLIENT
+                    or sum(_prefetch_pending.values()) >= PREFETCH_MAX_PENDING):
+                count_prefetch('skipped_limit')
+                continue
+            _prefetch_pending[client] = _prefetch_pending.get(client, 0) + 1
+            _prefetched[key] = time.monotonic()
+            count_prefetch('scheduled')
+        # Submitted from a fresh context: no request deadline, trace or lane carries over
+        BACKGROUND_POOL.submit(contextvars.Context().run, run_prefetch, client, key, layer)
+        queued += 1
+    return queued
+
+def run_prefetch(client, key, layer):
+    coords, date_start, date_end, indicator = layer
+    try:
+        with lane_scope(PREFETCH_LANE):
+            gee_service.LAYER_CACHE.get_or_compute(
+                key, lambda: gee_service.compute_indicator_map_id(coords, date_start, date_end, indicator)
+            )
+        outcome = 'done'
+    except Exception as e:
+        print(f"Prefetch of {indicator} {date_start}..{date_end} failed: {e}")
+        outcome = 'failed'
+    with _prefetch_lock:
+        if outcome == 'failed':
+            _prefetched.pop(key, None)
+        remaining = _prefetch_pending[client] - 1
+        if remaining:
+            _prefetch_pending[client] = remaining
+        else:
+            del _prefetch_pending[client]
+        count_prefetch(outcome)
+
+def note_prefetch_use(key):
+    """
+    Called on every layer lookup. The first lookup of a prefetched layer counts as
+    'used' when the prefetch is cached or in flight, or 'missed' when the request
+    got there first (the prefetch was still queued, or its entry was evicted).
+    """
+    with _prefetch_lock:
+        if _prefetched.pop(key, None) is not None:
+            count_prefetch('used' if gee_service.LAYER_CACHE.contains(key) else 'missed')
+
+def expire_prefetched():
+    # Caller holds _prefetch_lock; prefetched layers nobody asked for before they expired
+    cutoff = time.monotonic() - gee_service.LAYER_CACHE.ttl_seconds
+    for key in [key for key, scheduled_at in _prefetched.items() if scheduled_at < cutoff]:
+        del _prefetched[key]
+        count_prefetch('expired')
+
+def count_prefetch(outcome):
+    # Caller holds _prefetch_lock
+    _prefetch_counts[outcome] += 1
+    metrics.PREFETCHES.inc(outcome=outcome)
+
+def prefetch_stats():
+    with _prefetch_lock:
+        expire_prefetched()
+        done = _prefetch_counts['done']
+        return {
+            **_prefetch_counts,
+            'pending': sum(_prefetch_pending.values()),
+            'unused': len(_prefetched),
+            'max_per_client': PREFETCH_MAX_PER_CLIENT,
+            'use_ratio': round(_prefetch_counts['used'] / done, 3) if done else 0.0
+        }
+
+gee_service.on_layer_lookup(note_prefetch_use)
@@ -0,0 +1,42 @@
+"""
+Shared test setup: the API runs against fake_ee (no Earth Engine credentials),
+with zero simulated latency and every store in a temporary directory.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DATA_DIR = tempfile.mkdtemp(prefix='gaiaeye-tests-')
+os.environ['GAIAEYE_DATA_DIR'] = DATA_DIR
+os.environ['GAIAEYE_TILE_STORE'] = os.path.join(DATA_DIR, 'tiles.mbtiles')
+os.environ['GAIAEYE_LOCAL_ARCHIVE'] = os.path.join(DATA_DIR, 'local_archive')
+os.environ['GAIAEYE_GEE_INIT'] = 'eager'
+os.environ['GAIAEYE_PREFETCH'] = '0'
+
+import fake_ee
+
+fake_ee.install(latency_ms={kind: (0, 0) for kind in ('getInfo', 'getMapId', 'fetch_tile', 'computePixels')})
+
+import gee_service
+
+# fake_ee cannot serialize graph templates (test_graph_templates.py runs them on the real client)
+gee_service.GRAPH_TEMPLATES = False
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    import app
+    return app.app
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+@pytest.fixture
+def roi():
+    return {'west': -7.65, 'south': 33.5, 'east': -7.55, 'north': 33.6}
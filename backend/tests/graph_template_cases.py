@@ -0,0 +1,56 @@
+"""
+Serialized request graphs built with and without graph templates, against the
+real earthengine-api (initialized offline like bench_graph_templates.py).
+The test process runs on fake_ee, so test_graph_templates.py runs this as a
+script and reads its JSON output: {case: {'template': ..., 'rebuilt': ...}}.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ee
+from ee import serializer
+
+import bench_graph_templates
+import gee_service
+
+DATE_START = '2024-03-01'
+DATE_END = '2024-05-30'
+
+# A field at native scale and a region whose reductions are coarsened (see reduction_plan)
+ROIS = {
+    'field': {'west': -7.65, 'south': 33.50, 'east': -7.55, 'north': 33.60},
+    'region': {'west': -8.5, 'south': 32.0, 'east': -6.0, 'north': 34.0},
+}
+SHARED_LAYERS = ('NDVI', 'EVI', 'NDWI', 'ELEVATION', 'SLOPE')
+
+def encode_both(build):
+    """build() serialized with templates on and off (composites shared in both, as in a request)"""
+    encoded = {}
+    for name, enabled in (('template', True), ('rebuilt', False)):
+        gee_service.GRAPH_TEMPLATES = enabled
+        with gee_service.composite_scope():
+            encoded[name] = serializer.encode(build(), for_cloud_api=True)
+    return encoded
+
+def cases():
+    for roi_name, coords in ROIS.items():
+        roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+        for indicator in gee_service.INDICATORS_CONFIG:
+            yield f'{roi_name}/layer/{indicator}', encode_both(
+                lambda: gee_service.layer_image(roi, DATE_START, DATE_END, indicator))
+
+        plan = gee_service.reduction_plan(coords)
+        yield f'{roi_name}/dashboard', encode_both(
+            lambda: gee_service.dashboard_reductions(roi, DATE_START, DATE_END, plan))
+        # Several templates in one graph share the ROI and the S2 composite like rebuilt layers do
+        yield f'{roi_name}/layers', encode_both(lambda: ee.Dictionary({
+            indicator: gee_service.layer_image(roi, DATE_START, DATE_END, indicator) for indicator in SHARED_LAYERS
+        }))
+
+if __name__ == '__main__':
+    bench_graph_templates.initialize_offline()
+    json.dump({'plans': {name: gee_service.reduction_plan(coords) for name, coords in ROIS.items()},
+               'cases': dict(cases())}, sys.stdout)
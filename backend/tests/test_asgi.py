@@ -0,0 +1,110 @@
+import asyncio
+import concurrent.futures
+import json
+import time
+
+import httpx
+import pytest
+
+import asgi
+import gee_service
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def post(path, body, headers=None):
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        return await client.post(path, json=body, headers=headers)
+
+def dashboard_body(offset):
+    # A different bbox per test, so the dashboard store never answers
+    west = -7.6 + offset * 0.1
+    return {'west': west, 'south': 33.5, 'east': west + 0.05, 'north': 33.55,
+            'date_start': '2024-01-01', 'date_end': '2024-04-01'}
+
+@pytest.fixture
+def slow_stages(monkeypatch):
+    """evaluate_dashboard_stages taking `delay[0]` seconds"""
+    delay = [0.0]
+    evaluate = gee_service.evaluate_dashboard_stages
+
+    def stub(*args, **kwargs):
+        time.sleep(delay[0])
+        return evaluate(*args, **kwargs)
+
+    monkeypatch.setattr(gee_service, 'evaluate_dashboard_stages', stub)
+    return delay
+
+
+def test_dashboard_through_executor(slow_stages):
+    response = run(post('/api/dashboard_stats', dashboard_body(1)))
+    assert response.status_code == 200
+    body = response.json()
+    assert body['success'] and body['cache'] == 'miss'
+    assert body['stats']['area_hectares'] > 0
+
+def test_deadline_exceeded_returns_504(slow_stages):
+    slow_stages[0] = 1.0
+    started = time.monotonic()
+    response = run(post('/api/dashboard_stats', dashboard_body(2), headers={'X-Request-Deadline': '0.2'}))
+    assert response.status_code == 504
+    assert time.monotonic() - started < 0.9
+
+def test_client_over_its_share_gets_429(slow_stages, monkeypatch):
+    slow_stages[0] = 0.5
+    monkeypatch.setattr(asgi, 'MAX_IN_FLIGHT_PER_CLIENT', 1)
+
+    async def both():
+        return await asyncio.gather(post('/api/dashboard_stats', dashboard_body(3)),
+                                    post('/api/dashboard_stats', dashboard_body(4)))
+
+    statuses = sorted(response.status_code for response in run(both()))
+    assert statuses == [200, 429]
+    assert asgi._in_flight == 0
+
+def test_streamed_response(monkeypatch):
+    monkeypatch.setattr(gee_service, 'reduce_field_chunk', lambda features, start, end: {})
+    feature = {'type': 'Feature', 'id': 'a', 'geometry': {
+        'type': 'Polygon', 'coordinates': [[[-7.6, 33.5], [-7.59, 33.5], [-7.59, 33.51], [-7.6, 33.5]]]}}
+
+    async def stream():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post('/api/fields/stream?date_start=2024-01-01&date_end=2024-04-01',
+                                     content=json.dumps(feature) + '\n')
+
+    response = run(stream())
+    assert response.status_code == 200
+    assert [json.loads(line)['id'] for line in response.text.splitlines()] == ['a']
+
+def test_stream_closed_when_no_chunk_could_be_submitted(monkeypatch):
+    class Body:
+        closed = False
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            return b'chunk'
+
+        def close(self):
+            Body.closed = True
+
+    class ShuttingDown:
+        # Runs the view, then refuses further work like a shut down executor
+        def submit(self, fn, *args):
+            if getattr(self, 'used', False):
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            self.used = True
+            future = concurrent.futures.Future()
+            future.set_result(fn(*args))
+            return future
+
+    monkeypatch.setattr(asgi, 'EXECUTOR', ShuttingDown())
+    monkeypatch.setattr(asgi, 'call_wsgi', lambda environ: (200, [('Content-Type', 'text/plain')], Body()))
+
+    with pytest.raises(RuntimeError, match='shutdown'):
+        run(post('/api/fields/stream', {}))
+    assert Body.closed
@@ -0,0 +1,102 @@
+import datetime
+import random
+
+import pytest
+
+import periods
+
+
+@pytest.mark.parametrize('window, previous', [
+    # Whole months, ending on the first of the next month or on their last day
+    (('2024-03-01', '2024-04-01'), ('2024-02-01', '2024-03-01')),
+    (('2024-03-01', '2024-03-31'), ('2024-02-01', '2024-03-01')),
+    (('2024-01-01', '2024-01-31'), ('2023-12-01', '2024-01-01')),
+    # Any other window: the same number of days right before it
+    (('2024-03-10', '2024-03-20'), ('2024-02-29', '2024-03-10')),
+    (('2024-03-01', '2024-03-15'), ('2024-02-16', '2024-03-01')),
+])
+def test_previous_window(window, previous):
+    assert periods.previous_window(*window) == previous
+
+def test_previous_window_is_adjacent():
+    # End-exclusive windows: the previous one ends where the window starts, so no day is skipped
+    rng = random.Random(7)
+    for _ in range(200):
+        start = datetime.date(2023, 1, 1) + datetime.timedelta(days=rng.randrange(700))
+        end = start + datetime.timedelta(days=rng.randrange(1, 120))
+        prev_start, prev_end = periods.previous_window(start.isoformat(), end.isoformat())
+        assert prev_end == start.isoformat()
+        assert prev_start < prev_end
+
+@pytest.mark.parametrize('window, earlier', [
+    (('2024-04-01', '2024-07-01'), ('2023-04-01', '2023-07-01')),
+    # The end follows the last included day: 28 February 2024 -> 28 February 2023
+    (('2024-02-01', '2024-02-29'), ('2023-02-01', '2023-03-01')),
+    (('2024-02-29', '2024-03-10'), ('2023-02-28', '2023-03-10')),
+])
+def test_last_year(window, earlier):
+    assert periods.comparison_window(*window, 'last_year') == earlier
+
+def test_explicit_and_invalid_comparisons():
+    explicit = {'date_start': '2023-01-01', 'date_end': '2023-02-01'}
+    assert periods.comparison_window('2024-01-01', '2024-02-01', explicit) == ('2023-01-01', '2023-02-01')
+    with pytest.raises(ValueError):
+        periods.comparison_window('2024-01-01', '2024-02-01', {'date_start': '2023-01-01'})
+    with pytest.raises(ValueError):
+        periods.comparison_window('2024-01-01', '2024-02-01', 'yesterday')
+
+@pytest.mark.parametrize('explicit', [
+    {'date_start': '2023-02-01', 'date_end': '2023-01-01'},
+    {'date_start': '2023-01-01', 'date_end': '2023-01-01'},
+    {'date_start': '2023-01-01', 'date_end': 'next week'},
+    {'date_start': '2023-13-01', 'date_end': '2023-14-01'},
+    {'date_start': 20230101, 'date_end': '2023-02-01'},
+])
+def test_explicit_comparison_dates_are_validated(client, roi, explicit):
+    with pytest.raises(ValueError):
+        periods.comparison_window('2024-01-01', '2024-02-01', explicit)
+    response = analyze(client, roi, date_start='2024-04-01', date_end='2024-05-01', compare_to=explicit)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    response = client.post('/api/dashboard_stats', json={
+        **roi, 'date_start': '2024-04-01', 'date_end': '2024-05-01', 'compare_to': explicit
+    })
+    assert response.status_code == 400
+
+
+def analyze(client, roi, **fields):
+    return client.post('/api/analyze', json={**roi, 'indicator': 'NDVI', **fields})
+
+def test_analyze_compare_response(client, roi):
+    response = analyze(client, roi, date_start='2024-04-01', date_end='2024-05-01', compare_to='previous')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert 'change' not in body
+    assert body['tile_url'].startswith('https://')
+    assert set(body) >= {'vis', 'before', 'after', 'delta', 'reused_before'}
+    assert body['before']['dates']['end'] == body['after']['dates']['start']
+
+def test_earlier_period_is_reused(client, roi):
+    first = {'date_start': '2023-05-01', 'date_end': '2023-06-01',
+             'compare_to': {'date_start': '2023-04-01', 'date_end': '2023-05-01'}}
+    second = {'date_start': '2023-06-01', 'date_end': '2023-07-01',
+              'compare_to': {'date_start': '2023-05-01', 'date_end': '2023-06-01'}}
+    assert analyze(client, roi, **first).get_json()['reused_before'] is False
+    assert analyze(client, roi, **second).get_json()['reused_before'] is True
+
+def test_analyze_compare_rejects(client, roi):
+    assert analyze(client, roi, indicator='SLOPE', compare_to='previous').status_code == 400
+    assert analyze(client, roi, compare_to='yesterday').status_code == 400
+    assert analyze(client, roi, indicators=['NDVI'], compare_to='previous').status_code == 400
+
+def test_dashboard_comparison_windows(client, roi):
+    body = {**roi, 'date_start': '2024-01-01', 'date_end': '2024-04-01', 'compare_to': 'previous'}
+    response = client.post('/api/dashboard_stats', json=body)
+    assert response.status_code == 200
+    comparison = response.get_json()['comparison']
+    assert comparison['dates'] == {'start': '2023-10-02', 'end': '2024-01-01'}
+    assert comparison['cache'] == 'miss'
+    assert set(comparison['delta']) == {
+        'mean_ndvi', 'expected_yield_tons_ha', 'avg_temperature_c', 'max_temperature_c', 'total_rainfall_mm',
+        'pest_risk_score', 'expected_revenue_usd', 'net_profit_usd', 'roi_percent'
+    }
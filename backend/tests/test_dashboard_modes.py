@@ -0,0 +1,52 @@
+import pytest
+
+import fake_ee
+import gee_service
+from cache import DashboardStore
+
+FIELD = {'west': 1.0, 'south': 43.0, 'east': 1.05, 'north': 43.05}
+REGION = {'west': 0.0, 'south': 42.0, 'east': 2.0, 'north': 44.0}
+
+
+@pytest.fixture
+def fixed_values(monkeypatch):
+    """fake_ee reductions return the middle of each band's range, whichever graph asks for them"""
+    def middle(band):
+        for prefix, (low, high) in fake_ee.VALUE_RANGES:
+            if band.startswith(prefix):
+                return (low + high) / 2
+        return 0.5
+    monkeypatch.setattr(fake_ee, '_band_value', middle)
+
+def stages(coords, batched, crop_type='wheat'):
+    roi = gee_service.ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    return gee_service.evaluate_dashboard_stages(
+        roi, '2024-04-01', '2024-05-01', crop_type, batched, plan=gee_service.reduction_plan(coords)
+    )
+
+
+@pytest.mark.parametrize('crop_type', ['wheat', 'rice'])
+@pytest.mark.parametrize('coords', [FIELD, REGION], ids=['field', 'region'])
+def test_batched_and_concurrent_stages_match(fixed_values, coords, crop_type):
+    batched = stages(coords, True, crop_type)
+    concurrent = stages(coords, False, crop_type)
+    assert batched == concurrent
+    assert set(batched) == {'area_ha', 'productivity', 'weather_risk', 'pest_risk', 'soil_health',
+                            'reduction_scales'}
+
+@pytest.mark.parametrize('batched', [True, False], ids=['batched', 'concurrent'])
+def test_dashboard_response_is_the_same_in_both_modes(client, fixed_values, monkeypatch, tmp_path, batched):
+    monkeypatch.setattr(gee_service, 'DASHBOARD_BATCHED', batched)
+    monkeypatch.setattr(gee_service, 'DASHBOARD_STORE', DashboardStore(str(tmp_path / 'dashboard.sqlite')))
+    calls = fake_ee.stats()['calls'].get('getInfo', 0)
+
+    response = client.post('/api/dashboard_stats', json={**FIELD, 'date_start': '2024-04-01',
+                                                         'date_end': '2024-05-01', 'crop_type': 'corn'})
+    assert response.status_code == 200
+    # One round trip in batched mode, one or more per stage otherwise
+    getinfo = fake_ee.stats()['calls']['getInfo'] - calls
+    assert (getinfo == 1) if batched else (getinfo >= 5)
+
+    other_mode = gee_service.calculate_dashboard_metrics(FIELD, '2024-04-01', '2024-05-01', 'corn', 500,
+                                                         batched=not batched)
+    assert response.get_json()['stats'] == other_mode
@@ -0,0 +1,124 @@
+import sqlite3
+import time
+
+import pytest
+
+import cache
+import fake_ee
+import gee_service
+from cache import DashboardStore, SeriesStore
+
+TTL = 60
+BODY = {'west': 3.0, 'south': 45.0, 'east': 3.05, 'north': 45.05,
+        'date_start': '2024-04-01', 'date_end': '2024-05-01', 'crop_type': 'wheat', 'input_costs': 500}
+
+
+class FakeClock:
+    """time.time() for the store's ages; monotonic() stays real (ResultCache, deadlines)"""
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return time.monotonic()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+@pytest.fixture
+def store(tmp_path, clock, monkeypatch):
+    store = DashboardStore(str(tmp_path / 'dashboard.sqlite'), ttl_seconds=TTL, max_stale_seconds=10 * TTL)
+    monkeypatch.setattr(gee_service, 'DASHBOARD_STORE', store)
+    return store
+
+def gee_calls():
+    return sum(fake_ee.stats()['calls'].values())
+
+def dashboard(client, **fields):
+    response = client.post('/api/dashboard_stats', json={**BODY, **fields})
+    assert response.status_code == 200, response.get_json()
+    data = response.get_json()
+    return data['stats'], data['cache']
+
+
+def test_stale_entry_is_served_then_refreshed_in_the_background(client, store, clock):
+    calls = gee_calls()
+    first, status = dashboard(client)
+    assert status == 'miss'
+    assert gee_calls() == calls + 1
+
+    clock.now += TTL + 1
+    stale, status = dashboard(client)
+    assert status == 'stale'
+    assert stale == first
+    wait_for(lambda: store.stats()['background_refreshes'] == 1 and store.stats()['refreshing'] == 0)
+    assert gee_calls() == calls + 2
+    assert store.stats()['refresh_errors'] == 0
+
+    # The refreshed row is fresh again: served from the store without another call
+    _, status = dashboard(client)
+    assert status == 'hit'
+    assert gee_calls() == calls + 2
+
+def test_entries_beyond_max_stale_are_recomputed(client, store, clock):
+    dashboard(client)
+    clock.now += 10 * TTL + 1
+    calls = gee_calls()
+    _, status = dashboard(client)
+    assert status == 'miss'
+    assert gee_calls() == calls + 1
+
+def test_input_costs_and_crop_changes_make_no_gee_call(client, store):
+    base, _ = dashboard(client)
+    calls = gee_calls()
+
+    cheaper, status = dashboard(client, input_costs=200)
+    assert status == 'hit'
+    assert cheaper['financial']['total_input_costs_usd'] < base['financial']['total_input_costs_usd']
+    assert cheaper['financial']['net_profit_usd'] > base['financial']['net_profit_usd']
+
+    corn, status = dashboard(client, crop_type='corn')
+    assert status == 'hit'
+    assert corn['crop_type'] == 'corn'
+    productivity = corn['productivity_index']
+    assert productivity['mean_ndvi'] == base['productivity_index']['mean_ndvi']
+    assert productivity['expected_yield_tons_ha'] == round(
+        gee_service.CROP_YIELDS['corn']['base_yield'] * productivity['yield_factor'], 2)
+
+    stages, _ = store.get(gee_service.dashboard_cache_key(BODY, BODY['date_start'], BODY['date_end']))
+    assert corn['financial'] == gee_service.calculate_financial_metrics(productivity, stages['area_ha'], 'corn', 500)
+    assert gee_calls() == calls
+
+
+def test_connections_are_closed(tmp_path, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+    def tracked(*args, **kwargs):
+        opened.append(connect(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(sqlite3, 'connect', tracked)
+
+    store = DashboardStore(str(tmp_path / 'dashboard.sqlite'))
+    store.put('k', {'area_ha': 1.0})
+    assert store.get('k') == ({'area_ha': 1.0}, False)
+    assert store.contains('k')
+    series = SeriesStore(str(tmp_path / 'series.sqlite'))
+    series.merge('roi', [('2024-01-01', 0.5, 10)], '2024-01-01', '2024-02-01')
+    assert series.coverage('roi') == ('2024-01-01', '2024-02-01')
+    assert series.series('roi', '2024-01-01', '2024-02-01') == [('2024-01-01', 0.5, 10)]
+
+    assert len(opened) == 8
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
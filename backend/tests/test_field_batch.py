@@ -0,0 +1,78 @@
+import json
+
+import gee_service
+
+
+def square(west, south, size=0.01):
+    ring = [[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+def field(index):
+    return {'type': 'Feature', 'id': f'f{index}', 'geometry': square(-7.6 + index * 0.01, 33.5)}
+
+def fake_reduce(calls):
+    def reduce_field_chunk(features, date_start, date_end):
+        calls.append(len(features))
+        return {index: {'area_m2': 10000.0, 'NDVI': 0.6, 'NDMI': 0.3, 'LST_Day_1km_mean': 22.0,
+                        'LST_Day_1km_max': 30.0, 'precipitation_sum': 80.0}
+                for index in range(len(features))}
+    return reduce_field_chunk
+
+
+def test_chunks_of_chunk_size_in_input_order(monkeypatch):
+    calls = []
+    monkeypatch.setattr(gee_service, 'reduce_field_chunk', fake_reduce(calls))
+
+    results = list(gee_service.iter_field_batch((field(i) for i in range(7)), '2024-01-01', '2024-04-01',
+                                                chunk_size=3))
+
+    assert calls == [3, 3, 1]
+    assert [r['id'] for r in results] == [f'f{i}' for i in range(7)]
+    assert all('error' not in r for r in results)
+
+def test_is_lazy(monkeypatch):
+    calls = []
+    monkeypatch.setattr(gee_service, 'reduce_field_chunk', fake_reduce(calls))
+    consumed = []
+
+    def features():
+        for i in range(10):
+            consumed.append(i)
+            yield field(i)
+
+    results = gee_service.iter_field_batch(features(), '2024-01-01', '2024-04-01', chunk_size=4)
+    next(results)
+    assert consumed == [0, 1, 2, 3]
+    assert calls == [4]
+
+def test_invalid_features_and_failed_chunks(monkeypatch):
+    def reduce_field_chunk(features, date_start, date_end):
+        if features[0]['id'] == 'f2':
+            raise RuntimeError('quota')
+        return fake_reduce([])(features, date_start, date_end)
+    monkeypatch.setattr(gee_service, 'reduce_field_chunk', reduce_field_chunk)
+
+    features = [field(0), {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]}}, field(2)]
+    results = list(gee_service.iter_field_batch(features, '2024-01-01', '2024-04-01', chunk_size=2))
+
+    assert [r['id'] for r in results] == ['f0', 1, 'f2']
+    assert 'error' not in results[0]
+    assert 'Polygon' in results[1]['error']
+    assert results[2]['error'] == 'quota'
+
+def test_stream_rejects_out_of_range_chunk_size(client):
+    body = json.dumps(field(0)) + '\n'
+    too_large = gee_service.FIELD_BATCH_CHUNK_SIZE + 1
+    assert client.post(f'/api/fields/stream?chunk_size={too_large}', data=body).status_code == 400
+    assert client.post('/api/fields/stream?chunk_size=0', data=body).status_code == 400
+
+def test_stream_emits_one_line_per_field(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(gee_service, 'reduce_field_chunk', fake_reduce(calls))
+    body = ''.join(json.dumps(field(i)) + '\n' for i in range(5))
+
+    response = client.post('/api/fields/stream?chunk_size=2&date_start=2024-01-01&date_end=2024-04-01', data=body)
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['id'] for line in lines] == [f'f{i}' for i in range(5)]
+    assert calls == [2, 2, 1]
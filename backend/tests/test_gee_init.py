@@ -0,0 +1,143 @@
+import json
+import threading
+
+import pytest
+
+import fake_ee
+import gee_service
+
+COORDS = {'west': 7.0, 'south': 46.0, 'east': 7.05, 'north': 46.05}
+
+
+@pytest.fixture
+def init(flask_app, monkeypatch):
+    """
+    Earth Engine back to 'not_started', with an initialize_gee that waits for init.release
+    and raises init.error if set. The ready state is restored afterwards.
+    """
+    class Init:
+        release = threading.Event()
+        error = None
+        calls = 0
+
+    def initialize(allow_authenticate=True):
+        Init.calls += 1
+        Init.release.wait(5)
+        if Init.error:
+            raise RuntimeError(Init.error)
+
+    monkeypatch.setattr(gee_service, 'initialize_gee', initialize)
+    monkeypatch.setitem(flask_app.config, 'GEE_READY_WAIT_SECONDS', 0.05)
+    status = gee_service.gee_status()
+    gee_service._gee_status.update(state='not_started', error=None, started_at=None, finished_at=None)
+    gee_service._gee_init_done.clear()
+    yield Init
+    Init.release.set()
+    gee_service._gee_init_done.wait(5)
+    gee_service._gee_status.update(status)
+    gee_service._gee_init_done.set()
+
+def analyze(client):
+    return client.post('/api/analyze', json={**COORDS, 'indicator': 'NDVI'})
+
+
+def test_starting_then_ready(client, init):
+    response = client.get('/api/ready')
+    assert response.status_code == 503
+    assert response.get_json()['gee']['state'] == 'initializing'
+    assert gee_service.start_gee_initialization() is False
+
+    # Requests that need EE get a 503 while it initializes; EE-free ones are served
+    response = analyze(client)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert 'not ready (initializing)' in response.get_json()['error']
+    assert client.get('/api/cache_stats').status_code == 200
+
+    init.release.set()
+    assert gee_service.wait_for_gee(5)
+    response = client.get('/api/ready')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] is True
+    assert response.get_json()['gee']['finished_at'] >= response.get_json()['gee']['started_at']
+    assert analyze(client).status_code == 200
+    assert init.calls == 1
+
+def test_failed_then_retried(client, init, monkeypatch):
+    init.error = 'no credentials'
+    init.release.set()
+    assert gee_service.wait_for_gee(5) is False
+    status = gee_service.gee_status()
+    assert status['state'] == 'failed' and status['error'] == 'no credentials'
+
+    response = analyze(client)
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'Earth Engine is not ready (failed): no credentials'
+    assert client.get('/api/ready').status_code == 503
+    # Not retried within GEE_INIT_RETRY_SECONDS...
+    assert init.calls == 1
+
+    # ...but on the first request after it
+    init.error = None
+    monkeypatch.setattr(gee_service, 'GEE_INIT_RETRY_SECONDS', 0)
+    assert analyze(client).status_code == 200
+    assert init.calls == 2
+    assert gee_service.gee_status()['state'] == 'ready'
+
+def test_ready_callbacks_run_once_ready(init, monkeypatch):
+    ran = []
+    def broken():
+        raise RuntimeError("callback failed")
+    monkeypatch.setattr(gee_service, '_gee_ready_callbacks', [broken, lambda: ran.append('warm')])
+
+    gee_service.start_gee_initialization()
+    assert ran == []
+    init.release.set()
+    assert gee_service.wait_for_gee(5)
+    for _ in range(500):
+        if ran:
+            break
+        threading.Event().wait(0.01)
+    assert ran == ['warm']
+
+
+def test_warmup_fills_the_caches(client):
+    roi = {**COORDS, 'date_start': '2024-05-01', 'date_end': '2024-06-01'}
+    gee_service.warm_caches([roi, {'north': 'far'}], indicators=('NDVI', 'LST'))
+
+    status = gee_service.warmup_status()
+    assert status['state'] == 'done'
+    assert (status['rois'], status['layers'], status['dashboards']) == (2, 2, 1)
+    assert len(status['errors']) == 1 and status['errors'][0].startswith('Invalid ROI')
+
+    for indicator in ('NDVI', 'LST'):
+        layer = gee_service.normalize_layer_request(COORDS, roi['date_start'], roi['date_end'], indicator)
+        assert gee_service.LAYER_CACHE.contains(gee_service.layer_cache_key(*layer))
+    window = gee_service.resolve_dashboard_window(roi['date_start'], roi['date_end'])
+    assert gee_service.DASHBOARD_STORE.contains(gee_service.dashboard_cache_key(COORDS, *window))
+
+    # The first user requests are served without a round trip
+    fake_ee.reset_stats()
+    assert client.post('/api/analyze', json={**roi, 'indicators': ['NDVI', 'LST']}).status_code == 200
+    response = client.post('/api/dashboard_stats', json={**roi, 'crop_type': 'corn'})
+    assert response.status_code == 200
+    assert response.get_json()['cache'] == 'hit'
+    assert fake_ee.stats()['calls'] == {}
+
+def test_warmup_file_runs_when_ready(flask_app, init, tmp_path, monkeypatch):
+    coords = {**COORDS, 'west': 7.1, 'east': 7.15}
+    path = tmp_path / 'warmup.json'
+    path.write_text(json.dumps({'rois': [coords], 'indicators': ['EVI'], 'dashboard': False}))
+    monkeypatch.setitem(flask_app.config, 'WARMUP_FILE', str(path))
+    monkeypatch.setattr(gee_service, '_warmup_status', dict(gee_service._warmup_status, state='idle'))
+
+    gee_service.start_gee_initialization()
+    init.release.set()
+    assert gee_service.wait_for_gee(5)
+    for _ in range(500):
+        if gee_service.warmup_status()['state'] == 'done':
+            break
+        threading.Event().wait(0.01)
+    assert gee_service.warmup_status()['layers'] == 1
+    layer = gee_service.normalize_layer_request(coords, None, None, 'EVI')
+    assert gee_service.LAYER_CACHE.contains(gee_service.layer_cache_key(*layer))
@@ -0,0 +1,112 @@
+import math
+import struct
+
+import numpy as np
+import pytest
+
+import gee_service
+import geotiff
+import layer_export
+
+TYPE_SIZES = {3: 2, 4: 4, 2: 1, 12: 8}
+TYPE_FORMATS = {3: 'H', 4: 'I', 12: 'd'}
+
+
+def read_tags(data):
+    """{tag: tuple of values (bytes for ASCII)} of the first IFD"""
+    assert data[:4] == b'II*\0'
+    ifd = struct.unpack('<I', data[4:8])[0]
+    count = struct.unpack('<H', data[ifd:ifd + 2])[0]
+    tags = {}
+    for index in range(count):
+        entry = ifd + 2 + 12 * index
+        tag, kind, values, offset = struct.unpack('<HHII', data[entry:entry + 12])
+        size = TYPE_SIZES[kind] * values
+        raw = data[entry + 8:entry + 8 + size] if size <= 4 else data[offset:offset + size]
+        tags[tag] = struct.unpack(f'<{values}{TYPE_FORMATS[kind]}', raw) if kind in TYPE_FORMATS else raw
+    return tags
+
+
+def test_tile_grid():
+    assert geotiff.tile_grid(1024, 512, 512) == (2, 1)
+    assert geotiff.tile_grid(1025, 1, 512) == (3, 1)
+
+def test_tiled_header_layout():
+    header = geotiff.tiled_header(1000, 600, 256, (0.0012, 0.001), -7.6, 33.6, -9999.0)
+    tags = read_tags(header)
+    tile_bytes = 256 * 256 * 4
+
+    assert tags[256] == (1000,) and tags[257] == (600,)
+    assert tags[322] == (256,) and tags[323] == (256,)
+    # 4 x 3 tiles, each at a fixed offset right after the header, in row-major order
+    assert tags[324] == tuple(len(header) + index * tile_bytes for index in range(12))
+    assert tags[325] == (tile_bytes,) * 12
+    assert tags[339] == (3,)
+    assert tags[33550] == (0.0012, 0.001, 0.0)
+    assert tags[33922][3:5] == (-7.6, 33.6)
+    assert tags[42113] == b'-9999\0'
+
+def test_tiled_header_rejects_bad_tile_size():
+    with pytest.raises(ValueError):
+        geotiff.tiled_header(100, 100, 100, (0.001, 0.001), 0, 0, -9999.0)
+
+def test_encode_tile_pads_edge_blocks():
+    data = geotiff.encode_tile(np.ones((2, 3)), 16, -9999.0)
+    tile = np.frombuffer(data, dtype='<f4').reshape(16, 16)
+    assert (tile[:2, :3] == 1).all()
+    assert (tile[2:, :] == -9999).all() and (tile[:, 3:] == -9999).all()
+
+
+def test_export_grid():
+    coords = {'west': -7.65, 'south': 33.5, 'east': -7.55, 'north': 33.6}
+    grid = layer_export.export_grid(coords, 'LST')
+    assert grid['scale'] == 1000
+    # 0.1 degrees of longitude at 33.55 N are about 9.3 km, 0.1 degrees of latitude about 11.1 km
+    assert (grid['width'], grid['height']) == (10, 12)
+    meters_per_degree = math.radians(gee_service.EARTH_RADIUS_M)
+    assert grid['pixel_deg_y'] * meters_per_degree == pytest.approx(1000)
+    assert grid['pixel_deg_x'] * meters_per_degree * math.cos(math.radians(33.55)) == pytest.approx(1000)
+
+    equator = layer_export.export_grid({'west': 0, 'south': -0.05, 'east': 0.1, 'north': 0.05}, 'LST')
+    assert equator['pixel_deg_x'] == pytest.approx(equator['pixel_deg_y'], rel=1e-6)
+    with pytest.raises(ValueError):
+        layer_export.export_grid(coords, 'NDVI', scale=-10)
+
+def test_export_block_affine_uses_both_pixel_sizes(monkeypatch):
+    requests = []
+    def compute_pixels(request):
+        requests.append(request)
+        return np.zeros((request['grid']['dimensions']['height'], request['grid']['dimensions']['width']))
+    monkeypatch.setattr(layer_export.ee.data, 'computePixels', compute_pixels)
+
+    grid = layer_export.export_grid({'west': 10.0, 'south': 59.9, 'east': 10.1, 'north': 60.0}, 'LST')
+    layer_export.fetch_export_block(None, grid, (2, 3, 4, 5), 'LST')
+    transform = requests[0]['grid']['affineTransform']
+    assert transform['scaleX'] * math.cos(math.radians(59.95)) == pytest.approx(-transform['scaleY'])
+    assert transform['translateX'] == 10.0 + 2 * grid['pixel_deg_x']
+    assert transform['translateY'] == 60.0 - 3 * grid['pixel_deg_y']
+
+def test_export_blocks_cover_the_grid(monkeypatch):
+    monkeypatch.setattr(layer_export, 'EXPORT_CHUNK_PX', 16)
+    blocks = list(layer_export.export_blocks({'width': 40, 'height': 20}))
+    assert blocks[:4] == [(0, 0, 16, 16), (16, 0, 16, 16), (32, 0, 8, 16), (0, 16, 16, 4)]
+    assert sum(width * height for _, _, width, height in blocks) == 40 * 20
+
+def test_export_response_is_a_complete_tiff(client, roi, monkeypatch):
+    monkeypatch.setattr(layer_export, 'EXPORT_CHUNK_PX', 64)
+    response = client.post('/api/export', json={**roi, 'indicator': 'SLOPE', 'scale': 250,
+                                                'date_start': '2024-01-01', 'date_end': '2024-02-01'})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="slope_2024-01-01_2024-02-01.tif"'
+
+    data = response.get_data()
+    tags = read_tags(data)
+    grid = layer_export.export_grid(roi, 'SLOPE', 250)
+    assert (tags[256][0], tags[257][0]) == (grid['width'], grid['height'])
+    assert tags[33550] == (grid['pixel_deg_x'], grid['pixel_deg_y'], 0.0)
+    assert tags[324][-1] + tags[325][-1] == len(data)
+
+def test_export_too_large(client, roi):
+    response = client.post('/api/export', json={**roi, 'indicator': 'NDVI', 'scale': 0.5})
+    assert response.status_code == 400
+    assert 'exceeds the limit' in response.get_json()['error']
@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import gee_service
+
+CASES_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graph_template_cases.py')
+
+
+@pytest.fixture(scope='module')
+def graphs():
+    """Graphs from the real earthengine-api (this process runs on fake_ee)"""
+    result = subprocess.run([sys.executable, CASES_SCRIPT], capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+def test_both_roi_sizes_are_covered(graphs):
+    plans = graphs['plans']
+    assert plans['field']['ndvi']['scale'] == gee_service.NATIVE_SCALES['ndvi']
+    assert plans['region']['ndvi']['scale'] > gee_service.NATIVE_SCALES['ndvi']
+
+@pytest.mark.parametrize('roi', ['field', 'region'])
+@pytest.mark.parametrize('graph', [f'layer/{indicator}' for indicator in gee_service.INDICATORS_CONFIG] +
+                         ['dashboard', 'layers'])
+def test_template_graph_is_the_rebuilt_graph(graphs, roi, graph):
+    case = graphs['cases'][f'{roi}/{graph}']
+    assert case['template'] == case['rebuilt']
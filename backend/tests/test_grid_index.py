@@ -0,0 +1,193 @@
+import numpy as np
+import pytest
+
+import ee
+import gee_service
+import grid_index
+import grid_service
+
+MONTHS = ('2024-01', '2024-02', '2024-03')
+WINDOW = ('2024-01-01', '2024-04-01')
+ORIGIN = (-7.68, 33.44)
+SIZE = 16
+# Whole cells 2..14 (rows) by 3..13 (columns) of the region
+COORDS = {'west': -7.65, 'south': 33.46, 'east': -7.55, 'north': 33.58}
+NDMI = {'nd': 0.27}
+
+# Observations per pixel and month; the pooled NDVI and LST means match the live
+# per-pixel temporal means only when these are the same for every pixel
+NDVI_PER_MONTH, LST_PER_MONTH, PENTADS_PER_MONTH = 3, 4, 6
+
+
+def synthetic_months(seed=0):
+    """Per-pixel observations for every month, one pixel per finest cell"""
+    rng = np.random.default_rng(seed)
+    return {
+        month: {
+            'ndvi': rng.uniform(0.1, 0.8, (NDVI_PER_MONTH, SIZE, SIZE)),
+            'lst': rng.uniform(5, 45, (LST_PER_MONTH, SIZE, SIZE)),
+            'rain': rng.gamma(2.0, 8.0, (PENTADS_PER_MONTH, SIZE, SIZE))
+        }
+        for month in MONTHS
+    }
+
+def cell_sums(observations):
+    """A month's finest-level grid array, as reduce_grid_cells would store it"""
+    bands = {
+        'ndvi_sum': observations['ndvi'].sum(axis=0),
+        'ndvi_count': np.full((SIZE, SIZE), NDVI_PER_MONTH),
+        'lst_sum': observations['lst'].sum(axis=0),
+        'lst_count': np.full((SIZE, SIZE), LST_PER_MONTH),
+        'lst_max_sum': observations['lst'].max(axis=0),
+        'lst_max_count': np.ones((SIZE, SIZE)),
+        'rain_sum': observations['rain'].sum(axis=0),
+        'rain_count': np.ones((SIZE, SIZE))
+    }
+    return np.stack([bands[band] for band in grid_index.BANDS])
+
+def live_values(data, area_m2):
+    """What the batched live reduction returns: spatial means of per-pixel temporal stats"""
+    inside = (slice(2, 14), slice(3, 13))
+    def window(name):
+        return np.concatenate([data[month][name] for month in MONTHS])[(slice(None),) + inside]
+    return {
+        'area_m2': area_m2,
+        'ndvi': {'NDVI': window('ndvi').mean(axis=0).mean()},
+        'lst': {'LST_Day_1km_mean': window('lst').mean(axis=0).mean(),
+                'LST_Day_1km_max': window('lst').max(axis=0).mean()},
+        'rain': {'precipitation_sum': window('rain').sum(axis=0).mean(),
+                 'precipitation_mean': window('rain').mean(axis=0).mean()},
+        'ndmi': NDMI
+    }
+
+@pytest.fixture
+def indexed(tmp_path, monkeypatch):
+    data = synthetic_months()
+    region = grid_index.GridRegion('test', *ORIGIN, SIZE, SIZE)
+    for month in MONTHS:
+        region.set_month(month, cell_sums(data[month]))
+    index = grid_index.GridIndex(str(tmp_path))
+    index.save(region)
+
+    monkeypatch.setattr(grid_service, 'GRID_INDEX', index)
+    monkeypatch.setattr(grid_service, 'GRID_INDEX_ENABLED', True)
+    monkeypatch.setattr(grid_service, 'GRID_EDGE_MODE', 'gee')
+
+    area_m2 = gee_service.estimate_area_m2(COORDS)
+    calls = []
+    def fake_get_info(obj, stage):
+        calls.append(stage)
+        if stage == 'dashboard_batch':
+            return live_values(data, area_m2)
+        if stage == 'grid_live':
+            return {'ndmi': NDMI}
+        raise AssertionError(f"unexpected round trip {stage}")
+    monkeypatch.setattr(gee_service, 'gee_get_info', fake_get_info)
+    return {'data': data, 'region': index.find(COORDS, MONTHS), 'calls': calls, 'area_m2': area_m2}
+
+def dashboard(coords, date_start, date_end):
+    roi = ee.Geometry.Rectangle([coords['west'], coords['south'], coords['east'], coords['north']])
+    stages = gee_service.evaluate_dashboard_stages(roi, date_start, date_end, 'wheat', batched=True, coords=coords)
+    return {name: value for name, value in stages.items() if name not in ('reduction_scales', 'source')}, stages
+
+
+def test_sum_cells_matches_brute_force():
+    rng = np.random.default_rng(1)
+    region = grid_index.GridRegion('sums', *ORIGIN, 32, 48)
+    for month in MONTHS:
+        region.set_month(month, rng.uniform(0, 10, (len(grid_index.BANDS), 32, 48)))
+    months, data = region.snapshot()
+    for _ in range(50):
+        r0, r1 = sorted(rng.integers(0, 33, 2))
+        c0, c1 = sorted(rng.integers(0, 49, 2))
+        chosen = list(rng.choice(MONTHS, rng.integers(1, 4), replace=False))
+        totals, _ = region.sum_cells(chosen, r0, r1, c0, c1)
+        expected = data[0][[months.index(m) for m in chosen], :, r0:r1, c0:c1].sum(axis=(0, 2, 3))
+        assert totals == pytest.approx(expected)
+
+def test_sum_cells_uses_coarse_levels():
+    region = grid_index.GridRegion('levels', *ORIGIN, 32, 32)
+    region.set_month('2024-01', np.ones((len(grid_index.BANDS), 32, 32)))
+    totals, cells = region.sum_cells(['2024-01'], 0, 32, 0, 32)
+    assert totals[0] == 32 * 32
+    assert cells == [0, 0, 4]
+    _, cells = region.sum_cells(['2024-01'], 1, 17, 0, 16)
+    assert sum(cells) < 16 * 16
+
+def test_set_month_swaps_a_new_snapshot():
+    region = grid_index.GridRegion('months', *ORIGIN, SIZE, SIZE)
+    region.set_month('2024-03', np.ones((len(grid_index.BANDS), SIZE, SIZE)))
+    old_months, old_data = region.snapshot()
+
+    region.set_month('2024-01', np.full((len(grid_index.BANDS), SIZE, SIZE), 2.0))
+    region.set_month('2024-03', np.full((len(grid_index.BANDS), SIZE, SIZE), 3.0))
+    assert region.months == ['2024-01', '2024-03']
+    assert region.sum_cells(['2024-03'], 0, 1, 0, 1)[0][0] == 3.0
+    # A reader still holding the old snapshot sees it unchanged
+    assert old_months == ['2024-03']
+    assert old_data[0][0, 0, 0, 0] == 1.0
+
+def test_set_month_rejects_a_wrong_shape():
+    region = grid_index.GridRegion('shape', *ORIGIN, SIZE, SIZE)
+    with pytest.raises(ValueError):
+        region.set_month('2024-01', np.zeros((len(grid_index.BANDS), SIZE, SIZE - 1)))
+
+def test_cell_weights_cover_partial_cells():
+    region = grid_index.GridRegion('weights', *ORIGIN, SIZE, SIZE)
+    coords = {'west': -7.675, 'south': 33.44, 'east': -7.65, 'north': 33.4625}
+    r0, r1, c0, c1, weights = region.cell_weights(coords)
+    assert (r0, r1, c0, c1) == (0, 3, 0, 3)
+    assert weights[:, 0] == pytest.approx([0.5, 0.5, 0.125])
+    assert weights[0, 1:] == pytest.approx([1.0, 1.0])
+    assert weights.sum() * 1e-4 == pytest.approx(0.025 * 0.0225)
+
+
+def test_grid_is_off_by_default():
+    assert grid_service.GRID_INDEX_ENABLED is False
+    assert not gee_service.precomputed_covers(COORDS, *WINDOW)
+
+def test_grid_values_match_the_live_reduction(indexed):
+    region = indexed['region']
+    totals = grid_service.grid_window_totals(region, COORDS, list(MONTHS))
+    values = grid_service.grid_dashboard_values(totals, NDMI, indexed['area_m2'])
+    expected = live_values(indexed['data'], indexed['area_m2'])
+    for group, keys in (('ndvi', ['NDVI']), ('lst', ['LST_Day_1km_mean', 'LST_Day_1km_max']),
+                        ('rain', ['precipitation_sum'])):
+        for key in keys:
+            assert values[group][key] == pytest.approx(expected[group][key]), key
+
+def test_grid_stages_match_evaluate_dashboard_stages(indexed, monkeypatch):
+    monkeypatch.setattr(grid_service, 'GRID_INDEX_ENABLED', False)
+    live, _ = dashboard(COORDS, *WINDOW)
+    assert indexed['calls'] == ['dashboard_batch']
+
+    monkeypatch.setattr(grid_service, 'GRID_INDEX_ENABLED', True)
+    assert gee_service.precomputed_covers(COORDS, *WINDOW)
+    from_grid, stages = dashboard(COORDS, *WINDOW)
+    assert stages['source'] == 'grid_index'
+    # The NDMI composite is still reduced live, alone in its round trip as the bbox lies on cell lines
+    assert indexed['calls'][1:] == ['grid_live']
+    assert from_grid == live
+
+def test_weighted_edges_match_on_cell_lines(indexed, monkeypatch):
+    totals = grid_service.grid_window_totals(indexed['region'], COORDS, list(MONTHS))
+    monkeypatch.setattr(grid_service, 'GRID_EDGE_MODE', 'weighted')
+    weighted = grid_service.grid_window_totals(indexed['region'], COORDS, list(MONTHS))
+    for name, (total, count) in totals.items():
+        assert weighted[name] == pytest.approx((total, count))
+
+@pytest.mark.parametrize('window', [
+    ('2024-01-01', '2024-03-31'),   # the frontend's [1st, last day) form leaves out a day
+    ('2024-01-15', '2024-04-01'),
+    ('2023-12-01', '2024-04-01'),   # December is not indexed
+])
+def test_other_windows_are_reduced_live(indexed, window):
+    assert not gee_service.precomputed_covers(COORDS, *window)
+    _, stages = dashboard(COORDS, *window)
+    assert 'source' not in stages
+    assert indexed['calls'] == ['dashboard_batch']
+
+def test_edges_only_off_cell_lines(indexed):
+    region = indexed['region']
+    assert grid_service.grid_edges(region, COORDS) is None
+    assert grid_service.grid_edges(region, {**COORDS, 'west': -7.655}) is not None
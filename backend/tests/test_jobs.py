@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+import app as app_module
+import jobs
+from jobs import JobManager, JobQueueFull
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+@pytest.fixture
+def gate():
+    """An event that blocked jobs wait on; set at teardown so no worker stays stuck"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+@pytest.fixture
+def manager(flask_app, monkeypatch):
+    """A small job manager behind the jobs routes: one worker, room for one waiting job"""
+    manager = JobManager(workers=1, max_queue=1)
+    monkeypatch.setattr(app_module, 'job_manager', manager)
+    return manager
+
+@pytest.fixture
+def job_types(monkeypatch):
+    """Replace the route's job types by functions set per test"""
+    functions = {}
+    for kind in app_module.JOB_TYPES:
+        monkeypatch.setitem(app_module.JOB_TYPES, kind,
+                            lambda params, host_url, kind=kind: functions[kind](params))
+    return functions
+
+
+def test_identical_params_are_merged(gate):
+    manager = JobManager(workers=1)
+    first, merged = manager.submit('analyze', {'north': 1, 'south': 0, 'indicators': ['NDVI']}, gate.wait)
+    assert not merged
+    # Same params in another key order: same dedup key
+    again, merged = manager.submit('analyze', {'indicators': ['NDVI'], 'south': 0, 'north': 1}, gate.wait)
+    assert merged and again is first
+    other, merged = manager.submit('analyze', {'north': 2, 'south': 0, 'indicators': ['NDVI']}, gate.wait)
+    assert not merged and other is not first
+    other_kind, merged = manager.submit('dashboard', {'north': 1, 'south': 0, 'indicators': ['NDVI']}, gate.wait)
+    assert not merged
+    assert manager.stats()['merged'] == 1
+
+    gate.set()
+    wait_for(lambda: first.status == 'done')
+    # Once the job has finished, the same params start a new one
+    fresh, merged = manager.submit('analyze', {'north': 1, 'south': 0, 'indicators': ['NDVI']}, lambda: 1)
+    assert not merged and fresh is not first
+
+def test_finished_jobs_are_pruned_after_their_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(jobs, 'time', clock)
+    manager = JobManager(workers=1, result_ttl_seconds=60)
+    done, _ = manager.submit('analyze', {'n': 1}, lambda: 'result')
+    wait_for(lambda: done.status == 'done')
+    assert done.finished_at == clock.now
+
+    clock.now += 60
+    manager.submit('analyze', {'n': 2}, lambda: 'result')
+    assert manager.get(done.id) is done
+    clock.now += 1
+    manager.submit('analyze', {'n': 3}, lambda: 'result')
+    assert manager.get(done.id) is None
+
+
+def test_full_queue_answers_429(client, manager, job_types, gate):
+    job_types['analyze'] = lambda params: (gate.wait(5), ({'success': True}, 200))[1]
+
+    running = client.post('/api/jobs', json={'type': 'analyze', 'params': {'n': 1}})
+    assert running.status_code == 202
+    wait_for(lambda: manager.get(running.get_json()['job_id']).status == 'running')
+    assert client.post('/api/jobs', json={'type': 'analyze', 'params': {'n': 2}}).status_code == 202
+
+    response = client.post('/api/jobs', json={'type': 'analyze', 'params': {'n': 3}})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '5'
+    assert response.get_json()['success'] is False
+    # A merged submit takes no queue slot
+    merged = client.post('/api/jobs', json={'type': 'analyze', 'params': {'n': 2}})
+    assert merged.status_code == 202 and merged.get_json()['merged'] is True
+    assert manager.stats()['rejected'] == 1
+
+    with pytest.raises(JobQueueFull):
+        manager.submit('analyze', {'n': 4}, gate.wait)
+
+def test_job_routes_serve_pending_done_and_failed_states(client, manager, job_types, gate):
+    job_types['analyze'] = lambda params: (gate.wait(5), ({'success': True, 'tile_url': 'x'}, 200))[1]
+    job_types['dashboard'] = lambda params: ({'error': 'Missing coordinates'}, 400)
+    def broken(params):
+        raise RuntimeError("GEE said no")
+    job_types['grid_index'] = broken
+
+    submitted = client.post('/api/jobs', json={'type': 'analyze', 'params': {'n': 1}}).get_json()
+    assert submitted['status_url'] == f"/api/jobs/{submitted['job_id']}"
+    pending = client.get(submitted['result_url'])
+    assert pending.status_code == 202
+    assert pending.get_json()['status'] in ('queued', 'running')
+
+    gate.set()
+    wait_for(lambda: client.get(submitted['status_url']).get_json()['status'] == 'done')
+    done = client.get(submitted['result_url'])
+    assert done.status_code == 200
+    assert done.get_json() == {'success': True, 'tile_url': 'x'}
+
+    # The endpoint's own status is kept, failures answer 500
+    invalid = client.post('/api/jobs', json={'type': 'dashboard', 'params': {}}).get_json()
+    wait_for(lambda: manager.get(invalid['job_id']).status == 'done')
+    assert client.get(invalid['result_url']).status_code == 400
+
+    failed = client.post('/api/jobs', json={'type': 'grid_index', 'params': {}}).get_json()
+    wait_for(lambda: manager.get(failed['job_id']).status == 'failed')
+    response = client.get(failed['result_url'])
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'GEE said no', 'success': False}
+    assert client.get(failed['status_url']).get_json()['error'] == 'GEE said no'
+
+    assert client.get('/api/jobs/unknown').status_code == 404
+    assert client.get('/api/jobs/unknown/result').status_code == 404
+    assert client.post('/api/jobs', json={'type': 'export', 'params': {}}).status_code == 400
+    assert client.post('/api/jobs', json={'type': 'analyze', 'params': []}).status_code == 400
@@ -0,0 +1,159 @@
+import json
+import math
+import statistics
+
+import numpy as np
+import pytest
+
+import local_engine
+
+WEST, NORTH, PIXEL = 10.0, 46.0, 0.001
+WIDTH, HEIGHT = 8, 6
+SITE = {'west': WEST, 'south': NORTH - HEIGHT * PIXEL, 'east': WEST + WIDTH * PIXEL, 'north': NORTH}
+CLOUD_BIT, CIRRUS_BIT = 1 << 10, 1 << 11
+
+# Scene date -> CLOUDY_PIXEL_PERCENTAGE
+SCENES = {'2024-05-03': 5, '2024-05-08': 12, '2024-05-13': 15, '2024-05-18': 50, '2024-05-23': 1}
+
+
+@pytest.fixture(scope='module')
+def archive(tmp_path_factory):
+    """A synthetic site: five scenes with random reflectance and a few cloudy pixels"""
+    root = tmp_path_factory.mktemp('local_archive')
+    site = root / 'site_a'
+    site.mkdir()
+    (site / 'site.json').write_text(json.dumps({
+        'west': WEST, 'north': NORTH, 'pixel_size': [PIXEL, PIXEL], 'width': WIDTH, 'height': HEIGHT
+    }))
+    rng = np.random.default_rng(7)
+    scenes = {}
+    for index, (date, cloud) in enumerate(SCENES.items()):
+        bands = {name: rng.integers(200, 4000, (HEIGHT, WIDTH)).astype(np.uint16)
+                 for name in ('B2', 'B3', 'B4', 'B8', 'B11')}
+        qa = np.zeros((HEIGHT, WIDTH), dtype=np.uint16)
+        qa[index % HEIGHT, :3] = CLOUD_BIT
+        qa[:, (index + 4) % WIDTH] |= CIRRUS_BIT
+        bands['QA60'] = qa
+        scene_dir = site / date
+        scene_dir.mkdir()
+        for name, values in bands.items():
+            np.save(scene_dir / f'{name}.npy', values)
+        (scene_dir / 'scene.json').write_text(json.dumps({'CLOUDY_PIXEL_PERCENTAGE': cloud}))
+        scenes[date] = bands
+    return str(root), scenes
+
+def clear_scenes(scenes, start, end, max_cloud):
+    return [bands for date, bands in scenes.items() if start <= date < end and SCENES[date] < max_cloud]
+
+def reflectance(bands, name, row, col):
+    """Masked reflectance of one pixel, None under QA60 cloud or cirrus (as mask_s2_clouds)"""
+    if bands['QA60'][row, col] & (CLOUD_BIT | CIRRUS_BIT):
+        return None
+    return bands[name][row, col] / 10000
+
+def nd(a, b):
+    return (a - b) / (a + b)
+
+def spatial_stats(per_pixel):
+    values = [value for value in per_pixel if value is not None and math.isfinite(value)]
+    return {'mean': statistics.fmean(values), 'min': min(values), 'max': max(values), 'pixels': len(values)}
+
+def pixels(rows=range(HEIGHT), cols=range(WIDTH)):
+    return [(row, col) for row in rows for col in cols]
+
+
+def test_workers_are_spawned():
+    assert local_engine.get_pool()._mp_context.get_start_method() == 'spawn'
+
+def test_series_mean_matches_a_collection_mean(archive):
+    # s2.map(ndvi).mean() per pixel, then a reduceRegion mean
+    root, scenes = archive
+    used = clear_scenes(scenes, '2024-05-01', '2024-06-01', 20)
+    def pixel_mean(row, col):
+        values = [nd(reflectance(b, 'B8', row, col), reflectance(b, 'B4', row, col))
+                  for b in used if reflectance(b, 'B8', row, col) is not None]
+        return statistics.fmean(values) if values else None
+
+    expected = spatial_stats(pixel_mean(row, col) for row, col in pixels())
+    result = local_engine.mean_ndvi(SITE, '2024-05-01', '2024-06-01', archive_dir=root)
+    assert result == pytest.approx(expected['mean'], rel=1e-5)
+
+def test_composite_matches_a_median_composite(archive):
+    # Per-band median of the clear scenes, then the index, then mean/min/max over the region
+    root, scenes = archive
+    used = clear_scenes(scenes, '2024-05-01', '2024-06-01', 20)
+    def pixel_ndmi(row, col):
+        clear = [b for b in used if reflectance(b, 'B8', row, col) is not None]
+        if not clear:
+            return None
+        b8 = statistics.median(reflectance(b, 'B8', row, col) for b in clear)
+        b11 = statistics.median(reflectance(b, 'B11', row, col) for b in clear)
+        return nd(b8, b11)
+
+    expected = spatial_stats(pixel_ndmi(row, col) for row, col in pixels())
+    result = local_engine.indicator_stats(SITE, '2024-05-01', '2024-06-01', 'NDMI', archive_dir=root)
+    assert result['pixels'] == expected['pixels']
+    for stat in ('mean', 'min', 'max'):
+        assert result[stat] == pytest.approx(expected[stat], rel=1e-5), stat
+
+def test_window_is_end_exclusive_and_cloud_filtered(archive):
+    root, scenes = archive
+    # Only 2024-05-08 is inside [05-04, 05-13) and below 20% cloud cover
+    only = scenes['2024-05-08']
+    expected = spatial_stats(
+        None if reflectance(only, 'B8', row, col) is None
+        else nd(reflectance(only, 'B8', row, col), reflectance(only, 'B4', row, col))
+        for row, col in pixels()
+    )
+    result = local_engine.indicator_stats(SITE, '2024-05-04', '2024-05-13', 'NDVI', archive_dir=root)
+    assert result['pixels'] == expected['pixels']
+    assert result['max'] == pytest.approx(expected['max'], rel=1e-5)
+
+    with pytest.raises(local_engine.LocalArchiveError):
+        # 2024-05-18 is the only scene and it is too cloudy
+        local_engine.indicator_stats(SITE, '2024-05-14', '2024-05-20', 'NDVI', archive_dir=root)
+
+def test_sub_window_and_georeference(archive):
+    root, scenes = archive
+    coords = {'west': WEST + 2 * PIXEL, 'east': WEST + 5 * PIXEL, 'north': NORTH - PIXEL, 'south': NORTH - 4 * PIXEL}
+    values, georef = local_engine.compute_indicator(coords, '2024-05-01', '2024-06-01', 'NDVI', archive_dir=root)
+    assert values.shape == (3, 3)
+    assert georef == {'west': pytest.approx(coords['west']), 'north': pytest.approx(coords['north']),
+                      'pixel_size': [PIXEL, PIXEL]}
+
+    full, _ = local_engine.compute_indicator(SITE, '2024-05-01', '2024-06-01', 'NDVI', archive_dir=root)
+    np.testing.assert_array_equal(values, full[1:4, 2:5])
+
+def test_chunks_give_the_same_stats(archive, monkeypatch):
+    root, _ = archive
+    whole = local_engine.indicator_stats(SITE, '2024-05-01', '2024-06-01', 'EVI', archive_dir=root)
+    monkeypatch.setattr(local_engine, 'LOCAL_CHUNK_ROWS', 2)
+    chunked = local_engine.indicator_stats(SITE, '2024-05-01', '2024-06-01', 'EVI', archive_dir=root)
+    assert chunked['pixels'] == whole['pixels']
+    assert chunked['mean'] == pytest.approx(whole['mean'], rel=1e-6)
+    assert (chunked['min'], chunked['max']) == (whole['min'], whole['max'])
+
+def test_uncovered_area_and_unknown_index(archive):
+    root, _ = archive
+    with pytest.raises(local_engine.LocalArchiveError):
+        local_engine.indicator_stats({**SITE, 'east': WEST + 1}, '2024-05-01', '2024-06-01', 'NDVI',
+                                     archive_dir=root)
+    with pytest.raises(local_engine.LocalArchiveError):
+        local_engine.indicator_stats(SITE, '2024-05-01', '2024-06-01', 'LST', archive_dir=root)
+
+def test_analyze_local_returns_stats(client, archive, monkeypatch):
+    root, _ = archive
+    monkeypatch.setattr(local_engine, 'LOCAL_ARCHIVE_DIR', root)
+    body = {**SITE, 'date_start': '2024-05-01', 'date_end': '2024-06-01', 'backend': 'local'}
+
+    response = client.post('/api/analyze', json={**body, 'indicators': ['NDVI', 'ndwi']})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['backend'] == 'local'
+    assert 'tile_url' not in data and 'layers' not in data
+    assert set(data['stats']) == {'NDVI', 'NDWI'}
+    assert set(data['stats']['NDVI']) == {'mean', 'min', 'max', 'pixels'}
+
+    response = client.post('/api/analyze', json={**body, 'date_start': '2023-01-01', 'date_end': '2023-02-01'})
+    assert response.status_code == 422
+    assert response.get_json()['success'] is False
@@ -0,0 +1,104 @@
+import re
+
+import pytest
+
+import gee_service
+import metrics
+
+COORDS = {'west': 6.0, 'south': 45.0, 'east': 6.05, 'north': 45.05}
+QUERY = {**COORDS, 'date_start': '2024-03-01', 'date_end': '2024-04-01'}
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    return response.get_data(as_text=True)
+
+def sample(text, name, **labels):
+    """Value of one sample line of the exposition text, or None"""
+    for line in text.splitlines():
+        match = re.fullmatch(r'(\w+)(?:\{(.*)\})? (\S+)', line)
+        if match and match[1] == name and dict(re.findall(r'(\w+)="([^"]*)"', match[2] or '')) == labels:
+            return float(match[3])
+    return None
+
+def indicator_labels():
+    return {key for key, _ in metrics.INDICATOR_SECONDS._values.items()}
+
+
+def test_histogram_and_counter_rendering():
+    histogram = metrics.Histogram('test_seconds', 'Test latency', ('stage',), buckets=(0.1, 1))
+    histogram.observe(0.05, stage='a')
+    histogram.observe(0.5, stage='a')
+    histogram.observe(5, stage='a')
+    counter = metrics.Counter('test_total', 'Test count', ('kind',))
+    counter.inc(kind='say "hi"\n')
+    text = '\n'.join(histogram.render() + counter.render())
+
+    assert '# TYPE test_seconds histogram' in text
+    assert sample(text, 'test_seconds_bucket', stage='a', le='0.1') == 1
+    assert sample(text, 'test_seconds_bucket', stage='a', le='1') == 2
+    assert sample(text, 'test_seconds_bucket', stage='a', le='+Inf') == 3
+    assert sample(text, 'test_seconds_sum', stage='a') == pytest.approx(5.55)
+    assert sample(text, 'test_seconds_count', stage='a') == 3
+    assert 'test_total{kind="say \\"hi\\"\\n"} 1' in text
+
+def test_metrics_endpoint_counts_requests_and_gee_calls(client):
+    client.post('/api/analyze', json={**QUERY, 'indicator': 'SAVI'})
+    before = scrape(client)
+    route = {'route': '/api/analyze', 'method': 'POST', 'status': '200'}
+    requests = sample(before, 'gaiaeye_http_request_seconds_count', **route)
+    map_ids = sample(before, 'gaiaeye_gee_calls_total', method='getMapId')
+
+    response = client.post('/api/analyze', json={**QUERY, 'west': 6.1, 'east': 6.15, 'indicator': 'SAVI'})
+    assert response.status_code == 200
+    after = scrape(client)
+    assert sample(after, 'gaiaeye_http_request_seconds_count', **route) == requests + 1
+    assert sample(after, 'gaiaeye_gee_calls_total', method='getMapId') == map_ids + 1
+    assert sample(after, 'gaiaeye_indicator_layer_seconds_count', indicator='SAVI') >= 2
+    assert '# TYPE gaiaeye_cache_hit_ratio gauge' in after
+    assert sample(after, 'gaiaeye_jobs_queued') is not None
+
+def test_indicator_labels_are_config_keys(client):
+    response = client.post('/api/analyze', json={**QUERY, 'west': 6.2, 'east': 6.25, 'indicator': 'ndwi'})
+    assert response.status_code == 200
+    assert ('NDWI',) in indicator_labels()
+    assert all(label in gee_service.INDICATORS_CONFIG for label, in indicator_labels())
+
+def test_unknown_indicators_are_rejected(client):
+    labels = indicator_labels()
+    for body in ({'indicator': 'NDVI2'}, {'indicators': ['NDVI', 'made-up']},
+                 {'indicator': 'bogus', 'compare_to': 'previous'}):
+        response = client.post('/api/analyze', json={**QUERY, **body})
+        assert response.status_code == 400
+        assert 'Unknown indicator' in response.get_json()['error']
+    assert client.get('/tiles/BOGUS/5/16/12', query_string=QUERY).status_code == 400
+    assert client.post('/api/export', json={**QUERY, 'indicator': 'bogus'}).status_code == 400
+    assert indicator_labels() == labels
+
+
+def test_server_timing_header(client):
+    response = client.post('/api/analyze', json={**QUERY, 'west': 6.3, 'east': 6.35, 'indicator': 'EVI'})
+    assert response.status_code == 200
+    entries = dict(entry.split(';dur=') for entry in response.headers['Server-Timing'].split(', '))
+    assert {'layer.EVI', 'getMapId.EVI', 'total'} <= set(entries)
+    assert float(entries['total']) >= float(entries['layer.EVI']) >= 0
+    assert 'timing' not in response.get_json()
+
+    # Every response has one, errors included
+    assert 'total;dur=' in client.get('/tiles/BOGUS/5/16/12', query_string=QUERY).headers['Server-Timing']
+
+@pytest.mark.parametrize('ask', ['query', 'body'])
+def test_timing_field_on_request(client, ask):
+    west = 6.4 if ask == 'query' else 6.5
+    body = {**QUERY, 'west': west, 'east': west + 0.05, 'indicator': 'LAI'}
+    if ask == 'query':
+        response = client.post('/api/analyze?timing=1', json=body)
+    else:
+        response = client.post('/api/analyze', json={**body, 'timing': True})
+    assert response.status_code == 200
+    timing = response.get_json()['timing']
+    assert timing['gee_round_trips'] == 1
+    assert {'layer.LAI', 'getMapId.LAI'} <= set(timing['stages'])
+    assert timing['total_ms'] >= timing['stages']['layer.LAI']
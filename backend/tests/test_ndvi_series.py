@@ -0,0 +1,81 @@
+import concurrent.futures
+
+import fake_ee
+import gee_service
+
+COORDS = {'west': 5.0, 'south': 44.0, 'east': 5.05, 'north': 44.05}
+
+
+def series(client, coords, date_start, date_end, period='scene'):
+    response = client.post('/api/ndvi_timeseries', json={**coords, 'date_start': date_start,
+                                                         'date_end': date_end, 'period': period})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def test_fake_scenes_carry_their_dates():
+    collection = fake_ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED').filterDate('2024-01-01', '2024-01-12')
+    features = collection.map(lambda img: fake_ee.Feature(None, {'date': img.date().format('YYYY-MM-dd')}))
+    assert [f['properties']['date'] for f in features.getInfo()['features']] == \
+        ['2024-01-01', '2024-01-06', '2024-01-11']
+
+def test_series_under_fake_ee(client):
+    data = series(client, COORDS, '2024-01-01', '2024-02-01')
+    dates = [point['date'] for point in data['series']]
+    assert dates == sorted(dates)
+    assert len(dates) == 7
+    assert all('2024-01-01' <= date < '2024-02-01' for date in dates)
+    assert all(0 < point['mean_ndvi'] < 1 and point['pixels'] > 0 for point in data['series'])
+    assert data['fetched_intervals'] == [{'start': '2024-01-01', 'end': '2024-02-01'}]
+
+def test_series_is_reduced_incrementally(client):
+    coords = {**COORDS, 'west': 5.1, 'east': 5.15}
+    first = series(client, coords, '2024-01-01', '2024-02-01')
+    again = series(client, coords, '2024-01-01', '2024-02-01')
+    assert again['fetched_intervals'] == []
+    assert again['series'] == first['series']
+
+    longer = series(client, coords, '2023-12-01', '2024-02-01', period='month')
+    assert longer['fetched_intervals'] == [{'start': '2023-12-01', 'end': '2024-01-01'}]
+    assert [point['date'] for point in longer['series']] == ['2023-12-01', '2024-01-01']
+    assert longer['series'][1]['scenes'] == 7
+
+def test_series_chunks():
+    assert gee_service.series_chunks('2024-01-01', '2024-01-01') == []
+    assert gee_service.series_chunks('2024-01-01', '2024-01-20', days=10) == \
+        [('2024-01-01', '2024-01-11'), ('2024-01-11', '2024-01-20')]
+    assert gee_service.series_chunks('2024-01-01', '2024-01-21', days=10) == \
+        [('2024-01-01', '2024-01-11'), ('2024-01-11', '2024-01-21')]
+
+def test_gap_before_coverage_is_reduced_in_bounded_chunks(client, monkeypatch):
+    monkeypatch.setattr(gee_service, 'NDVI_SERIES_CHUNK_DAYS', 92)
+    coords = {**COORDS, 'west': 5.2, 'east': 5.25}
+    series(client, coords, '2024-01-01', '2024-02-01')
+
+    fake_ee.reset_stats()
+    earlier = series(client, coords, '2022-01-01', '2022-02-01')
+    # The gap up to the stored range is 2 years: 8 chunks of at most 92 days, each its own getInfo
+    assert earlier['fetched_intervals'] == [{'start': '2022-01-01', 'end': '2024-01-01'}]
+    assert fake_ee.stats()['calls']['getInfo'] == 8
+    assert len(earlier['series']) == 7
+    assert gee_service.SERIES_STORE.coverage(gee_service.roi_cache_key(coords)) == ('2022-01-01', '2024-02-01')
+
+    fake_ee.reset_stats()
+    between = series(client, coords, '2023-01-01', '2023-02-01')
+    assert between['fetched_intervals'] == []
+    assert fake_ee.stats()['calls'] == {}
+
+def test_concurrent_refreshes_of_one_roi_fetch_once(flask_app):
+    coords = {**COORDS, 'west': 5.3, 'east': 5.35}
+    fake_ee.configure(latency_ms={'getInfo': (50, 0)})
+    fake_ee.reset_stats()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(
+                lambda _: series(flask_app.test_client(), coords, '2024-01-01', '2024-02-01'), range(4)
+            ))
+    finally:
+        fake_ee.configure(latency_ms={'getInfo': (0, 0)})
+
+    assert fake_ee.stats()['calls']['getInfo'] == 1
+    assert sorted(len(result['fetched_intervals']) for result in results) == [0, 0, 0, 1]
+    assert all(result['series'] == results[0]['series'] for result in results)
@@ -0,0 +1,59 @@
+import threading
+import time
+
+import gee_service
+import prefetch
+
+
+def layer_key(coords, date_start, date_end, indicator):
+    return gee_service.layer_cache_key(*gee_service.normalize_layer_request(coords, date_start, date_end, indicator))
+
+def test_previous_request_window():
+    # The frontend sends months as [1st, last day)
+    assert prefetch.previous_request_window('2024-03-01', '2024-03-31') == ('2024-02-01', '2024-02-29')
+    assert prefetch.previous_request_window('2024-03-01', '2024-04-01') == ('2024-02-01', '2024-03-01')
+    assert prefetch.previous_request_window('2024-03-05', '2024-03-15') == ('2024-02-24', '2024-03-05')
+
+def test_targets_start_with_the_previous_month():
+    coords = {'west': 10.0, 'south': 40.0, 'east': 10.1, 'north': 40.1}
+    targets = list(prefetch.prefetch_targets(coords, '2024-03-01', '2024-03-31', ['NDVI']))
+    assert targets[0] == layer_key(coords, '2024-02-01', '2024-02-29', 'NDVI')
+    assert layer_key(coords, '2024-03-01', '2024-03-31', 'LST') in targets
+    assert len(targets) == len(set(targets))
+
+def test_prefetched_layer_is_used(client):
+    coords = {'west': 11.0, 'south': 41.0, 'east': 11.1, 'north': 41.1}
+    before = prefetch.prefetch_stats()
+    queued = prefetch.prefetch_layers('10.0.0.1', coords, '2024-03-01', '2024-03-31', ['NDVI'])
+    assert queued > 0
+
+    deadline = time.monotonic() + 5
+    while prefetch.prefetch_stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert gee_service.LAYER_CACHE.contains(layer_key(coords, '2024-02-01', '2024-02-29', 'NDVI'))
+
+    response = client.post('/api/analyze', json={**coords, 'indicator': 'NDVI',
+                                                 'date_start': '2024-02-01', 'date_end': '2024-02-29'})
+    assert response.status_code == 200
+    assert prefetch.prefetch_stats()['used'] == before['used'] + 1
+
+def test_outstanding_prefetches_are_limited_per_client(monkeypatch):
+    coords = {'west': 12.0, 'south': 42.0, 'east': 12.1, 'north': 42.1}
+    release = threading.Event()
+    compute = gee_service.compute_indicator_map_id
+    def blocked(*args):
+        release.wait(5)
+        return compute(*args)
+    monkeypatch.setattr(gee_service, 'compute_indicator_map_id', blocked)
+
+    before = prefetch.prefetch_stats()
+    try:
+        queued = prefetch.prefetch_layers('10.0.0.2', coords, '2024-03-01', '2024-03-31', ['NDVI'])
+        assert queued == prefetch.PREFETCH_MAX_PER_CLIENT
+        assert prefetch.prefetch_stats()['skipped_limit'] > before['skipped_limit']
+    finally:
+        release.set()
+    deadline = time.monotonic() + 5
+    while prefetch.prefetch_stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert prefetch.prefetch_stats()['pending'] == 0
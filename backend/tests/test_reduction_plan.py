@@ -0,0 +1,62 @@
+import math
+
+import pytest
+
+import gee_service
+from gee_service import COARSE_PIXEL_BUDGET, REDUCTION_PIXEL_BUDGET, reduction_params, reduction_plan
+
+FIELD = {'west': -7.6, 'south': 33.5, 'east': -7.59, 'north': 33.51}        # about 1 km2
+REGION = {'west': -8.0, 'south': 33.0, 'east': -7.0, 'north': 34.0}         # about 10,000 km2
+
+
+def test_area_estimate():
+    # 0.01 x 0.01 degrees at 33.5 N: 1112 m north-south by 927 m east-west
+    assert gee_service.estimate_area_m2(FIELD) == pytest.approx(1112 * 927, rel=0.01)
+
+def test_small_roi_keeps_the_native_scale():
+    params = reduction_params(1e6, 10)
+    assert params == {'scale': 10, 'tileScale': 1, 'bestEffort': False, 'maxPixels': 1e9}
+
+def test_budget_boundary():
+    at_budget = reduction_params(REDUCTION_PIXEL_BUDGET * 10 ** 2, 10)
+    assert at_budget['scale'] == 10 and not at_budget['bestEffort']
+    assert at_budget['tileScale'] == 4
+
+    over = reduction_params(REDUCTION_PIXEL_BUDGET * 10 ** 2 * 1.01, 10)
+    assert over['scale'] == 11 and over['bestEffort']
+    assert REDUCTION_PIXEL_BUDGET * 10 ** 2 * 1.01 / over['scale'] ** 2 <= REDUCTION_PIXEL_BUDGET
+
+@pytest.mark.parametrize('pixels, tile_scale', [(999_999, 1), (1e6, 2), (4_999_999, 2), (5e6, 4)])
+def test_tile_scale_steps(pixels, tile_scale):
+    assert reduction_params(pixels * 100, 10)['tileScale'] == tile_scale
+
+def test_large_roi_is_coarsened_within_the_budget():
+    area = gee_service.estimate_area_m2(REGION)
+    plan = reduction_plan(REGION)
+    for stage, native in gee_service.NATIVE_SCALES.items():
+        params = plan[stage]
+        assert area / params['scale'] ** 2 <= REDUCTION_PIXEL_BUDGET
+        if area / native ** 2 > REDUCTION_PIXEL_BUDGET:
+            assert params['scale'] == math.ceil(math.sqrt(area / REDUCTION_PIXEL_BUDGET)) > native
+            assert params['bestEffort']
+        else:
+            assert params['scale'] == native and not params['bestEffort']
+    # 10 m stages are coarsened, the 1 km LST and 5 km rain stages already fit
+    assert plan['ndvi']['scale'] == plan['ndmi']['scale'] == 33
+    assert plan['lst']['scale'] == 1000 and plan['rain']['scale'] == 5000
+
+def test_field_plan_is_native():
+    plan = reduction_plan(FIELD)
+    assert {stage: params['scale'] for stage, params in plan.items()} == gee_service.NATIVE_SCALES
+    assert not any(params['bestEffort'] for params in plan.values())
+
+def test_coarse_pass_budget():
+    field = reduction_plan(FIELD, COARSE_PIXEL_BUDGET)
+    # About 1e6 m2 at 10 m is 1e4 pixels: the coarse pass keeps the field at native scale
+    assert field['ndvi']['scale'] == 10
+    region = reduction_plan(REGION, COARSE_PIXEL_BUDGET)
+    area = gee_service.estimate_area_m2(REGION)
+    assert region['ndvi']['scale'] == math.ceil(math.sqrt(area / COARSE_PIXEL_BUDGET))
+    assert region['ndvi']['scale'] > reduction_plan(REGION)['ndvi']['scale']
+    assert region['ndvi']['tileScale'] == 1
+    assert all(area / params['scale'] ** 2 <= COARSE_PIXEL_BUDGET for params in region.values())
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_entries_expire_after_their_ttl(clock):
+    results = ResultCache(ttl_seconds=60)
+    results.put('a', 1)
+    results.put('b', 2, ttl_seconds=5)
+    clock.now += 5
+    assert results.get('a') == 1
+    assert results.get('b') is None
+    clock.now += 55
+    assert results.get('a') is None
+    stats = results.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['entries']) == (1, 2, 2, 0)
+
+def test_expired_entry_is_recomputed(clock):
+    results = ResultCache(ttl_seconds=60)
+    calls = []
+    def compute():
+        calls.append(clock.now)
+        return len(calls)
+    assert results.get_or_compute('k', compute) == 1
+    assert results.get_or_compute('k', compute) == 1
+    clock.now += 60
+    assert results.get_or_compute('k', compute) == 2
+    assert results.get_or_compute('k', compute, ttl_seconds=1) == 2
+
+def test_least_recently_used_is_evicted(clock):
+    results = ResultCache(max_entries=2)
+    results.put('a', 1)
+    results.put('b', 2)
+    results.get('a')
+    results.put('c', 3)
+    assert results.get('b') is None
+    assert (results.get('a'), results.get('c')) == (1, 3)
+    assert results.stats()['evictions'] == 1
+
+def test_concurrent_misses_share_one_computation():
+    results = ResultCache()
+    release = threading.Event()
+    calls = []
+    def compute():
+        calls.append(threading.get_ident())
+        release.wait(5)
+        return 'value'
+
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(results.get_or_compute('k', compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: results.stats()['shared_in_flight'] == 7)
+    assert results.contains('k')
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert answers == ['value'] * 8
+    assert len(calls) == 1
+    assert results.stats()['misses'] == 1
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    results = ResultCache()
+    release = threading.Event()
+    attempts = []
+    def failing():
+        attempts.append(1)
+        release.wait(5)
+        raise RuntimeError("GEE said no")
+
+    errors = []
+    def call():
+        try:
+            results.get_or_compute('k', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: results.stats()['shared_in_flight'] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["GEE said no"] * 4
+    assert len(attempts) == 1
+    assert not results.contains('k')
+    assert results.get_or_compute('k', lambda: 'retried') == 'retried'
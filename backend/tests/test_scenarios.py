@@ -0,0 +1,83 @@
+import itertools
+
+import pytest
+
+import gee_service
+
+CROPS = list(gee_service.CROP_YIELDS)
+INPUT_COSTS = [0.0, 150.0, 480.0, 1000.0]
+PRICE_FACTORS = [0.75, 1.0, 1.3]
+COORDS = {'west': 2.0, 'south': 48.0, 'east': 2.05, 'north': 48.05}
+
+
+def financial_with_price(monkeypatch, ndvi, area_ha, crop, cost, factor):
+    """calculate_financial_metrics for one scenario, with the crop's price scaled by factor"""
+    params = gee_service.CROP_YIELDS[crop]
+    monkeypatch.setitem(gee_service.CROP_YIELDS, crop, {**params, 'price_per_ton': params['price_per_ton'] * factor})
+    try:
+        productivity = gee_service.score_productivity(ndvi, crop)
+        return gee_service.calculate_financial_metrics(productivity, area_ha, crop, cost)
+    finally:
+        monkeypatch.setitem(gee_service.CROP_YIELDS, crop, params)
+
+
+@pytest.mark.parametrize('ndvi, area_ha', [(0.25, 3.7), (0.55, 12.25), (0.81, 140.0)])
+def test_grid_matches_calculate_financial_metrics(monkeypatch, ndvi, area_ha):
+    yield_factor = gee_service.score_productivity(ndvi, 'wheat')['yield_factor']
+    grid = gee_service.calculate_scenario_grid(yield_factor, area_ha, CROPS, INPUT_COSTS, PRICE_FACTORS)
+
+    for (c, crop), (i, cost), (p, factor) in itertools.product(
+            enumerate(CROPS), enumerate(INPUT_COSTS), enumerate(PRICE_FACTORS)):
+        expected = financial_with_price(monkeypatch, ndvi, area_ha, crop, cost, factor)
+        # Both sides round to cents; allow for the last digit of a product taken in another order
+        assert grid['net_profit_usd'][c][i][p] == pytest.approx(expected['net_profit_usd'], abs=0.011)
+        assert grid['roi_percent'][c][i][p] == pytest.approx(expected['roi_percent'], abs=0.11)
+        assert grid['expected_revenue_usd'][c][p] == pytest.approx(expected['expected_revenue_usd'], abs=0.011)
+        assert grid['expected_yield_total_tons'][c] == pytest.approx(expected['expected_yield_total_tons'],
+                                                                     abs=0.011)
+        assert grid['total_input_costs_usd'][i] == pytest.approx(expected['total_input_costs_usd'], abs=0.011)
+        assert grid['prices_per_ton_usd'][c][p] == pytest.approx(expected['price_per_ton_usd'], abs=0.011)
+
+def test_break_even_cost_zeroes_the_profit(monkeypatch):
+    yield_factor = gee_service.score_productivity(0.62, 'wheat')['yield_factor']
+    grid = gee_service.calculate_scenario_grid(yield_factor, 20.0, CROPS, INPUT_COSTS, PRICE_FACTORS)
+    for crop, row in grid['break_even_input_costs_usd_ha'].items():
+        for factor, cost in zip(PRICE_FACTORS, row):
+            expected = financial_with_price(monkeypatch, 0.62, 20.0, crop, cost, factor)
+            assert expected['net_profit_usd'] == pytest.approx(0.0, abs=0.5)
+
+def test_shapes():
+    grid = gee_service.calculate_scenario_grid(0.85, 1.0, ['corn', 'rice'], INPUT_COSTS, PRICE_FACTORS)
+    assert len(grid['net_profit_usd']) == 2
+    assert len(grid['net_profit_usd'][0]) == len(INPUT_COSTS)
+    assert len(grid['net_profit_usd'][0][0]) == len(PRICE_FACTORS)
+    assert list(grid['break_even_input_costs_usd_ha']) == ['corn', 'rice']
+
+
+def test_scenarios_agree_with_the_dashboard(client):
+    body = {**COORDS, 'date_start': '2024-04-01', 'date_end': '2024-05-01'}
+    dashboard = client.post('/api/dashboard_stats', json={**body, 'crop_type': 'corn', 'input_costs': 400})
+    assert dashboard.status_code == 200
+    financial = dashboard.get_json()['stats']['financial']
+
+    response = client.post('/api/scenarios', json={
+        **body, 'crops': ['corn', 'wheat'], 'input_costs': {'min': 200, 'max': 600, 'steps': 3},
+        'price_factors': [1.0]
+    })
+    assert response.status_code == 200
+    data = response.get_json()
+    # The stages stored by the dashboard are reused
+    assert data['cache'] == 'hit'
+    scenarios = data['scenarios']
+    assert scenarios['input_costs'] == [200.0, 400.0, 600.0]
+    assert scenarios['net_profit_usd'][0][1][0] == pytest.approx(financial['net_profit_usd'], abs=0.011)
+    assert scenarios['roi_percent'][0][1][0] == pytest.approx(financial['roi_percent'], abs=0.11)
+
+def test_scenario_requests_are_validated(client, monkeypatch):
+    assert client.post('/api/scenarios', json={**COORDS, 'crops': ['barley']}).status_code == 400
+    assert client.post('/api/scenarios', json={**COORDS, 'input_costs': []}).status_code == 400
+    assert client.post('/api/scenarios', json={**COORDS, 'price_factors': {'min': 1}}).status_code == 400
+    monkeypatch.setattr(gee_service, 'SCENARIO_MAX_CELLS', 10)
+    response = client.post('/api/scenarios', json={**COORDS, 'input_costs': [100, 200, 300]})
+    assert response.status_code == 400
+    assert 'exceed' in response.get_json()['error']
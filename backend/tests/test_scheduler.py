@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+import gee_scheduler
+from gee_scheduler import GeeScheduler, GeeUnavailable, QueueTimeout
+
+
+class EEException(Exception):
+    """Named like ee.EEException, which is what is_retryable() looks for"""
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+def expired(seconds):
+    """A time_left() that allows the caller to wait only this long"""
+    deadline = time.monotonic() + seconds
+    return lambda: deadline - time.monotonic()
+
+
+def test_token_bucket_allows_a_burst_then_refills():
+    scheduler = GeeScheduler(max_concurrent=10, requests_per_second=0.01, burst=2)
+    for _ in range(2):
+        scheduler.acquire('batch')
+        scheduler.release()
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire('batch', expired(0.05))
+
+    # 1000 seconds later the bucket is full again, but never above the burst
+    scheduler._refilled_at -= 1000
+    for _ in range(2):
+        scheduler.acquire('batch', expired(0.05))
+        scheduler.release()
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire('batch', expired(0.05))
+    assert scheduler.stats()['admitted']['batch'] == 4
+
+def test_rate_spaces_out_calls_beyond_the_burst():
+    scheduler = GeeScheduler(max_concurrent=10, requests_per_second=50, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        scheduler.acquire('batch')
+        scheduler.release()
+    assert time.monotonic() - started >= 5 / 50 * 0.9
+
+def test_concurrency_limit():
+    scheduler = GeeScheduler(max_concurrent=1, requests_per_second=1000, burst=100)
+    scheduler.acquire('interactive')
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire('interactive', expired(0.05))
+    scheduler.release()
+    scheduler.acquire('interactive', expired(0.05))
+    assert scheduler.stats()['active'] == 1
+
+def test_waiting_calls_are_served_by_lane_then_arrival():
+    scheduler = GeeScheduler(max_concurrent=1, requests_per_second=1000, burst=100)
+    scheduler.acquire('interactive')
+    order = []
+
+    def call(name, lane):
+        scheduler.acquire(lane)
+        order.append(name)
+        scheduler.release()
+
+    threads = []
+    for name, lane in (('batch 1', 'batch'), ('dashboard', 'dashboard'),
+                       ('batch 2', 'batch'), ('interactive', 'interactive')):
+        queued = sum(scheduler.stats()['queued'].values())
+        thread = threading.Thread(target=call, args=(name, lane))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: sum(scheduler.stats()['queued'].values()) == queued + 1)
+
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['interactive', 'dashboard', 'batch 1', 'batch 2']
+
+
+def test_retryable_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(gee_scheduler, 'backoff_delay', lambda attempt: 0)
+    scheduler = GeeScheduler(max_concurrent=2, requests_per_second=1000, burst=100)
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise EEException("Too many concurrent aggregations.")
+        return 'ok'
+
+    assert scheduler.run(flaky, lane='batch') == 'ok'
+    assert len(attempts) == 3
+    stats = scheduler.stats()
+    assert (stats['retries'], stats['active'], stats['admitted']['batch']) == (2, 0, 3)
+
+def test_other_errors_are_not_retried():
+    scheduler = GeeScheduler(max_concurrent=2, requests_per_second=1000, burst=100)
+    attempts = []
+    def broken():
+        attempts.append(1)
+        raise EEException("Image.select: Band pattern 'B99' did not match any bands.")
+    with pytest.raises(EEException):
+        scheduler.run(broken, lane='batch')
+    assert len(attempts) == 1
+    assert scheduler.stats()['active'] == 0
+
+def test_gives_up_after_the_last_retry(monkeypatch):
+    monkeypatch.setattr(gee_scheduler, 'backoff_delay', lambda attempt: 0)
+    monkeypatch.setattr(gee_scheduler, 'GEE_MAX_RETRIES', 2)
+    scheduler = GeeScheduler(max_concurrent=2, requests_per_second=1000, burst=100)
+    attempts = []
+    def down():
+        attempts.append(1)
+        raise ConnectionError("connection reset by peer")
+    with pytest.raises(GeeUnavailable):
+        scheduler.run(down, lane='batch')
+    assert len(attempts) == 3
+    assert scheduler.stats()['gave_up'] == 1
+
+def test_calls_take_the_lane_of_their_scope():
+    scheduler = GeeScheduler(max_concurrent=2, requests_per_second=1000, burst=100)
+    with gee_scheduler.lane_scope('interactive'):
+        scheduler.run(lambda: None)
+        with gee_scheduler.lane_scope('batch'):
+            scheduler.run(lambda: None)
+        assert gee_scheduler.current_lane() == 'interactive'
+    scheduler.run(lambda: None, lane='dashboard')
+    assert scheduler.stats()['admitted'] == {'interactive': 1, 'dashboard': 1, 'batch': 1}
+    with pytest.raises(ValueError):
+        gee_scheduler.set_lane('urgent')
@@ -0,0 +1,205 @@
+import concurrent.futures
+import contextlib
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import app as app_module
+import gee_service
+import tile_store
+from tile_store import TileStore
+
+TTL = 3600
+QUERY = {'north': 33.6, 'south': 33.5, 'east': -7.55, 'west': -7.65,
+         'date_start': '2024-03-01', 'date_end': '2024-04-01'}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tile_store, 'time', clock)
+    return clock
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return TileStore(str(tmp_path / 'tiles.mbtiles'), ttl_seconds=TTL, prune_interval_seconds=60)
+
+@pytest.fixture
+def upstream(flask_app, store, monkeypatch):
+    """A fake TILE_UPSTREAM whose tiles change with every fetch, and a fresh tile store"""
+    calls = []
+    def fetch(coords, date_start, date_end, indicator, z, x, y):
+        calls.append((indicator, z, x, y))
+        return f'png {indicator} {z}/{x}/{y} #{len(calls)}'.encode()
+    monkeypatch.setitem(flask_app.config, 'TILE_UPSTREAM', fetch)
+    monkeypatch.setattr(app_module, 'tile_store', store)
+    return calls
+
+def rows(store):
+    with contextlib.closing(sqlite3.connect(store.path)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+
+def test_put_get_and_tms_rows(store):
+    etag = store.put('layer', 3, 2, 1, b'tile')
+    assert store.get('layer', 3, 2, 1) == (b'tile', etag)
+    assert store.get('layer', 3, 2, 6) is None
+    with contextlib.closing(sqlite3.connect(store.path)) as conn:
+        assert conn.execute("SELECT tile_row FROM tiles").fetchone()[0] == 6
+    assert store.stats()['hits'] == 1 and store.stats()['misses'] == 1
+
+def test_expired_tiles_miss_and_are_pruned_on_put(store, clock):
+    store.put('layer', 1, 0, 0, b'old')
+    clock.now += TTL + 1
+    assert store.get('layer', 1, 0, 0) is None
+    assert rows(store) == 1
+
+    store.put('layer', 1, 1, 0, b'new')
+    assert rows(store) == 1
+    assert store.stats()['pruned'] == 1
+    assert store.get('layer', 1, 1, 0)[0] == b'new'
+
+def test_prune_is_throttled(store, clock):
+    start = clock.now
+    store.put('layer', 1, 0, 0, b'a')
+    clock.now = start + TTL + 1
+    store.put('layer', 1, 1, 0, b'b')        # prunes 'a'
+    clock.now = start + 10
+    store.put('layer', 1, 1, 1, b'old')
+    clock.now = start + TTL + 30
+    store.put('layer', 2, 0, 0, b'c')        # 'old' has expired, but the last prune was 29 s ago
+    assert rows(store) == 3
+    clock.now += 60
+    store.put('layer', 2, 1, 0, b'd')        # prunes 'old'
+    assert rows(store) == 3
+    assert store.stats()['pruned'] == 2
+    assert store.get('layer', 1, 1, 1) is None
+
+def test_connections_are_closed(store, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+    def tracked(*args, **kwargs):
+        opened.append(connect(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(sqlite3, 'connect', tracked)
+
+    store.put('layer', 1, 0, 0, b'tile')
+    store.get('layer', 1, 0, 0)
+    store.prune()
+    assert len(opened) == 4       # put and its first prune, get, prune
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+def test_tile_miss_then_hit(client, upstream):
+    first = client.get('/tiles/NDVI/5/16/12', query_string=QUERY)
+    assert first.status_code == 200
+    assert first.mimetype == 'image/png'
+    assert first.data == b'png NDVI 5/16/12 #1'
+    assert first.headers['ETag'].startswith('"')
+    assert 'max-age=' in first.headers['Cache-Control']
+
+    second = client.get('/tiles/NDVI/5/16/12', query_string=QUERY)
+    assert second.status_code == 200
+    assert second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert upstream == [('NDVI', 5, 16, 12)]
+
+def test_tile_not_modified(client, upstream):
+    etag = client.get('/tiles/NDVI/5/16/12', query_string=QUERY).headers['ETag']
+    response = client.get('/tiles/NDVI/5/16/12', query_string=QUERY, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    other = client.get('/tiles/NDVI/5/16/12', query_string=QUERY, headers={'If-None-Match': '"stale"'})
+    assert other.status_code == 200
+    assert len(upstream) == 1
+
+def test_expired_tile_is_refetched(client, upstream, clock):
+    etag = client.get('/tiles/NDVI/5/16/12', query_string=QUERY).headers['ETag']
+    clock.now += TTL + 1
+
+    response = client.get('/tiles/NDVI/5/16/12', query_string=QUERY, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.data == b'png NDVI 5/16/12 #2'
+    assert response.headers['ETag'] != etag
+    assert len(upstream) == 2
+
+def test_layers_do_not_share_tiles(client, upstream):
+    client.get('/tiles/NDVI/5/16/12', query_string=QUERY)
+    client.get('/tiles/NDVI/5/16/12', query_string={**QUERY, 'date_start': '2024-01-01'})
+    client.get('/tiles/LST/5/16/12', query_string=QUERY)
+    assert len(upstream) == 3
+
+def test_upstream_errors_and_missing_coordinates(client, upstream, flask_app, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("upstream down")
+    monkeypatch.setitem(flask_app.config, 'TILE_UPSTREAM', broken)
+    response = client.get('/tiles/NDVI/5/16/12', query_string=QUERY)
+    assert response.status_code == 502
+    assert response.get_json()['success'] is False
+
+    response = client.get('/tiles/NDVI/5/16/12', query_string={'north': 33.6})
+    assert response.status_code == 400
+
+def test_store_ttl_follows_the_map_id_lifetime(flask_app):
+    ttl = app_module.tile_store.ttl_seconds
+    assert ttl == flask_app.config['TILE_STORE_TTL_SECONDS']
+    assert ttl == gee_service.MAP_ID_LIFETIME_SECONDS - gee_service.MAP_ID_SAFETY_MARGIN_SECONDS
+    assert ttl >= flask_app.config['TILE_MAX_AGE_SECONDS']
+
+def test_concurrent_requests_share_one_fetch(flask_app, upstream, monkeypatch):
+    release = threading.Event()
+    fetch = flask_app.config['TILE_UPSTREAM']
+    def slow(*args):
+        release.wait(5)
+        return fetch(*args)
+    monkeypatch.setitem(flask_app.config, 'TILE_UPSTREAM', slow)
+
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        responses = [pool.submit(flask_app.test_client().get, '/tiles/NDVI/5/16/12', query_string=QUERY)
+                     for _ in range(4)]
+        time.sleep(0.2)
+        release.set()
+        responses = [response.result() for response in responses]
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert {response.data for response in responses} == {b'png NDVI 5/16/12 #1'}
+    assert upstream == [('NDVI', 5, 16, 12)]
+    assert app_module._tile_fetches == {}
+
+def test_timed_out_fetch_is_bounded_and_still_stored(client, flask_app, upstream, monkeypatch):
+    release = threading.Event()
+    deadlines = []
+    fetch = flask_app.config['TILE_UPSTREAM']
+    def slow(*args):
+        deadlines.append(gee_service.remaining_time())
+        release.wait(5)
+        return fetch(*args)
+    monkeypatch.setitem(flask_app.config, 'TILE_UPSTREAM', slow)
+    monkeypatch.setitem(flask_app.config, 'TILE_FETCH_TIMEOUT_SECONDS', 0.2)
+
+    assert client.get('/tiles/NDVI/5/16/12', query_string=QUERY).status_code == 502
+    # The orphaned fetch runs under the same timeout as a deadline, so it cannot retry past it
+    assert 0 < deadlines[0] <= 0.2
+    release.set()
+    for _ in range(50):
+        if not app_module._tile_fetches:
+            break
+        time.sleep(0.01)
+
+    response = client.get('/tiles/NDVI/5/16/12', query_string=QUERY)
+    assert response.status_code == 200
+    assert response.data == b'png NDVI 5/16/12 #1'
+    assert upstream == [('NDVI', 5, 16, 12)]
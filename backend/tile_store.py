@@ -0,0 +1,106 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class TileStore:
+    """
+    Local MBTiles-style tile store (SQLite).
+    Same layout as MBTiles (zoom_level/tile_column/tile_row, TMS row order) with an
+    extra 'layer' column so one file holds every indicator/window we proxy.
+    Expired tiles are deleted by put(), at most once every prune_interval_seconds.
+    """
+    def __init__(self, path, ttl_seconds=24 * 3600, prune_interval_seconds=600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.prune_interval_seconds = prune_interval_seconds
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.pruned = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tiles ("
+                " layer TEXT NOT NULL, zoom_level INTEGER NOT NULL,"
+                " tile_column INTEGER NOT NULL, tile_row INTEGER NOT NULL,"
+                " tile_data BLOB NOT NULL, etag TEXT NOT NULL, fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (layer, zoom_level, tile_column, tile_row))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tiles_fetched_at ON tiles (fetched_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT OR IGNORE INTO metadata (name, value) VALUES ('format', 'png')")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and is closed on exit"""
+        with contextlib.closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            yield conn
+
+    @staticmethod
+    def tms_row(z, y):
+        """MBTiles stores rows bottom-up (TMS); map clients ask top-down (XYZ)"""
+        return (1 << z) - 1 - y
+
+    def get(self, layer, z, x, y):
+        """Return (tile_data, etag) or None when missing or expired"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT tile_data, etag, fetched_at FROM tiles"
+                " WHERE layer = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (layer, z, x, self.tms_row(z, y))
+            ).fetchone()
+
+        with self._lock:
+            if row is None or time.time() - row[2] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return bytes(row[0]), row[1]
+
+    def put(self, layer, z, x, y, tile_data):
+        """Store a tile and return its ETag"""
+        etag = hashlib.sha1(tile_data).hexdigest()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tiles"
+                " (layer, zoom_level, tile_column, tile_row, tile_data, etag, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (layer, z, x, self.tms_row(z, y), sqlite3.Binary(tile_data), etag, now)
+            )
+
+        with self._lock:
+            prune_due = now - self._last_prune >= self.prune_interval_seconds
+            if prune_due:
+                self._last_prune = now
+        if prune_due:
+            self.prune()
+        return etag
+
+    def prune(self):
+        """Delete the expired tiles and return how many there were"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM tiles WHERE fetched_at < ?", (cutoff,)).rowcount
+        with self._lock:
+            self.pruned += deleted
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'pruned': self.pruned,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
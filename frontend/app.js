@@ -5,6 +5,10 @@ const API_URL = 'http://127.0.0.1:5000/api/analyze';
 let currentIndicator = 'NDVI';
 let currentCoords = null; // Store coords to re-fetch when indicator changes
 
+// Tile URLs for every panel indicator of the current area/month, loaded in one request
+let layerUrls = {};
+let layerUrlsKey = null;
+
 // Initialize Map
 const map = L.map('map', {
     zoomControl: false // Move zoom control if needed, but default is top-left which is fine
@@ -251,11 +255,29 @@ async function fetchAnalysis() {
         return adjustedDate.toISOString().split('T')[0];
     };
 
+    // Switching indicators on the same area/month reuses the URLs already loaded
+    const requestKey = JSON.stringify([currentCoords, formatDate(firstDay), formatDate(lastDay)]);
+    if (requestKey === layerUrlsKey && layerUrls[currentIndicator]) {
+        updateLayer(layerUrls[currentIndicator]);
+        if (statusMsg) {
+            statusMsg.className = 'status-text success';
+            statusMsg.textContent = `${currentIndicator} Loaded.`;
+        }
+        return;
+    }
+
+    // Request the whole layer panel at once; the server shares collection work between them
+    const panelIndicators = Array.from(document.querySelectorAll('.indicator-btn')).map(b => b.dataset.ind);
+    const indicators = [currentIndicator, ...panelIndicators.filter(ind => ind !== currentIndicator)];
+
     const payload = {
         ...currentCoords,
         date_start: formatDate(firstDay),
         date_end: formatDate(lastDay),
-        indicator: currentIndicator
+        indicator: currentIndicator,
+        indicators: indicators,
+        // Let the server warm the previous month while this one is being looked at
+        prefetch: true
     };
 
     if (statusMsg) {
@@ -274,14 +296,19 @@ async function fetchAnalysis() {
 
         if (!response.ok) throw new Error(data.error || 'Server Error');
 
-        if (data.success && data.tile_url) {
-            updateLayer(data.tile_url);
+        // Prefer the backend tile proxy (cached, survives map ID expiry) over raw GEE URLs
+        layerUrls = { ...(data.tile_urls || {}), ...(data.proxy_tile_urls || {}) };
+        layerUrlsKey = requestKey;
+
+        if (data.success && layerUrls[currentIndicator]) {
+            updateLayer(layerUrls[currentIndicator]);
             if (statusMsg) {
                 statusMsg.className = 'status-text success';
                 statusMsg.textContent = `${currentIndicator} Loaded.`;
             }
         } else {
-            throw new Error('Invalid response from server');
+            const reason = (data.errors || {})[currentIndicator];
+            throw new Error(reason || 'Invalid response from server');
         }
 
     } catch (error) {